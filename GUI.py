@@ -1,618 +1,1116 @@
-import os
-from PyQt5.QtWidgets import (
-    QMainWindow,
-    QTreeWidget,
-    QMenu,
-    QInputDialog,
-    QTextEdit,
-    QMessageBox,
-    QTreeWidgetItem,
-    QSplitter,
-    QTableWidget,
-    QTableWidgetItem,
-    QVBoxLayout,
-    QDialog,
-)
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QIcon
-from simple_file_system import FileSystem, FileControlBlock
-from menu import create_menu_bar
-import copy
-from content_style import FileContentDialog
-
-SAVE_FILENAME = "filesystem.dat"
-
-
-class FileSystemGUI(QMainWindow):
-    def __init__(self):
-        super().__init__()
-
-        # 默认开辟1MB的空间
-        self.fs = FileSystem(1024 * 1024, 1024)
-
-        if os.path.exists(SAVE_FILENAME):
-            # 加载保存的文件系统
-            self.fs.load_from_disk(SAVE_FILENAME)
-        else:
-            self.fs.format()  # 格式化文件系统
-
-        self.initUI()
-
-    def initUI(self):
-        try:
-            self.setWindowTitle("Simple File System")
-            self.setWindowIcon(QIcon("images/simple_file_system.webp"))
-
-            create_menu_bar(main_window=self)
-
-            self.tree = QTreeWidget(self)
-            self.tree.setHeaderLabel("File System")
-            self.tree.setContextMenuPolicy(Qt.CustomContextMenu)
-            self.tree.customContextMenuRequested.connect(self.open_menu)
-
-            # 添加双击链接
-            # self.tree.itemDoubleClicked.connect(self.change_directory)
-            self.tree.itemDoubleClicked.connect(self.select_item)
-
-            self.tree.itemExpanded.connect(self.on_item_expanded)
-            self.tree.itemCollapsed.connect(self.on_item_collapsed)
-
-            # 创建根项目并填充树
-            self.root_item = QTreeWidgetItem(self.tree)
-            self.root_item.setText(0, "root")
-            self.root_item.setData(0, Qt.UserRole, self.fs.root)
-            self.root_item.setIcon(0, QIcon("images/directory.webp"))
-            self.tree.addTopLevelItem(self.root_item)
-            self.populate_tree(self.root_item, self.fs.root)
-
-            # 创建只读文本器
-            self.textEdit = QTextEdit(self)
-            self.textEdit.setReadOnly(True)
-            self.textEdit.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
-
-            splitter = QSplitter(Qt.Vertical)
-            splitter.addWidget(self.tree)
-            splitter.addWidget(self.textEdit)
-            splitter.setStretchFactor(0, 1)
-            splitter.setStretchFactor(1, 1)
-
-            self.setCentralWidget(splitter)
-            self.resize(1000, 800)
-        except Exception as e:
-            QMessageBox.critical(self, "Error", str(e))
-
-    def populate_tree(self, parent_item, parent_fcb):
-        # 填充子项目
-        for name, fcb in parent_fcb.children.items():
-            child_item = QTreeWidgetItem(parent_item)
-            child_item.setText(0, name)
-            child_item.setData(0, Qt.UserRole, fcb)
-            if fcb.is_directory:
-                child_item.setIcon(0, QIcon("images/directory.webp"))
-                self.populate_tree(child_item, fcb)
-            else:
-                child_item.setIcon(0, QIcon("images/file.webp"))
-
-    def get_full_path(self, fcb):
-        path = []
-        while fcb.name != "root":
-            path.insert(0, fcb.name)
-            parent_item = self.find_parent_item(fcb)
-            fcb = parent_item.data(0, Qt.UserRole)
-        return "/root/" + "/".join(path)
-
-    def open_menu(self, position):
-        item = self.tree.itemAt(position)
-        if item:
-            fcb = item.data(0, Qt.UserRole)
-            menu = QMenu()
-
-            if fcb.is_directory:
-                # 目录有选项：创建文件、创建目录、删除、属性
-                new_menu = menu.addMenu("New")
-                new_file_act = new_menu.addAction("File")
-                new_dir_act = new_menu.addAction("Directory")
-                properties_act = menu.addAction("Properties")
-                delete_act = menu.addAction("Delete")
-
-                action = menu.exec_(self.tree.viewport().mapToGlobal(position))
-
-                if action is None:
-                    return
-
-                if action == new_file_act:
-                    self.create_entry(item, entry_type="File")
-                elif action == new_dir_act:
-                    self.create_entry(item, entry_type="Directory")
-                elif action == delete_act:
-                    self.delete_entry(item)
-                elif action == properties_act:
-                    self.show_properties(item)
-            else:
-                # 文件有选项：读、写、复制、属性、删除
-                read_act = menu.addAction("Read")
-                write_act = menu.addAction("Write")
-                copy_act = menu.addAction("Copy")
-                properties_act = menu.addAction("Properties")
-                delete_act = menu.addAction("Delete")
-
-                action = menu.exec_(self.tree.viewport().mapToGlobal(position))
-
-                if action is None:
-                    return
-
-                if action == delete_act:
-                    self.delete_entry(item)
-                elif action == properties_act:
-                    self.show_properties(item)
-                elif action == read_act:
-                    self.read_file(item)
-                elif action == write_act:
-                    self.write_file(item)
-                elif action == copy_act:
-                    self.copy_entry(item)
-
-    def create_entry(self, parent_item, entry_type):
-        name, ok = QInputDialog.getText(
-            self, "Create Entry", f"Enter {entry_type.lower()} name:"
-        )
-        if ok and name:
-            parent_fcb = parent_item.data(0, Qt.UserRole)
-
-            if name in parent_fcb.children:
-                # 如果与文件同名的目录或与目录同名的文件已经存在，自动添加后缀以区分
-                existing_entry = parent_fcb.children[name]
-                if existing_entry.is_directory and entry_type == "File":
-                    name += "_file"
-                elif not existing_entry.is_directory and entry_type == "Directory":
-                    name += "_dir"
-
-            if name in parent_fcb.children:
-                # 如果与文件（或目录）同名的文件（或目录）已经存在，提示用户不能被创建
-                existing_entry = parent_fcb.children[name]
-                if existing_entry.is_directory and entry_type == "Directory":
-                    QMessageBox.warning(
-                        self,
-                        "Warning",
-                        f"A directory with the name {name} already exists in this directory!",
-                    )
-                    return
-                elif not existing_entry.is_directory and entry_type == "File":
-                    QMessageBox.warning(
-                        self,
-                        "Warning",
-                        f"A file with the name {name} already exists in this directory!",
-                    )
-                    return
-
-            if entry_type == "File":
-                # 选择文件分配的空间大小
-                size, ok = QInputDialog.getInt(
-                    self,
-                    "File Size",
-                    "Enter file size (in KB):",
-                    2,
-                    1,
-                    self.fs.size // 1024,
-                )
-                if ok:
-                    size_in_bytes = size * 1024
-                    self.fs.current_directory = parent_fcb
-                    self.fs.create_file(name, size_in_bytes)
-                    if name in self.fs.current_directory.children:
-                        self.display_message(
-                            f"File {name} created with size {size_in_bytes} bytes."
-                        )
-                        file_item = QTreeWidgetItem(parent_item)
-                        file_item.setText(0, name)
-                        file_item.setData(
-                            0, Qt.UserRole, self.fs.current_directory.children[name]
-                        )
-                        file_item.setIcon(0, QIcon("images/file.webp"))
-
-            elif entry_type == "Directory":
-                self.fs.current_directory = parent_fcb
-                self.fs.create_directory(name)
-                self.display_message(f"Directory {name} created.")
-                dir_item = QTreeWidgetItem(parent_item)
-                dir_item.setText(0, name)
-                dir_item.setData(
-                    0, Qt.UserRole, self.fs.current_directory.children[name]
-                )
-                dir_item.setIcon(0, QIcon("images/directory.webp"))
-
-            # 展开父项目以显示新创建的项目
-            parent_item.setExpanded(True)
-
-    def delete_entry(self, item):
-        fcb = item.data(0, Qt.UserRole)
-        if fcb == self.fs.root:
-            # 不可以删除根目录
-            QMessageBox.warning(
-                self, "Warning", "You cannot delete the root directory!"
-            )
-            return
-
-        parent_item = item.parent()
-        # 如果父项目不存在，则默认为根目录
-        parent_fcb = parent_item.data(0, Qt.UserRole) if parent_item else self.fs.root
-
-        if fcb.is_directory:
-            # 如果复制的项目在被删除的目录中，则清空复制的项目
-            if self.fs.copied_entry and self.fs.is_fcb_in_directory(
-                self.fs.copied_entry, fcb
-            ):
-                self.fs.copied_entry = None
-                self.display_message(
-                    "Copied content cleared because the directory is deleted."
-                )
-            self.fs.delete_directory(fcb.name)
-            self.display_message(f"Directory {fcb.name} and its contents deleted.")
-        else:
-            if self.fs.copied_entry and self.fs.copied_entry.name == fcb.name:
-                self.fs.copied_entry = None
-                self.display_message(
-                    "Copied content cleared because the file is deleted."
-                )
-            self.fs.delete_file(fcb.name)
-            self.display_message(f"File {fcb.name} deleted.")
-
-        if parent_item:
-            index = parent_item.indexOfChild(item)
-            parent_item.takeChild(index)
-        else:
-            self.tree.takeTopLevelItem(self.tree.indexOfTopLevelItem(item))
-
-        if self.fs.current_directory == fcb:
-            self.fs.current_directory = parent_fcb
-
-    def delete_directory_recursively(self, fcb):
-        for child_name in list(fcb.children.keys()):
-            child_fcb = fcb.children[child_name]
-            if child_fcb.is_directory:
-                self.delete_directory_recursively(child_fcb)
-            else:
-                self.fs.delete_file(child_name)
-
-        # 最后删除目录本身
-        parent_fcb = self.fs.current_directory.children.get(fcb.name, None)
-        if parent_fcb and parent_fcb.is_directory:
-            del self.fs.current_directory.children[fcb.name]
-            print(f"Directory {fcb.name} and its contents deleted.")
-
-    def write_file(self, item):
-        fcb = item.data(0, Qt.UserRole)
-        full_path = self.get_full_path(fcb)
-        # 保证目录被写入！
-        if not fcb.is_directory:
-            existing_data = self.fs.read_file(full_path)
-            text, ok = QInputDialog.getMultiLineText(
-                self, "Write File", "Enter file content:", existing_data or ""
-            )
-            if ok:
-                self.fs.write_file(full_path, text.encode("utf-8"))
-                self.display_message(f"Data written to file {full_path}.")
-
-    def read_file(self, item):
-        fcb = item.data(0, Qt.UserRole)
-        full_path = self.get_full_path(fcb)
-        # 保证不是目录被读取！
-        if not fcb.is_directory:
-            data = self.fs.read_file(full_path)
-            if data:
-                dialog = FileContentDialog(
-                    f"Content of {fcb.name}", f"File: {fcb.name}\n\n{data}", self
-                )
-                dialog.exec_()
-            else:
-                self.display_message(f"File {fcb.name} is empty.")
-
-    def find_parent_item(self, fcb):
-        def recursive_find(item, target_fcb):
-            for i in range(item.childCount()):
-                child = item.child(i)
-                if child.data(0, Qt.UserRole) == target_fcb:
-                    return item
-                result = recursive_find(child, target_fcb)
-                if result:
-                    return result
-            return None
-
-        return recursive_find(self.root_item, fcb)
-
-    def copy_entry(self, item):
-        if item is None:
-            item = self.tree.currentItem()
-        if item is None:
-            self.display_message("No file or directory selected to copy.")
-            return
-
-        fcb = item.data(0, Qt.UserRole)
-        if fcb is None:
-            self.display_message("Invalid item selected.")
-            return
-
-        if fcb is self.fs.root:
-            self.display_message("Cannot copy the root directory.")
-            return
-
-        self.fs.copy_entry(fcb.name)
-        self.display_message(f"Copied {fcb.name}.")
-
-    def paste_entry(self, item=None):
-        if not self.fs.copied_entry:
-            self.display_message("Nothing to paste. Please copy a file first.")
-            return
-
-        if self.fs.copied_entry.is_directory:
-            # 只支持文件复制
-            self.display_message("Cannot paste a directory. Only files can be pasted.")
-            return
-
-        target_fcb = self.fs.current_directory
-        if item:
-            target_fcb = item.data(0, Qt.UserRole)
-
-        if target_fcb is None or not target_fcb.is_directory:
-            self.display_message("Invalid target. Please select a directory for paste.")
-            return
-
-        copied_name = self.fs.copied_entry.name
-        new_name = copied_name
-        count = 1
-        # 确保新名称不与目标目录中的文件或目录同名
-        while new_name in target_fcb.children:
-            new_name = f"{copied_name} ({count})"
-            count += 1
-
-        new_entry = copy.deepcopy(self.fs.copied_entry)
-        new_entry.name = new_name
-        target_fcb.children[new_name] = new_entry
-
-        # 清空剪贴板，确保文件只能被粘贴一次，并防止恢复删除的内容
-        self.fs.copied_entry = None
-
-        self.display_message(f"Pasted {new_entry.name} into {target_fcb.name}.")
-        self.refresh_view()
-
-    def _update_fcb_references(self, fcb, parent):
-        # 更新 fcb 引用
-        for name, child in fcb.children.items():
-            if child.is_directory:
-                self._update_fcb_references(child, fcb)
-            parent.children[name] = child
-
-    def change_directory(self, item, column):
-        fcb = item.data(0, Qt.UserRole)
-        if fcb.is_directory:
-            self.fs.current_directory = fcb
-            self.display_message(f"Changed directory to {fcb.name}.")
-        else:
-            self.read_file(item)
-
-    def select_item(self, item, column):
-        # 捕获双击事件以选择项目
-        fcb = item.data(0, Qt.UserRole)
-        self.tree.setCurrentItem(item)
-        if not fcb.is_directory:
-            self.read_file(item)
-
-    def on_item_expanded(self, item):
-        # 捕获项目展开事件
-        fcb = item.data(0, Qt.UserRole)
-        if fcb.is_directory:
-            self.display_message(f"Directory {fcb.name} expanded.")
-
-    def on_item_collapsed(self, item):
-        # 捕获项目折叠事件
-        fcb = item.data(0, Qt.UserRole)
-        if fcb.is_directory:
-            self.display_message(f"Directory {fcb.name} collapsed.")
-
-    def closeEvent(self, event):
-        reply = QMessageBox.information(
-            self,
-            "Message",
-            "Do you want to quit?",
-            QMessageBox.Yes | QMessageBox.No,
-            QMessageBox.No,
-        )
-        if reply == QMessageBox.Yes:
-            self.fs.save_to_disk(SAVE_FILENAME)
-            info = QMessageBox.information(
-                self,
-                "Simple File System Saved",
-                f"File system has been updated to {SAVE_FILENAME}.",
-                QMessageBox.Ok,
-            )
-            if info:
-                event.accept()
-        else:
-            event.ignore()
-
-    def display_message(self, message):
-        self.textEdit.append(message)
-
-    def show_properties(self, item):
-        fcb = item.data(0, Qt.UserRole)
-
-        dialog = QDialog(self)
-        dialog.setWindowTitle(f"Properties of {fcb.name}")
-
-        table = QTableWidget(dialog)
-        table.setRowCount(3 if fcb.is_directory else 2)
-        table.setColumnCount(2)
-        table.setHorizontalHeaderLabels(["Property", "Value"])
-        table.verticalHeader().setVisible(False)
-        table.horizontalHeader().setStretchLastSection(True)
-        table.setEditTriggers(QTableWidget.NoEditTriggers)
-
-        table.setItem(0, 0, QTableWidgetItem("Name"))
-        table.setItem(0, 1, QTableWidgetItem(fcb.name))
-
-        if fcb.is_directory:
-            num_files = len(
-                [child for child in fcb.children.values() if not child.is_directory]
-            )
-            num_dirs = len(
-                [child for child in fcb.children.values() if child.is_directory]
-            )
-            table.setItem(1, 0, QTableWidgetItem("Type"))
-            table.setItem(1, 1, QTableWidgetItem("Directory"))
-            table.setItem(2, 0, QTableWidgetItem("Contents"))
-            table.setItem(
-                2,
-                1,
-                QTableWidgetItem(f"Subdirectories: {num_dirs}, Files: {num_files}"),
-            )
-        else:
-            table.setItem(1, 0, QTableWidgetItem("Type"))
-            table.setItem(1, 1, QTableWidgetItem("File"))
-            table.setItem(2, 0, QTableWidgetItem("Size"))
-            table.setItem(2, 1, QTableWidgetItem(f"{fcb.size} bytes"))
-
-        layout = QVBoxLayout(dialog)
-        layout.addWidget(table)
-        dialog.setLayout(layout)
-        dialog.resize(700, 400)
-        dialog.exec_()
-
-    def show_properties_from_menu(self):
-        item = self.tree.currentItem()
-        if item:
-            self.show_properties(item)
-        else:
-            QMessageBox.warning(self, "Warning", "No file or directory selected.")
-
-    def save_and_notify(self):
-        self.fs.save_to_disk(SAVE_FILENAME)
-        self.display_message(f"File system saved to {SAVE_FILENAME}.")
-
-    def create_file_in_current_directory(self):
-        self.create_entry_in_current_directory("File")
-
-    def create_directory_in_current_directory(self):
-        self.create_entry_in_current_directory("Directory")
-
-    def create_entry_in_current_directory(self, entry_type):
-        if (
-            not self.fs.current_directory
-            or self.fs.current_directory.name not in self.fs.root.children
-        ):  # 排除当前目录不存在的情况
-            self.display_message("Current directory is invalid. Resetting to root.")
-            self.fs.current_directory = self.fs.root
-            parent_item = self.root_item
-        else:
-            parent_item = self.find_item_by_fcb(self.fs.current_directory)
-
-        self.create_entry(parent_item, entry_type)
-
-    def validate_current_directory(self):
-        if (
-            not self.fs.current_directory
-            or self.fs.current_directory.name not in self.fs.root.children
-        ):
-            self.display_message("Current directory is invalid. Resetting to root.")
-            self.fs.current_directory = self.fs.root
-            return self.root_item
-        return self.find_item_by_fcb(self.fs.current_directory)
-
-    def find_item_by_fcb(self, fcb):
-        # 递归查找项目
-        def recursive_find(item, target_fcb):
-            if item.data(0, Qt.UserRole) == target_fcb:
-                return item
-            for i in range(item.childCount()):
-                child = item.child(i)
-                result = recursive_find(child, target_fcb)
-                if result:
-                    return result
-            return None
-
-        return recursive_find(self.root_item, fcb)
-
-    def rename_entry(self):
-        item = self.tree.currentItem()
-        if item:
-            name, ok = QInputDialog.getText(self, "Rename", "Enter new name:")
-            if ok and name:
-                fcb = item.data(0, Qt.UserRole)
-                fcb.name = name
-                item.setText(0, name)
-                self.display_message(f"Renamed to {name}.")
-
-    def refresh_view(self):
-        expanded_items = self.get_expanded_items(self.root_item)
-        self.tree.clear()
-
-        self.root_item = QTreeWidgetItem(self.tree)
-        self.root_item.setText(0, "root")
-        self.root_item.setData(0, Qt.UserRole, self.fs.root)
-        self.root_item.setIcon(0, QIcon("images/directory.webp"))
-        self.tree.addTopLevelItem(self.root_item)
-        self.populate_tree(self.root_item, self.fs.root)
-
-        self.expand_items(expanded_items)
-        self.display_message("View refreshed.")
-
-    def get_expanded_items(self, item):
-        expanded_items = []
-        if item.isExpanded():
-            expanded_items.append(item.data(0, Qt.UserRole).name)
-        for i in range(item.childCount()):
-            child_item = item.child(i)
-            # 递归获取展开的项目
-            expanded_items.extend(self.get_expanded_items(child_item))
-        return expanded_items
-
-    def expand_items(self, expanded_items):
-        for name in expanded_items:
-            item = self.find_item_by_name(self.root_item, name)
-            if item:
-                item.setExpanded(True)
-
-    def find_item_by_name(self, parent_item, name):
-        if parent_item.data(0, Qt.UserRole).name == name:
-            return parent_item
-        for i in range(parent_item.childCount()):
-            child_item = parent_item.child(i)
-            found_item = self.find_item_by_name(child_item, name)
-            if found_item:
-                return found_item
-        return None
-
-    def show_about(self):
-        about_message = (
-            "This is a Simple File System with GUI\n"
-            "Version 1.0\n\n"
-            "How to use this file system:\n"
-            "1. To create a new file or directory, right-click on a directory and select 'New'.\n"
-            "2. To delete a file or directory, right-click on it and select 'Delete'.\n"
-            "3. To read a file, right-click on it and select 'Read'. The content will be displayed in a scrollable dialog.\n"
-            "4. To write to a file, right-click on it and select 'Write'. You can enter the content in the dialog.\n"
-            "5. To copy a file, right-click on it and select 'Copy'. Then navigate to the target directory, right-click, and select 'Paste'.\n"
-            "6. To view properties of a file or directory, right-click on it and select 'Properties'.\n"
-            "7. Use the 'Refresh' option in the 'View' menu to refresh the file system view.\n"
-            "8. Use the 'Format' option in the 'Tools' menu to format the file system (this is an irreversible operation, and all data will be lost).\n"
-            "9. Use the 'Save' option in the 'File' menu to save the current state of the file system.\n"
-            "10. Use the 'Open' option in the 'File' menu to open and load a previously saved file system state.\n"
-        )
-        about_dialog = QMessageBox(self)
-        about_dialog.setWindowTitle("About")
-        about_dialog.setText(about_message)
-        about_dialog.setStandardButtons(QMessageBox.Ok)
-        about_dialog.exec_()
-
-    def format_disk(main_window):
-        reply = QMessageBox.question(
-            main_window,
-            "Confirm Format",
-            "Are you sure you want to format the file system? This will delete all data.",
-            QMessageBox.Yes | QMessageBox.No,
-            QMessageBox.No,
-        )
-
-        if reply == QMessageBox.Yes:
-            main_window.fs.format()  # 调用文件系统的格式化方法
-            main_window.refresh_view()  # 刷新视图
-            main_window.display_message("File system formatted.")
+import os
+from PyQt5.QtWidgets import (
+    QMainWindow,
+    QTreeWidget,
+    QMenu,
+    QInputDialog,
+    QPlainTextEdit,
+    QMessageBox,
+    QTreeWidgetItem,
+    QSplitter,
+    QTableWidget,
+    QTableWidgetItem,
+    QVBoxLayout,
+    QDialog,
+    QLineEdit,
+    QWidget,
+)
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QIcon
+from simple_file_system import FileSystem, FileControlBlock
+from events import INFO, WARNING, ERROR, Event, EventLog
+from compression import COMPRESSION_METHODS, NO_COMPRESSION
+from allocator import ALLOCATION_POLICIES
+from menu import create_menu_bar
+from tracing import TraceRecorder
+from content_style import (
+    BlockMapDialog,
+    FileContentDialog,
+    SearchResultsDialog,
+    SnapshotBrowserDialog,
+)
+
+SAVE_FILENAME = "filesystem.dat"
+DEFAULT_VOLUME_SIZE = 1024 * 1024  # 新建卷默认 1MB，可在格式化时修改
+DEFAULT_BLOCK_SIZE = 1024
+BLOCK_SIZE_CHOICES = ["512", "1024", "2048", "4096", "8192", "16384", "65536"]
+MAX_VOLUME_SIZE_MB = 64 * 1024
+MEMORY_HEADROOM = 0.8  # 卷最多使用可用内存的比例，其余留给块表和程序本身
+PAGE_SIZE = 200  # 目录每次加载到树中的项目数
+PAGER_ROLE = Qt.UserRole + 1  # 目录项目上保存其分页器，None 表示尚未加载
+LOAD_MORE_TEXT = "Load more..."
+RECLAIM_INTERVAL = 500  # 后台释放快照块的间隔（毫秒）
+WRITE_BACK_INTERVAL = 500  # 检查写回缓冲中到期内容的间隔（毫秒）
+LOG_CAPACITY = 1000  # 日志面板最多保留的消息条数
+LOG_FLUSH_INTERVAL = 200  # 把新消息批量显示到日志面板的间隔（毫秒）
+TRACE_FILENAME = "gui.trace"  # 录制界面操作轨迹的默认文件
+
+
+def max_volume_size_mb(current_mb=0):
+    # 卷保存在内存中：新卷（或扩展的部分）不超过当前可用的物理内存，无法获取时不限制
+    try:
+        pages = os.sysconf("SC_AVPHYS_PAGES")
+        available = pages * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return MAX_VOLUME_SIZE_MB
+    limit = current_mb + int(available * MEMORY_HEADROOM)
+    return max(1, min(MAX_VOLUME_SIZE_MB, limit))
+
+
+class FileSystemGUI(QMainWindow):
+    def __init__(self):
+        super().__init__()
+
+        # 默认开辟1MB的空间，加载已保存的镜像时使用镜像中的卷参数
+        self.fs = FileSystem(DEFAULT_VOLUME_SIZE, DEFAULT_BLOCK_SIZE)
+        # 界面自己报告操作结果，引擎的事件只记录警告和错误；带 title 的事件需要弹窗提示
+        self.event_log = EventLog(LOG_CAPACITY)
+        self.fs.events.subscribe(self.event_log.append, WARNING)
+        self.fs.events.subscribe(self.show_alert, INFO)
+
+        self.block_map = None  # 打开着的块图窗口
+        self.recorder = None  # 正在录制操作轨迹时的 TraceRecorder
+        self.load_failed = False
+        if os.path.exists(SAVE_FILENAME):
+            # 加载保存的文件系统，镜像损坏时保留原文件以便人工恢复
+            if not self.fs.load_from_disk(SAVE_FILENAME):
+                os.replace(SAVE_FILENAME, SAVE_FILENAME + ".corrupt")
+                self.fs.format()
+                self.load_failed = True
+        else:
+            self.fs.format()  # 格式化文件系统
+
+        self.initUI()
+        self.startup_check()
+
+    def initUI(self):
+        try:
+            self.setWindowTitle("Simple File System")
+            self.setWindowIcon(QIcon("images/simple_file_system.webp"))
+
+            create_menu_bar(main_window=self)
+
+            self.tree = QTreeWidget(self)
+            self.tree.setHeaderLabel("File System")
+            self.tree.setContextMenuPolicy(Qt.CustomContextMenu)
+            self.tree.customContextMenuRequested.connect(self.open_menu)
+
+            # 添加双击链接
+            # self.tree.itemDoubleClicked.connect(self.change_directory)
+            self.tree.itemDoubleClicked.connect(self.select_item)
+
+            self.tree.itemExpanded.connect(self.on_item_expanded)
+            self.tree.itemCollapsed.connect(self.on_item_collapsed)
+
+            # 创建根项目并填充树
+            self.root_item = QTreeWidgetItem(self.tree)
+            self.root_item.setText(0, "root")
+            self.root_item.setData(0, Qt.UserRole, self.fs.root)
+            self.root_item.setIcon(0, QIcon("images/directory.webp"))
+            self.tree.addTopLevelItem(self.root_item)
+            self.populate_tree(self.root_item, self.fs.root)
+
+            # 名字搜索框，支持 * ? [] 通配符
+            self.search_box = QLineEdit(self)
+            self.search_box.setPlaceholderText("Search by name (e.g. *.txt)")
+            self.search_box.returnPressed.connect(self.search_entries)
+
+            tree_panel = QWidget(self)
+            tree_layout = QVBoxLayout(tree_panel)
+            tree_layout.setContentsMargins(0, 0, 0, 0)
+            tree_layout.addWidget(self.search_box)
+            tree_layout.addWidget(self.tree)
+
+            # 创建只读日志面板，超过容量时最早的行被丢弃
+            self.textEdit = QPlainTextEdit(self)
+            self.textEdit.setReadOnly(True)
+            self.textEdit.setMaximumBlockCount(LOG_CAPACITY)
+            self.textEdit.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
+
+            splitter = QSplitter(Qt.Vertical)
+            splitter.addWidget(tree_panel)
+            splitter.addWidget(self.textEdit)
+            splitter.setStretchFactor(0, 1)
+            splitter.setStretchFactor(1, 1)
+
+            self.setCentralWidget(splitter)
+            self.resize(1000, 800)
+
+            # 删除快照后，在后台分批释放不再被引用的块
+            self.reclaim_timer = QTimer(self)
+            self.reclaim_timer.timeout.connect(self.fs.reclaim_step)
+            self.reclaim_timer.start(RECLAIM_INTERVAL)
+
+            # 编辑的内容先放在写回缓冲中，停止编辑一段时间后再写入数据块
+            self.write_back_timer = QTimer(self)
+            self.write_back_timer.timeout.connect(
+                lambda: self.fs.flush_writes(due_only=True)
+            )
+            self.write_back_timer.start(WRITE_BACK_INTERVAL)
+
+            # 消息先进入环形缓冲，定时一次性追加到日志面板，避免每条消息都重新排版
+            self.log_timer = QTimer(self)
+            self.log_timer.timeout.connect(self.flush_log)
+            self.log_timer.start(LOG_FLUSH_INTERVAL)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e))
+
+    def populate_tree(self, parent_item, parent_fcb):
+        # 只加载第一页子项目，子目录在展开时再加载，其余页通过 "Load more..." 加载
+        pager = self.fs.list_directory_fcb(parent_fcb, PAGE_SIZE)
+        parent_item.setData(0, PAGER_ROLE, pager)
+        self.load_more(parent_item)
+
+    def load_more(self, parent_item):
+        pager = parent_item.data(0, PAGER_ROLE)
+        count = parent_item.childCount()
+        if count and self.is_load_more_item(parent_item.child(count - 1)):
+            parent_item.takeChild(count - 1)
+        for name, fcb in pager.next_page():
+            self.add_tree_item(parent_item, name, fcb)
+        if pager.has_more:
+            more_item = QTreeWidgetItem(parent_item)
+            more_item.setText(0, LOAD_MORE_TEXT)
+            more_item.setData(0, Qt.UserRole, None)
+
+    def add_tree_item(self, parent_item, name, fcb):
+        child_item = QTreeWidgetItem()
+        child_item.setText(0, name)
+        child_item.setData(0, Qt.UserRole, fcb)
+        if fcb.is_directory:
+            child_item.setIcon(0, QIcon("images/directory.webp"))
+            child_item.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+        else:
+            child_item.setIcon(0, QIcon("images/file.webp"))
+        count = parent_item.childCount()
+        if count and self.is_load_more_item(parent_item.child(count - 1)):
+            parent_item.insertChild(count - 1, child_item)
+        else:
+            parent_item.addChild(child_item)
+        return child_item
+
+    def add_created_item(self, parent_item, name, fcb):
+        # 新建的项目若排在尚未加载的页中，则留给分页加载，避免重复显示
+        pager = parent_item.data(0, PAGER_ROLE)
+        if pager is None:
+            self.populate_tree(parent_item, parent_item.data(0, Qt.UserRole))
+            pager = parent_item.data(0, PAGER_ROLE)
+        if pager.has_more and name > pager.cursor:
+            return None
+        return self.add_tree_item(parent_item, name, fcb)
+
+    def is_load_more_item(self, item):
+        return item.data(0, Qt.UserRole) is None
+
+    def get_full_path(self, fcb):
+        return self.fs.get_path(fcb)
+
+    def open_menu(self, position):
+        item = self.tree.itemAt(position)
+        if item and not self.is_load_more_item(item):
+            fcb = item.data(0, Qt.UserRole)
+            menu = QMenu()
+
+            if fcb.is_directory:
+                # 目录有选项：创建文件、创建目录、删除、属性
+                new_menu = menu.addMenu("New")
+                new_file_act = new_menu.addAction("File")
+                new_dir_act = new_menu.addAction("Directory")
+                properties_act = menu.addAction("Properties")
+                delete_act = menu.addAction("Delete")
+
+                action = menu.exec_(self.tree.viewport().mapToGlobal(position))
+
+                if action is None:
+                    return
+
+                if action == new_file_act:
+                    self.create_entry(item, entry_type="File")
+                elif action == new_dir_act:
+                    self.create_entry(item, entry_type="Directory")
+                elif action == delete_act:
+                    self.delete_entry(item)
+                elif action == properties_act:
+                    self.show_properties(item)
+            else:
+                # 文件有选项：读、写、复制、属性、删除
+                read_act = menu.addAction("Read")
+                write_act = menu.addAction("Write")
+                copy_act = menu.addAction("Copy")
+                compression_act = menu.addAction("Compression")
+                properties_act = menu.addAction("Properties")
+                delete_act = menu.addAction("Delete")
+
+                action = menu.exec_(self.tree.viewport().mapToGlobal(position))
+
+                if action is None:
+                    return
+
+                if action == delete_act:
+                    self.delete_entry(item)
+                elif action == properties_act:
+                    self.show_properties(item)
+                elif action == read_act:
+                    self.read_file(item)
+                elif action == write_act:
+                    self.write_file(item)
+                elif action == copy_act:
+                    self.copy_entry(item)
+                elif action == compression_act:
+                    self.set_file_compression(item)
+
+    def create_entry(self, parent_item, entry_type):
+        name, ok = QInputDialog.getText(
+            self, "Create Entry", f"Enter {entry_type.lower()} name:"
+        )
+        if ok and name:
+            parent_fcb = parent_item.data(0, Qt.UserRole)
+
+            if name in parent_fcb.children:
+                # 如果与文件同名的目录或与目录同名的文件已经存在，自动添加后缀以区分
+                existing_entry = parent_fcb.children[name]
+                if existing_entry.is_directory and entry_type == "File":
+                    name += "_file"
+                elif not existing_entry.is_directory and entry_type == "Directory":
+                    name += "_dir"
+
+            if name in parent_fcb.children:
+                # 如果与文件（或目录）同名的文件（或目录）已经存在，提示用户不能被创建
+                existing_entry = parent_fcb.children[name]
+                if existing_entry.is_directory and entry_type == "Directory":
+                    QMessageBox.warning(
+                        self,
+                        "Warning",
+                        f"A directory with the name {name} already exists in this directory!",
+                    )
+                    return
+                elif not existing_entry.is_directory and entry_type == "File":
+                    QMessageBox.warning(
+                        self,
+                        "Warning",
+                        f"A file with the name {name} already exists in this directory!",
+                    )
+                    return
+
+            if entry_type == "File":
+                # 选择文件分配的空间大小
+                size, ok = QInputDialog.getInt(
+                    self,
+                    "File Size",
+                    "Enter file size (in KB):",
+                    2,
+                    1,
+                    self.fs.size // 1024,
+                )
+                if ok:
+                    size_in_bytes = size * 1024
+                    self.fs.current_directory = parent_fcb
+                    self.fs.create_file(name, size_in_bytes)
+                    if name in self.fs.current_directory.children:
+                        self.display_message(
+                            f"File {name} created with size {size_in_bytes} bytes."
+                        )
+                        self.add_created_item(
+                            parent_item, name, self.fs.current_directory.children[name]
+                        )
+
+            elif entry_type == "Directory":
+                self.fs.current_directory = parent_fcb
+                self.fs.create_directory(name)
+                self.display_message(f"Directory {name} created.")
+                self.add_created_item(
+                    parent_item, name, self.fs.current_directory.children[name]
+                )
+
+            # 展开父项目以显示新创建的项目
+            parent_item.setExpanded(True)
+
+    def delete_entry(self, item):
+        if item is None or self.is_load_more_item(item):
+            return
+        fcb = item.data(0, Qt.UserRole)
+        if fcb == self.fs.root:
+            # 不可以删除根目录
+            QMessageBox.warning(
+                self, "Warning", "You cannot delete the root directory!"
+            )
+            return
+
+        parent_item = item.parent()
+        # 如果父项目不存在，则默认为根目录
+        parent_fcb = parent_item.data(0, Qt.UserRole) if parent_item else self.fs.root
+
+        if fcb.is_directory:
+            # 如果复制的项目在被删除的目录中，则清空复制的项目
+            if self.fs.copied_entry and self.fs.is_fcb_in_directory(
+                self.fs.copied_entry, fcb
+            ):
+                self.fs.copied_entry = None
+                self.display_message(
+                    "Copied content cleared because the directory is deleted."
+                )
+            self.fs.delete(self.get_full_path(fcb))
+            self.display_message(f"Directory {fcb.name} and its contents deleted.")
+        else:
+            if self.fs.copied_entry and self.fs.copied_entry.inode == fcb.inode:
+                self.fs.copied_entry = None
+                self.display_message(
+                    "Copied content cleared because the file is deleted."
+                )
+            self.fs.delete(self.get_full_path(fcb))
+            self.display_message(f"File {fcb.name} deleted.")
+
+        if parent_item:
+            index = parent_item.indexOfChild(item)
+            parent_item.takeChild(index)
+        else:
+            self.tree.takeTopLevelItem(self.tree.indexOfTopLevelItem(item))
+
+        if self.fs.current_directory == fcb:
+            self.fs.current_directory = parent_fcb
+
+    def write_file(self, item):
+        fcb = item.data(0, Qt.UserRole)
+        full_path = self.get_full_path(fcb)
+        # 保证目录被写入！
+        if not fcb.is_directory:
+            existing_data = self.fs.read_file(full_path)
+            if existing_data and not existing_data.strip("\x00"):
+                existing_data = ""  # 按大小新建的文件内容全为空字节，编辑框中显示为空
+            text, ok = QInputDialog.getMultiLineText(
+                self, "Write File", "Enter file content:", existing_data or ""
+            )
+            if ok:
+                self.fs.buffer_write(full_path, text.encode("utf-8"))
+                self.display_message(f"Data written to file {full_path}.")
+
+    def read_file(self, item):
+        fcb = item.data(0, Qt.UserRole)
+        # 保证不是目录被读取！
+        if not fcb.is_directory:
+            self.fs.flush_file(fcb)  # 写回缓冲中的内容先写入，文件大小才是最新的
+            if fcb.size == 0:
+                self.display_message(f"File {fcb.name} is empty.")
+                return
+            # 查看器按页读取，不把整个文件读入内存
+            dialog = FileContentDialog(
+                f"Content of {fcb.name}",
+                fcb.size,
+                lambda offset, length: self.fs.read_fcb_range(fcb, offset, length),
+                self,
+            )
+            dialog.exec_()
+
+    def find_parent_item(self, fcb):
+        def recursive_find(item, target_fcb):
+            for i in range(item.childCount()):
+                child = item.child(i)
+                if child.data(0, Qt.UserRole) == target_fcb:
+                    return item
+                result = recursive_find(child, target_fcb)
+                if result:
+                    return result
+            return None
+
+        return recursive_find(self.root_item, fcb)
+
+    def copy_entry(self, item):
+        if item is None:
+            item = self.tree.currentItem()
+        if item is None:
+            self.display_message("No file or directory selected to copy.")
+            return
+
+        fcb = item.data(0, Qt.UserRole)
+        if fcb is None:
+            self.display_message("Invalid item selected.")
+            return
+
+        if fcb is self.fs.root:
+            self.display_message("Cannot copy the root directory.")
+            return
+
+        self.fs.copy_entry(self.get_full_path(fcb))
+        self.display_message(f"Copied {fcb.name}.")
+
+    def paste_entry(self, item=None):
+        if not self.fs.copied_entry:
+            self.display_message("Nothing to paste. Please copy a file first.")
+            return
+
+        if self.fs.copied_entry.is_directory:
+            # 只支持文件复制
+            self.display_message("Cannot paste a directory. Only files can be pasted.")
+            return
+
+        target_fcb = self.fs.current_directory
+        if item:
+            target_fcb = item.data(0, Qt.UserRole)
+
+        if target_fcb is None or not target_fcb.is_directory:
+            self.display_message("Invalid target. Please select a directory for paste.")
+            return
+
+        copied_name = self.fs.copied_entry.name
+        new_name = copied_name
+        count = 1
+        # 确保新名称不与目标目录中的文件或目录同名
+        while new_name in target_fcb.children:
+            new_name = f"{copied_name} ({count})"
+            count += 1
+
+        new_entry = self.fs.paste_as(target_fcb, new_name)
+        if new_entry is None:
+            QMessageBox.warning(self, "Paste Error", "Not enough space to paste.")
+            return
+
+        # 清空剪贴板，确保文件只能被粘贴一次，并防止恢复删除的内容
+        self.fs.copied_entry = None
+
+        self.display_message(f"Pasted {new_entry.name} into {target_fcb.name}.")
+        self.refresh_view()
+
+    def _update_fcb_references(self, fcb, parent):
+        # 更新 fcb 引用
+        for name, child in fcb.children.items():
+            if child.is_directory:
+                self._update_fcb_references(child, fcb)
+            parent.children[name] = child
+
+    def change_directory(self, item, column):
+        fcb = item.data(0, Qt.UserRole)
+        if fcb.is_directory:
+            self.fs.current_directory = fcb
+            self.display_message(f"Changed directory to {fcb.name}.")
+        else:
+            self.read_file(item)
+
+    def select_item(self, item, column):
+        # 捕获双击事件以选择项目
+        if self.is_load_more_item(item):
+            self.load_more(item.parent())
+            return
+        fcb = item.data(0, Qt.UserRole)
+        self.tree.setCurrentItem(item)
+        if not fcb.is_directory:
+            self.read_file(item)
+
+    def on_item_expanded(self, item):
+        # 捕获项目展开事件，首次展开时加载子目录内容
+        fcb = item.data(0, Qt.UserRole)
+        if fcb.is_directory:
+            if item.data(0, PAGER_ROLE) is None:
+                self.populate_tree(item, fcb)
+            self.display_message(f"Directory {fcb.name} expanded.")
+
+    def on_item_collapsed(self, item):
+        # 捕获项目折叠事件
+        fcb = item.data(0, Qt.UserRole)
+        if fcb.is_directory:
+            self.display_message(f"Directory {fcb.name} collapsed.")
+
+    def closeEvent(self, event):
+        reply = QMessageBox.information(
+            self,
+            "Message",
+            "Do you want to quit?",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No,
+        )
+        if reply == QMessageBox.Yes:
+            self.fs.save_to_disk(SAVE_FILENAME)
+            self.stop_trace()
+            info = QMessageBox.information(
+                self,
+                "Simple File System Saved",
+                f"File system has been updated to {SAVE_FILENAME}.",
+                QMessageBox.Ok,
+            )
+            if info:
+                event.accept()
+        else:
+            event.ignore()
+
+    def display_message(self, message):
+        self.event_log.append(
+            Event(INFO, "gui.message", "{message}", {"message": message})
+        )
+
+    def flush_log(self):
+        events = self.event_log.drain()
+        if events:
+            self.textEdit.appendPlainText("\n".join(str(event) for event in events))
+
+    def show_alert(self, event):
+        title = event.fields.get("title")
+        if title is None:
+            return
+        if event.level >= ERROR:
+            QMessageBox.warning(self, title, event.message)
+        else:
+            QMessageBox.information(self, title, event.message)
+
+    def show_properties(self, item):
+        if item is None or self.is_load_more_item(item):
+            return
+        fcb = item.data(0, Qt.UserRole)
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle(f"Properties of {fcb.name}")
+
+        table = QTableWidget(dialog)
+        table.setRowCount(6 if fcb.is_directory else 5)
+        table.setColumnCount(2)
+        table.setHorizontalHeaderLabels(["Property", "Value"])
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setStretchLastSection(True)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+
+        table.setItem(0, 0, QTableWidgetItem("Name"))
+        table.setItem(0, 1, QTableWidgetItem(fcb.name))
+
+        if fcb.is_directory:
+            num_files = len(
+                [child for child in fcb.children.values() if not child.is_directory]
+            )
+            num_dirs = len(
+                [child for child in fcb.children.values() if child.is_directory]
+            )
+            table.setItem(1, 0, QTableWidgetItem("Type"))
+            table.setItem(1, 1, QTableWidgetItem("Directory"))
+            table.setItem(2, 0, QTableWidgetItem("Contents"))
+            table.setItem(
+                2,
+                1,
+                QTableWidgetItem(f"Subdirectories: {num_dirs}, Files: {num_files}"),
+            )
+            # 整个子树的汇总由引擎增量维护，不需要遍历子目录
+            usage = self.fs.du(self.get_full_path(fcb))
+            table.setItem(3, 0, QTableWidgetItem("Total contents"))
+            table.setItem(
+                3,
+                1,
+                QTableWidgetItem(
+                    f"Subdirectories: {usage.directories}, Files: {usage.files}"
+                ),
+            )
+            table.setItem(4, 0, QTableWidgetItem("Total size"))
+            table.setItem(4, 1, QTableWidgetItem(f"{usage.bytes} bytes"))
+            table.setItem(5, 0, QTableWidgetItem("Total size on disk"))
+            table.setItem(
+                5, 1, QTableWidgetItem(f"{usage.blocks * self.fs.block_size} bytes")
+            )
+        else:
+            table.setItem(1, 0, QTableWidgetItem("Type"))
+            table.setItem(1, 1, QTableWidgetItem("File"))
+            physical_size = self.fs.physical_size(fcb)
+            table.setItem(2, 0, QTableWidgetItem("Size"))
+            table.setItem(2, 1, QTableWidgetItem(f"{fcb.size} bytes"))
+            table.setItem(3, 0, QTableWidgetItem("Size on disk"))
+            if fcb.inline_data is not None:
+                table.setItem(3, 1, QTableWidgetItem("0 bytes (stored inline)"))
+            else:
+                table.setItem(3, 1, QTableWidgetItem(f"{physical_size} bytes"))
+            table.setItem(4, 0, QTableWidgetItem("Compression"))
+            if fcb.codec and fcb.size:
+                ratio = physical_size / fcb.size * 100
+                compression_text = f"{fcb.codec} ({ratio:.1f}% of original)"
+            else:
+                compression_text = "None"
+            table.setItem(4, 1, QTableWidgetItem(compression_text))
+
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(table)
+        dialog.setLayout(layout)
+        dialog.resize(700, 400)
+        dialog.exec_()
+
+    def show_disk_usage(self):
+        report = self.fs.df()
+        self.display_message(report.summary())
+        QMessageBox.information(self, "Disk Usage", report.summary())
+
+    def show_block_map(self):
+        # 块图窗口不是模态的，已经打开时把它调到前面
+        if self.block_map is None:
+            self.block_map = BlockMapDialog(self.fs, self)
+            self.block_map.finished.connect(self.close_block_map)
+        self.block_map.show()
+        self.block_map.raise_()
+        self.block_map.activateWindow()
+
+    def toggle_trace(self, enabled):
+        # 录制界面操作的引擎调用，之后用 python tracing.py replay 回放并分析延迟
+        if not enabled:
+            self.stop_trace()
+            return
+        if self.recorder is not None:
+            return
+        filename, ok = QInputDialog.getText(
+            self, "Record Trace", "Trace file:", text=TRACE_FILENAME
+        )
+        filename = filename.strip()
+        if not ok or not filename:
+            self.trace_action.setChecked(False)
+            return
+        recorder = TraceRecorder(filename)
+        try:
+            recorder.attach(self.fs)
+        except OSError as e:
+            QMessageBox.warning(self, "Trace Error", f"Cannot record trace: {e}")
+            self.trace_action.setChecked(False)
+            return
+        self.recorder = recorder
+        self.display_message(f"Recording operations to {filename}.")
+
+    def stop_trace(self):
+        if self.recorder is None:
+            return
+        recorder, self.recorder = self.recorder, None
+        recorder.detach()
+        self.trace_action.setChecked(False)
+        self.display_message(
+            f"Recorded {recorder.count} operations to {recorder.filename}."
+        )
+
+    def close_block_map(self):
+        self.block_map.deleteLater()
+        self.block_map = None
+
+    def show_properties_from_menu(self):
+        item = self.tree.currentItem()
+        if item:
+            self.show_properties(item)
+        else:
+            QMessageBox.warning(self, "Warning", "No file or directory selected.")
+
+    def save_and_notify(self):
+        self.fs.save_to_disk(SAVE_FILENAME)
+        self.display_message(f"File system saved to {SAVE_FILENAME}.")
+
+    def create_file_in_current_directory(self):
+        self.create_entry_in_current_directory("File")
+
+    def create_directory_in_current_directory(self):
+        self.create_entry_in_current_directory("Directory")
+
+    def create_entry_in_current_directory(self, entry_type):
+        if (
+            not self.fs.current_directory
+            or self.fs.current_directory.name not in self.fs.root.children
+        ):  # 排除当前目录不存在的情况
+            self.display_message("Current directory is invalid. Resetting to root.")
+            self.fs.current_directory = self.fs.root
+            parent_item = self.root_item
+        else:
+            parent_item = self.find_item_by_fcb(self.fs.current_directory)
+
+        self.create_entry(parent_item, entry_type)
+
+    def validate_current_directory(self):
+        if (
+            not self.fs.current_directory
+            or self.fs.current_directory.name not in self.fs.root.children
+        ):
+            self.display_message("Current directory is invalid. Resetting to root.")
+            self.fs.current_directory = self.fs.root
+            return self.root_item
+        return self.find_item_by_fcb(self.fs.current_directory)
+
+    def find_item_by_fcb(self, fcb):
+        # 递归查找项目
+        def recursive_find(item, target_fcb):
+            if item.data(0, Qt.UserRole) == target_fcb:
+                return item
+            for i in range(item.childCount()):
+                child = item.child(i)
+                result = recursive_find(child, target_fcb)
+                if result:
+                    return result
+            return None
+
+        return recursive_find(self.root_item, fcb)
+
+    def rename_entry(self):
+        item = self.tree.currentItem()
+        if item and not self.is_load_more_item(item):
+            name, ok = QInputDialog.getText(self, "Rename", "Enter new name:")
+            if ok and name:
+                fcb = item.data(0, Qt.UserRole)
+                if self.fs.rename_fcb(fcb, name):
+                    item.setText(0, name)
+                    self.display_message(f"Renamed to {name}.")
+                else:
+                    self.display_message(f"Cannot rename {fcb.name} to {name}.")
+
+    def search_entries(self):
+        pattern = self.search_box.text().strip()
+        if not pattern:
+            return
+        matches = self.fs.find_entries(pattern)
+        self.display_message(f"Found {len(matches)} entries matching {pattern}.")
+        if matches:
+            dialog = SearchResultsDialog(
+                f"Search results for {pattern}",
+                sorted((self.fs.get_path(fcb), fcb) for fcb in matches),
+                self.reveal_fcb,
+                self,
+            )
+            dialog.exec_()
+
+    def search_content(self):
+        query, ok = QInputDialog.getText(
+            self, "Search Content", "Enter a word or phrase to search for:"
+        )
+        if not ok or not query.strip():
+            return
+        matches = self.fs.search_content(query)
+        self.display_message(f"Found {len(matches)} files containing {query}.")
+        if matches:
+            results = []
+            for path, offsets in matches:
+                offsets_text = ", ".join(str(offset) for offset in offsets[:10])
+                if len(offsets) > 10:
+                    offsets_text += ", ..."
+                results.append(
+                    (
+                        f"{path}  (offsets: {offsets_text})",
+                        self.fs.find_fcb_by_path(path),
+                    )
+                )
+            dialog = SearchResultsDialog(
+                f"Files containing {query}", results, self.reveal_fcb, self
+            )
+            dialog.exec_()
+
+    def reveal_fcb(self, fcb):
+        # 逐级加载祖先目录，在树中选中并显示该项目
+        chain = []
+        while fcb.parent is not None:
+            chain.append(fcb)
+            fcb = fcb.parent
+        item = self.root_item
+        for entry in reversed(chain):
+            if item.data(0, PAGER_ROLE) is None:
+                self.populate_tree(item, item.data(0, Qt.UserRole))
+            item.setExpanded(True)
+            item = self.find_child_item(item, entry)
+            if item is None:
+                return
+        self.tree.setCurrentItem(item)
+        self.tree.scrollToItem(item)
+
+    def find_child_item(self, parent_item, fcb):
+        pager = parent_item.data(0, PAGER_ROLE)
+        index = 0
+        while True:
+            while index < parent_item.childCount():
+                child = parent_item.child(index)
+                if child.data(0, Qt.UserRole) is fcb:
+                    return child
+                index += 1
+            if not pager.has_more:
+                return None
+            index = max(0, index - 1)  # "Load more..." 项目会被替换
+            self.load_more(parent_item)
+
+    def move_entry(self):
+        item = self.tree.currentItem()
+        if item is None or self.is_load_more_item(item):
+            return
+        fcb = item.data(0, Qt.UserRole)
+        if fcb is self.fs.root:
+            QMessageBox.warning(self, "Warning", "You cannot move the root directory!")
+            return
+        target, ok = QInputDialog.getText(
+            self,
+            "Move",
+            f"Move {fcb.name} to directory:",
+            text=self.get_full_path(fcb.parent),
+        )
+        if ok and target:
+            if self.fs.move(self.get_full_path(fcb), target):
+                self.display_message(f"Moved {fcb.name} to {target}.")
+                self.refresh_view()
+                self.reveal_fcb(fcb)
+            else:
+                QMessageBox.warning(
+                    self, "Move Error", f"Cannot move {fcb.name} to {target}."
+                )
+
+    def refresh_view(self):
+        expanded_items = self.get_expanded_items(self.root_item)
+        self.tree.clear()
+
+        self.root_item = QTreeWidgetItem(self.tree)
+        self.root_item.setText(0, "root")
+        self.root_item.setData(0, Qt.UserRole, self.fs.root)
+        self.root_item.setIcon(0, QIcon("images/directory.webp"))
+        self.tree.addTopLevelItem(self.root_item)
+        self.populate_tree(self.root_item, self.fs.root)
+
+        self.expand_items(expanded_items)
+        self.display_message("View refreshed.")
+
+    def get_expanded_items(self, item):
+        expanded_items = []
+        if item.isExpanded():
+            expanded_items.append(item.data(0, Qt.UserRole).name)
+        for i in range(item.childCount()):
+            child_item = item.child(i)
+            # 递归获取展开的项目
+            expanded_items.extend(self.get_expanded_items(child_item))
+        return expanded_items
+
+    def expand_items(self, expanded_items):
+        for name in expanded_items:
+            item = self.find_item_by_name(self.root_item, name)
+            if item:
+                item.setExpanded(True)
+
+    def find_item_by_name(self, parent_item, name):
+        if self.is_load_more_item(parent_item):
+            return None
+        if parent_item.data(0, Qt.UserRole).name == name:
+            return parent_item
+        for i in range(parent_item.childCount()):
+            child_item = parent_item.child(i)
+            found_item = self.find_item_by_name(child_item, name)
+            if found_item:
+                return found_item
+        return None
+
+    def show_about(self):
+        about_message = (
+            "This is a Simple File System with GUI\n"
+            "Version 1.0\n\n"
+            "How to use this file system:\n"
+            "1. To create a new file or directory, right-click on a directory and select 'New'.\n"
+            "2. To delete a file or directory, right-click on it and select 'Delete'.\n"
+            "3. To read a file, right-click on it and select 'Read'. The content will be displayed in a scrollable dialog.\n"
+            "4. To write to a file, right-click on it and select 'Write'. You can enter the content in the dialog.\n"
+            "5. To copy a file, right-click on it and select 'Copy'. Then navigate to the target directory, right-click, and select 'Paste'.\n"
+            "6. To view properties of a file or directory, right-click on it and select 'Properties'.\n"
+            "7. Use the 'Refresh' option in the 'View' menu to refresh the file system view.\n"
+            "8. Use the 'Format' option in the 'Tools' menu to format the file system (this is an irreversible operation, and all data will be lost).\n"
+            "9. Use the 'Save' option in the 'File' menu to save the current state of the file system.\n"
+            "10. Use the 'Open' option in the 'File' menu to open and load a previously saved file system state.\n"
+        )
+        about_dialog = QMessageBox(self)
+        about_dialog.setWindowTitle("About")
+        about_dialog.setText(about_message)
+        about_dialog.setStandardButtons(QMessageBox.Ok)
+        about_dialog.exec_()
+
+    def set_file_compression(self, item):
+        fcb = item.data(0, Qt.UserRole)
+        if fcb.is_directory:
+            return
+        options = ["Volume default", NO_COMPRESSION] + list(COMPRESSION_METHODS)
+        current = fcb.compression if fcb.compression is not None else options[0]
+        method, ok = QInputDialog.getItem(
+            self,
+            "Compression",
+            f"Compression for {fcb.name}:",
+            options,
+            options.index(current),
+            False,
+        )
+        if ok:
+            method = None if method == options[0] else method
+            self.fs.set_file_compression(self.get_full_path(fcb), method)
+            self.display_message(f"Compression of {fcb.name} set to {method}.")
+
+    def set_volume_compression(self):
+        options = [NO_COMPRESSION] + list(COMPRESSION_METHODS)
+        current = self.fs.compression or NO_COMPRESSION
+        method, ok = QInputDialog.getItem(
+            self,
+            "Volume Compression",
+            "Default compression for newly written files:",
+            options,
+            options.index(current),
+            False,
+        )
+        if ok and self.fs.set_volume_compression(method):
+            self.display_message(f"Volume compression set to {method}.")
+
+    def set_allocation_policy(self):
+        policy, ok = QInputDialog.getItem(
+            self,
+            "Allocation Policy",
+            "Block allocation policy for newly written files:",
+            ALLOCATION_POLICIES,
+            ALLOCATION_POLICIES.index(self.fs.allocator.name),
+            False,
+        )
+        if ok and self.fs.set_allocation_policy(policy):
+            self.display_message(f"Allocation policy set to {policy}.")
+
+    def show_fragmentation(self):
+        report = self.fs.fragmentation()
+        self.display_message(report.summary())
+        QMessageBox.information(self, "Fragmentation", report.summary())
+
+    def format_disk(main_window):
+        reply = QMessageBox.question(
+            main_window,
+            "Confirm Format",
+            "Are you sure you want to format the file system? This will delete all data.",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No,
+        )
+
+        if reply == QMessageBox.Yes:
+            # 格式化时选择卷大小和块大小
+            size_mb, ok = QInputDialog.getInt(
+                main_window,
+                "Volume Size",
+                "Enter volume size (in MB):",
+                max(1, main_window.fs.size // (1024 * 1024)),
+                1,
+                max_volume_size_mb(),
+            )
+            if not ok:
+                return
+            current_block_size = str(main_window.fs.block_size)
+            block_size, ok = QInputDialog.getItem(
+                main_window,
+                "Block Size",
+                "Select block size (in bytes):",
+                BLOCK_SIZE_CHOICES,
+                (
+                    BLOCK_SIZE_CHOICES.index(current_block_size)
+                    if current_block_size in BLOCK_SIZE_CHOICES
+                    else 1
+                ),
+                False,
+            )
+            if not ok:
+                return
+            # 调用文件系统的格式化方法，内存不足时引擎报告错误，原来的卷保持不变
+            if not main_window.fs.format(size_mb * 1024 * 1024, int(block_size)):
+                return
+            main_window.refresh_view()  # 刷新视图
+            main_window.display_message(
+                f"File system formatted: {size_mb} MB, {block_size}-byte blocks."
+            )
+
+    def set_inline_threshold(self):
+        threshold, ok = QInputDialog.getInt(
+            self,
+            "Inline Threshold",
+            "Files up to this size (in bytes) are stored inside their FCB:",
+            self.fs.inline_threshold,
+            0,
+            1024 * 1024,
+        )
+        if ok:
+            self.fs.set_inline_threshold(threshold)
+            self.display_message(f"Inline threshold set to {threshold} bytes.")
+
+    def choose_snapshot(self, title):
+        names = self.fs.list_snapshots()
+        if not names:
+            self.display_message("There are no snapshots.")
+            return None
+        name, ok = QInputDialog.getItem(
+            self, title, "Select snapshot:", names, len(names) - 1, False
+        )
+        return name if ok else None
+
+    def take_snapshot(self):
+        name, ok = QInputDialog.getText(self, "Take Snapshot", "Snapshot name:")
+        if ok and name:
+            if self.fs.create_snapshot(name):
+                self.display_message(f"Snapshot {name} created.")
+            else:
+                QMessageBox.warning(
+                    self, "Snapshot Error", f"Snapshot {name} already exists."
+                )
+
+    def browse_snapshot(self):
+        name = self.choose_snapshot("Browse Snapshot")
+        if name:
+            dialog = SnapshotBrowserDialog(self.fs.snapshot_view(name), self)
+            dialog.exec_()
+
+    def rollback_snapshot(self):
+        name = self.choose_snapshot("Rollback to Snapshot")
+        if not name:
+            return
+        reply = QMessageBox.question(
+            self,
+            "Confirm Rollback",
+            f"Roll back to snapshot {name}? Changes made after it and newer "
+            "snapshots will be lost.",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No,
+        )
+        if reply == QMessageBox.Yes:
+            self.fs.rollback_snapshot(name)
+            self.refresh_view()
+            self.display_message(f"Rolled back to snapshot {name}.")
+
+    def delete_snapshot(self):
+        name = self.choose_snapshot("Delete Snapshot")
+        if name and self.fs.delete_snapshot(name):
+            self.display_message(f"Snapshot {name} deleted.")
+
+    def startup_check(self):
+        if self.load_failed:
+            QMessageBox.warning(
+                self,
+                "Load Error",
+                f"{SAVE_FILENAME} could not be read and was kept as "
+                f"{SAVE_FILENAME}.corrupt. A new volume has been created.",
+            )
+            return
+        # 旧格式镜像启动时检查一次，有问题时询问是否修复；
+        # 新格式镜像是完整写出后替换的，不在启动时读入整个目录树
+        if not self.fs.needs_check:
+            return
+        report = self.fs.fsck()
+        self.display_message(report.summary())
+        if not report.clean:
+            self.offer_repair(report)
+
+    def check_file_system(self):
+        report = self.fs.fsck(verify_data=True)
+        self.display_message(report.summary())
+        if report.clean:
+            QMessageBox.information(self, "Check File System", "No problems found.")
+        else:
+            self.offer_repair(report)
+
+    def offer_repair(self, report):
+        reply = QMessageBox.question(
+            self,
+            "Check File System",
+            f"{len(report.errors)} problems found. Repair the file system?",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No,
+        )
+        if reply == QMessageBox.Yes:
+            report = self.fs.fsck(repair=True)
+            self.display_message(report.summary())
+            self.refresh_view()
+
+    def resize_volume(self):
+        size_mb, ok = QInputDialog.getInt(
+            self,
+            "Resize Volume",
+            "Enter new volume size (in MB):",
+            max(1, self.fs.size // (1024 * 1024)),
+            1,
+            max_volume_size_mb(self.fs.size // (1024 * 1024)),
+        )
+        if ok:
+            if self.fs.resize(size_mb * 1024 * 1024):
+                self.display_message(f"Volume resized to {size_mb} MB.")
+            elif size_mb * 1024 * 1024 < self.fs.size:  # 内存不足时引擎已弹出提示
+                QMessageBox.warning(
+                    self,
+                    "Resize Error",
+                    "Cannot shrink the volume below blocks that are in use.",
+                )
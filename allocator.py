@@ -0,0 +1,127 @@
+ALLOCATION_POLICIES = ("first-fit", "next-fit", "best-fit", "locality")
+DEFAULT_POLICY = "first-fit"
+GROUP_COUNT = 16  # 就近分配时把卷划分成的分配组数
+MIN_GROUP_BLOCKS = 64  # 小卷上每个分配组至少包含的块数
+
+
+def free_extents(bitmap, start=0, end=None):
+    # 依次产生 [start, end) 中的空闲区间 (起始块号, 长度)，查找在 C 层完成
+    end = len(bitmap) if end is None else end
+    block = bitmap.find(0, start, end)
+    while block != -1:
+        stop = bitmap.find(1, block, end)
+        if stop == -1:
+            stop = end
+        yield block, stop - block
+        block = bitmap.find(0, stop, end)
+
+
+def collect(bitmap, count, start=0, end=None, blocks=None):
+    # 从 start 开始按顺序收集空闲块，直到够 count 个或到达 end
+    blocks = [] if blocks is None else blocks
+    for first, length in free_extents(bitmap, start, end):
+        take = min(length, count - len(blocks))
+        blocks.extend(range(first, first + take))
+        if len(blocks) == count:
+            break
+    return blocks
+
+
+class FirstFit:
+    # 总是从块 0 开始找空闲块
+    name = "first-fit"
+
+    def allocate(self, bitmap, count, directory=None):
+        return collect(bitmap, count)
+
+
+class NextFit:
+    # 从上次分配结束的位置继续找，到卷尾后回到开头，避免卷首的块被反复分配和释放
+    name = "next-fit"
+
+    def __init__(self):
+        self.cursor = 0
+
+    def allocate(self, bitmap, count, directory=None):
+        cursor = self.cursor if self.cursor < len(bitmap) else 0
+        blocks = collect(bitmap, count, cursor)
+        if len(blocks) < count:
+            collect(bitmap, count, 0, cursor, blocks)
+        if blocks:
+            self.cursor = blocks[-1] + 1
+        return blocks
+
+
+class BestFit:
+    # 选能放下整个文件的最小空闲区间；没有时从最大的区间开始拼凑，尽量少分段
+    name = "best-fit"
+
+    def allocate(self, bitmap, count, directory=None):
+        extents = list(free_extents(bitmap))
+        fitting = [extent for extent in extents if extent[1] >= count]
+        if fitting:
+            first, _ = min(fitting, key=lambda extent: extent[1])
+            return list(range(first, first + count))
+        blocks = []
+        for first, length in sorted(extents, key=lambda extent: -extent[1]):
+            blocks.extend(range(first, first + min(length, count - len(blocks))))
+            if len(blocks) == count:
+                break
+        return sorted(blocks)
+
+
+class Locality:
+    # 就近分配：每个目录对应一个分配组，目录中的文件从组的起点开始找连续的空闲区间，
+    # 同一目录下的文件因此彼此靠近；找不到连续区间时从组起点往后逐块收集
+    name = "locality"
+
+    def group_start(self, num_blocks, directory):
+        groups = max(1, min(GROUP_COUNT, num_blocks // MIN_GROUP_BLOCKS))
+        group_size = -(-num_blocks // groups)
+        inode = directory.inode if directory is not None else 0
+        return (inode * 2654435761) % (1 << 32) % groups * group_size
+
+    def allocate(self, bitmap, count, directory=None):
+        goal = self.group_start(len(bitmap), directory)
+        run = bytes(count)
+        first = bitmap.find(run, goal)
+        if first == -1:
+            first = bitmap.find(run, 0, goal + count - 1)
+        if first != -1:
+            return list(range(first, first + count))
+        blocks = collect(bitmap, count, goal)
+        if len(blocks) < count:
+            collect(bitmap, count, 0, goal, blocks)
+        return blocks
+
+
+ALLOCATORS = {cls.name: cls for cls in (FirstFit, NextFit, BestFit, Locality)}
+
+
+def make_allocator(name):
+    if name not in ALLOCATORS:
+        raise ValueError(f"Unknown allocation policy: {name}")
+    return ALLOCATORS[name]()
+
+
+class FragmentationReport:
+    # 碎片统计：文件被分成多少段不连续的区间，空闲空间被分成多少段
+    def __init__(self):
+        self.files = 0
+        self.fragmented_files = 0
+        self.extents = 0
+        self.free_extents = 0
+        self.largest_free_extent = 0
+
+    @property
+    def extents_per_file(self):
+        return self.extents / self.files if self.files else 0.0
+
+    def summary(self):
+        return (
+            f"{self.files} files in {self.extents} extents "
+            f"({self.extents_per_file:.2f} per file), "
+            f"{self.fragmented_files} fragmented; "
+            f"free space in {self.free_extents} extents, "
+            f"largest {self.largest_free_extent} blocks."
+        )
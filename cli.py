@@ -0,0 +1,349 @@
+import argparse
+import cmd
+import os
+import shlex
+import sys
+
+from events import INFO, WARNING, print_event
+from simple_file_system import FileSystem
+from tracing import TraceRecorder
+
+# 命令行外壳：不导入 Qt，直接调用引擎；批处理模式下所有命令执行完后只保存一次
+SAVE_FILENAME = "filesystem.dat"
+DEFAULT_VOLUME_SIZE = 1024 * 1024
+DEFAULT_BLOCK_SIZE = 1024
+LIST_PAGE = 1000  # ls 每次从目录索引中取出的项目数
+# 会修改卷的命令，单条命令模式和交互模式据此决定退出时是否保存
+MODIFYING = {"mkdir", "touch", "write", "rm", "cp", "mv", "fsck", "alloc"}
+
+
+class CommandError(Exception):
+    pass
+
+
+class FileSystemShell(cmd.Cmd):
+    prompt = "tjfs> "
+
+    def __init__(self, fs, filename, stdout=None):
+        super().__init__(stdout=stdout)
+        self.fs = fs
+        self.filename = filename
+        self.failed = False  # 当前命令是否失败
+        self.modified = False  # 上次保存之后是否执行过修改卷的命令
+        fs.events.subscribe(self.report, WARNING)
+
+    def report(self, event):
+        # 引擎的警告和错误输出到标准错误，并使当前命令失败
+        self.failed = True
+        print(event.message, file=sys.stderr)
+
+    def fail(self, message):
+        raise CommandError(message)
+
+    def run(self, line):
+        # 执行一条命令，返回是否成功
+        self.onecmd(line)
+        return not self.failed
+
+    def onecmd(self, line):
+        # 拆分参数并调用 do_ 方法，空行和注释直接跳过；返回 True 表示退出交互
+        self.failed = False
+        command, _, rest = line.strip().partition(" ")
+        if not command or command.startswith("#"):
+            return False
+        try:
+            handler = getattr(self, "do_" + command, None)
+            if handler is None:
+                self.fail(f"Unknown command {command}.")
+            try:
+                args = shlex.split(rest)
+            except ValueError as e:
+                self.fail(f"{command}: {e}")
+            stop = handler(args)
+        except CommandError as e:
+            print(e, file=sys.stderr)
+            self.failed = True
+            return False
+        except (OSError, ValueError) as e:
+            # 参数格式错误、宿主文件读写失败和数据块校验失败（ChecksumError 是 IOError）
+            print(f"{command}: {e}", file=sys.stderr)
+            self.failed = True
+            return False
+        if not self.failed and command in MODIFYING:
+            self.modified = True
+        return stop
+
+    def do_help(self, args):
+        super().do_help(" ".join(args))
+
+    def lookup(self, path):
+        fcb = self.fs.find_fcb_by_path(path)
+        if fcb is None:
+            self.fail(f"{path}: no such file or directory.")
+        return fcb
+
+    def split(self, path):
+        # 把路径拆成 (父目录 FCB, 名字)
+        parent, _, name = path.rstrip("/").rpartition("/")
+        directory = self.fs.current_directory
+        if parent.strip("/"):
+            directory = self.lookup(parent)
+        if not directory.is_directory:
+            self.fail(f"{parent}: not a directory.")
+        if not name:
+            self.fail(f"{path}: invalid name.")
+        return directory, name
+
+    def in_directory(self, directory, method, *args):
+        # 引擎的创建和粘贴作用于当前目录，临时切换到目标目录执行
+        current = self.fs.current_directory
+        self.fs.current_directory = directory
+        try:
+            return method(*args)
+        finally:
+            self.fs.current_directory = current
+
+    def do_pwd(self, args):
+        print(self.fs.get_path(self.fs.current_directory), file=self.stdout)
+
+    def do_cd(self, args):
+        fcb = self.fs.root if not args else self.lookup(args[0])
+        if not fcb.is_directory:
+            self.fail(f"{args[0]}: not a directory.")
+        self.fs.current_directory = fcb
+
+    def do_mkdir(self, args):
+        parents = "-p" in args
+        for path in (arg for arg in args if arg != "-p"):
+            if not parents:
+                directory, name = self.split(path)
+                self.in_directory(directory, self.fs.create_directory, name)
+                continue
+            # 与 find_fcb_by_path 一致：以 root 开头的是绝对路径，其余相对于当前目录
+            names = path.strip("/").split("/")
+            directory = self.fs.current_directory
+            if names[0] == "root":
+                directory = self.fs.root
+                names.pop(0)
+            for name in names:
+                if name not in directory.children:
+                    self.in_directory(directory, self.fs.create_directory, name)
+                directory = directory.children[name]
+                if not directory.is_directory:
+                    self.fail(f"{path}: not a directory.")
+
+    def do_touch(self, args):
+        for path in args:
+            directory, name = self.split(path)
+            if name not in directory.children:
+                self.in_directory(directory, self.fs.create_file, name, 0)
+
+    def do_write(self, args):
+        # write PATH TEXT... | write -f 本地文件 PATH，文件不存在时先创建
+        if len(args) >= 3 and args[0] == "-f":
+            with open(args[1], "rb") as f:
+                data = f.read()
+            path = args[2]
+        elif args:
+            path = args[0]
+            data = " ".join(args[1:]).encode("utf-8")
+        else:
+            self.fail("usage: write PATH TEXT... | write -f LOCAL_FILE PATH")
+        directory, name = self.split(path)
+        if name not in directory.children:
+            self.in_directory(directory, self.fs.create_file, name, 0)
+        if not self.failed:
+            self.fs.write_file(self.fs.get_path(directory.children[name]), data)
+
+    def do_cat(self, args):
+        out = getattr(self.stdout, "buffer", None)
+        self.stdout.flush()
+        for path in args:
+            fcb = self.lookup(path)
+            if fcb.is_directory:
+                self.fail(f"{path}: is a directory.")
+            # 连续存放的文件直接输出存储器的切片，不复制
+            with self.fs.read_fcb_view(fcb) as data:
+                if out is not None:
+                    out.write(data)
+                    out.flush()
+                else:
+                    self.stdout.write(str(data, "utf-8", "replace"))
+
+    def do_rm(self, args):
+        recursive = "-r" in args
+        for path in (arg for arg in args if arg != "-r"):
+            fcb = self.lookup(path)
+            if fcb.is_directory and not recursive:
+                self.fail(f"{path}: is a directory (use rm -r).")
+            self.fs.delete(path)
+
+    def do_cp(self, args):
+        # cp 文件 目标目录
+        if len(args) != 2:
+            self.fail("usage: cp FILE DIRECTORY")
+        target = self.lookup(args[1])
+        if not target.is_directory:
+            self.fail(f"{args[1]}: not a directory.")
+        self.fs.copy_entry(args[0])
+        if not self.failed:
+            self.in_directory(target, self.fs.paste_entry)
+            self.fs.copied_entry = self.fs.copied_payload = None
+
+    def do_mv(self, args):
+        # mv 源 目标：目标是已有目录时移入该目录，否则移动并改名
+        if len(args) != 2:
+            self.fail("usage: mv SOURCE TARGET")
+        src, dst = args
+        self.lookup(src)
+        target = self.fs.find_fcb_by_path(dst)
+        if target is not None and target.is_directory:
+            self.fs.move(src, dst)
+            return
+        # 移动和改名在引擎中一次完成，目标名字已存在时什么也不改
+        directory, name = self.split(dst)
+        self.fs.move(src, self.fs.get_path(directory), name)
+
+    def do_ls(self, args):
+        long = "-l" in args
+        paths = [arg for arg in args if arg != "-l"]
+        path = paths[0] if paths else None
+        if path is not None and not self.lookup(path).is_directory:
+            self.fail(f"{path}: not a directory.")
+        pager = self.fs.list_directory(path, LIST_PAGE)
+        for name, fcb in pager:
+            if fcb.is_directory:
+                name += "/"
+            if long:
+                print(f"{fcb.size:>12} {name}", file=self.stdout)
+            else:
+                print(name, file=self.stdout)
+
+    def do_find(self, args):
+        if not args:
+            self.fail("usage: find PATTERN [LIMIT]")
+        limit = int(args[1]) if len(args) > 1 else None
+        if limit is not None and limit < 1:
+            self.fail("find: LIMIT must be at least 1.")
+        for path in self.fs.find(args[0], limit):
+            print(path, file=self.stdout)
+
+    def do_df(self, args):
+        print(self.fs.df().summary(), file=self.stdout)
+
+    def do_du(self, args):
+        # du [路径...]：逻辑字节数、占用块数、文件数和子目录数，目录的汇总由引擎增量维护
+        for path in args or [self.fs.get_path(self.fs.current_directory)]:
+            self.lookup(path)
+            usage = self.fs.du(path)
+            print(
+                f"{usage.bytes:>12} {usage.blocks:>8} {usage.files:>8} "
+                f"{usage.directories:>6}  {path}",
+                file=self.stdout,
+            )
+
+    def do_alloc(self, args):
+        # alloc [策略]：设置分配策略，并显示当前策略和碎片统计
+        if args:
+            self.fs.set_allocation_policy(args[0])
+        print(f"Allocation policy: {self.fs.allocator.name}", file=self.stdout)
+        print(self.fs.fragmentation().summary(), file=self.stdout)
+
+    def do_save(self, args):
+        self.filename = args[0] if args else self.filename
+        self.fs.save_to_disk(self.filename)
+        if not self.failed:
+            self.modified = False
+
+    def do_fsck(self, args):
+        report = self.fs.fsck(repair="--repair" in args, verify_data="--verify" in args)
+        print(report.summary(), file=self.stdout)
+        if not report.clean and not report.repairs:
+            self.failed = True
+
+    def do_quit(self, args):
+        return True
+
+    do_exit = do_quit
+
+    def do_EOF(self, args):
+        print(file=self.stdout)
+        return True
+
+
+def run_batch(shell, lines, source, keep_going=False):
+    # 依次执行脚本中的命令，默认遇到第一个错误就停止；返回失败的命令数
+    failures = 0
+    for number, line in enumerate(lines, 1):
+        if not shell.run(line):
+            failures += 1
+            print(f"{source}:{number}: command failed: {line.strip()}", file=sys.stderr)
+            if not keep_going:
+                break
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Command line shell for the volume.")
+    parser.add_argument("-f", "--image", default=SAVE_FILENAME)
+    parser.add_argument(
+        "-b",
+        "--batch",
+        metavar="SCRIPT",
+        help="run commands from SCRIPT ('-' for stdin) and save once at the end",
+    )
+    parser.add_argument("-k", "--keep-going", action="store_true")
+    parser.add_argument("-n", "--no-save", action="store_true")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument("--trace", metavar="FILE", help="record engine calls to FILE")
+    parser.add_argument("--size", type=int, default=DEFAULT_VOLUME_SIZE)
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument("command", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    fs = FileSystem(args.size, args.block_size)
+    if os.path.exists(args.image):
+        if not fs.load_from_disk(args.image):
+            print(f"Cannot load {args.image}.", file=sys.stderr)
+            return 1
+    else:
+        fs.format()
+    shell = FileSystemShell(fs, args.image)
+    recorder = None
+    if args.trace:
+        recorder = TraceRecorder(args.trace)
+        recorder.attach(fs)
+    try:
+        return run_shell(shell, args)
+    finally:
+        if recorder is not None:
+            recorder.detach()
+
+
+def run_shell(shell, args):
+    fs = shell.fs
+    if args.verbose:
+        fs.events.subscribe(print_event, INFO)
+
+    if args.batch is not None:
+        if args.batch == "-":
+            failures = run_batch(shell, sys.stdin, "<stdin>", args.keep_going)
+        else:
+            with open(args.batch, encoding="utf-8") as f:
+                failures = run_batch(shell, f, args.batch, args.keep_going)
+        status = 1 if failures else 0
+        # 出错停止时不保存，卷保持执行脚本之前的状态
+        if failures and not args.keep_going:
+            return status
+    elif args.command:
+        status = 0 if shell.run(shlex.join(args.command)) else 1
+    else:
+        shell.cmdloop()
+        status = 0
+    if shell.modified and not args.no_save:
+        shell.do_save([])
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import zlib
+import lzma
+from collections import OrderedDict
+
+COMPRESSION_METHODS = ("zlib", "lzma")
+NO_COMPRESSION = "none"
+DEFAULT_CHUNK_SIZE = 4096  # 每个压缩块对应的逻辑字节数
+
+
+def compress_chunk(data, method):
+    if method == "zlib":
+        return zlib.compress(bytes(data), 6)
+    if method == "lzma":
+        return lzma.compress(bytes(data), preset=1)
+    raise ValueError(f"Unknown compression method: {method}")
+
+
+def decompress_chunk(data, method):
+    if method == "zlib":
+        return zlib.decompress(bytes(data))
+    if method == "lzma":
+        return lzma.decompress(bytes(data))
+    raise ValueError(f"Unknown compression method: {method}")
+
+
+def compress_data(data, method, chunk_size=DEFAULT_CHUNK_SIZE):
+    # 按固定大小分块压缩，返回 (压缩后的数据, 块表)
+    # 块表中每一项为 (在压缩数据中的偏移, 压缩后长度)，用于随机访问
+    payload = bytearray()
+    chunks = []
+    for start in range(0, len(data), chunk_size):
+        compressed = compress_chunk(data[start : start + chunk_size], method)
+        chunks.append((len(payload), len(compressed)))
+        payload.extend(compressed)
+    return payload, chunks
+
+
+class ChunkCache:
+    # 已解压数据块的 LRU 缓存，键为 (文件首块号, 块序号)
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        self.entries[key] = data
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, address):
+        # 文件数据被改写或删除时，丢弃该文件的所有缓存块
+        for key in [key for key in self.entries if key[0] == address]:
+            del self.entries[key]
+
+    def invalidate_blocks(self, blocks):
+        # 块被释放后，以这些块开头的文件的缓存都已失效
+        blocks = set(blocks)
+        for key in [key for key in self.entries if key[0] in blocks]:
+            del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,113 @@
+import re
+import pickle
+
+TOKEN_RE = re.compile(r"\w+")
+INDEX_VERSION = 1
+
+
+def tokenize(text):
+    # 逐个返回 (词, 词序号, 字节偏移)，词统一转为小写
+    byte_offset = 0
+    last = 0
+    for position, match in enumerate(TOKEN_RE.finditer(text)):
+        start = match.start()
+        byte_offset += len(text[last:start].encode("utf-8"))
+        last = start
+        yield match.group().lower(), position, byte_offset
+
+
+class ContentIndex:
+    # 文件内容的倒排索引：词 -> {inode: [(词序号, 字节偏移), ...]}
+    def __init__(self):
+        self.postings = {}
+        self.terms_by_inode = {}  # inode -> 该文件包含的词，删除文件时使用
+
+    def __len__(self):
+        return len(self.terms_by_inode)
+
+    def index_file(self, inode, text):
+        self.remove_file(inode)
+        terms = {}
+        for term, position, offset in tokenize(text):
+            terms.setdefault(term, []).append((position, offset))
+        for term, occurrences in terms.items():
+            self.postings.setdefault(term, {})[inode] = occurrences
+        if terms:
+            self.terms_by_inode[inode] = set(terms)
+
+    def remove_file(self, inode):
+        for term in self.terms_by_inode.pop(inode, ()):
+            files = self.postings[term]
+            del files[inode]
+            if not files:
+                del self.postings[term]
+
+    def search_term(self, term):
+        # 返回 {inode: [字节偏移, ...]}
+        files = self.postings.get(term.lower(), {})
+        return {
+            inode: [offset for _, offset in occurrences]
+            for inode, occurrences in files.items()
+        }
+
+    def search_all(self, terms):
+        # 同时包含所有词的文件，偏移为各个词出现的位置
+        terms = [term.lower() for term in terms]
+        if not terms:
+            return {}
+        inodes = None
+        for term in terms:
+            files = self.postings.get(term, {})
+            inodes = set(files) if inodes is None else inodes & files.keys()
+            if not inodes:
+                return {}
+        return {
+            inode: sorted(
+                offset for term in terms for _, offset in self.postings[term][inode]
+            )
+            for inode in inodes
+        }
+
+    def search_phrase(self, phrase):
+        # 短语查询：各个词在文件中的词序号连续，返回短语起始的字节偏移
+        terms = [term for term, _, _ in tokenize(phrase)]
+        if len(terms) <= 1:
+            return self.search_term(terms[0]) if terms else {}
+        result = {}
+        for inode in self.search_all(terms):
+            positions = [
+                {position for position, _ in self.postings[term][inode]}
+                for term in terms[1:]
+            ]
+            offsets = [
+                offset
+                for position, offset in self.postings[terms[0]][inode]
+                if all(
+                    position + i + 1 in following
+                    for i, following in enumerate(positions)
+                )
+            ]
+            if offsets:
+                result[inode] = offsets
+        return result
+
+    def save(self, filename, image_id):
+        with open(filename, "wb") as f:
+            pickle.dump((INDEX_VERSION, image_id, self.postings), f)
+
+    @classmethod
+    def load(cls, filename, image_id):
+        # 索引文件与镜像不匹配或损坏时返回 None，由调用方重建
+        try:
+            with open(filename, "rb") as f:
+                version, saved_id, postings = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+        if version != INDEX_VERSION or saved_id != image_id:
+            return None
+        index = cls()
+        index.postings = postings
+        for term, files in postings.items():
+            for inode in files:
+                index.terms_by_inode.setdefault(inode, set()).add(term)
+        return index
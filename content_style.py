@@ -1,45 +1,513 @@
-from PyQt5.QtWidgets import (
-    QDialog,
-    QVBoxLayout,
-    QLabel,
-    QScrollArea,
-    QSizePolicy,
-    QPushButton,
-    QHBoxLayout,
-)
-from PyQt5.QtCore import Qt
-
-
-class FileContentDialog(QDialog):
-    def __init__(self, title, content, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle(title)
-
-        layout = QVBoxLayout(self)
-        scroll_area = QScrollArea(self)
-        scroll_area.setWidgetResizable(True)
-
-        content_widget = QLabel(content, scroll_area)
-        content_widget.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Preferred)
-        content_widget.setWordWrap(True)
-        content_widget.setAlignment(Qt.AlignTop)
-
-        scroll_area.setWidget(content_widget)
-        layout.addWidget(scroll_area)
-
-        button_layout = QHBoxLayout()
-        self.full_screen_button = QPushButton("Full Screen", self)
-        self.full_screen_button.clicked.connect(self.toggle_full_screen)
-        button_layout.addWidget(self.full_screen_button)
-        layout.addLayout(button_layout)
-
-        self.setLayout(layout)
-        self.resize(600, 400)
-
-    def toggle_full_screen(self):
-        if self.isFullScreen():
-            self.showNormal()
-            self.full_screen_button.setText("Full Screen")
-        else:
-            self.showFullScreen()
-            self.full_screen_button.setText("Exit Full Screen")
+import time
+from array import array
+
+from PyQt5.QtWidgets import (
+    QDialog,
+    QVBoxLayout,
+    QLabel,
+    QLineEdit,
+    QPlainTextEdit,
+    QScrollBar,
+    QPushButton,
+    QHBoxLayout,
+    QListWidget,
+    QListWidgetItem,
+    QTreeWidget,
+    QTreeWidgetItem,
+    QWidget,
+    QScrollArea,
+    QToolTip,
+)
+from PyQt5.QtCore import Qt, QRect, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QPainter, QTextCursor, qRgb
+
+from events import DEBUG
+
+
+VIEWER_PAGE_SIZE = 64 * 1024  # 查看器每页读取的字节数
+SEARCH_CHUNK_SIZE = 1024 * 1024  # 查找时每次读取的字节数
+BLOCK_MAP_COLUMNS = (32, 1024)  # 块图每行块数的范围，取不小于块数平方根的 2 的幂
+BLOCK_MAP_WIDTH = 512  # 块数较少时把单元格放大，使块图大约有这么宽（像素）
+BLOCK_MAP_INTERVAL = 50  # 把分配和释放事件画到块图上的间隔（毫秒）
+BLOCK_MAP_SLICE = 0.02  # 每次定时器调用中用于按文件着色的时间（秒）
+# 块图颜色表中的编号：前几个是块的状态，其余为按块链着色的文件颜色
+FREE, USED, ALLOCATED, FREED, OUTSIDE = range(5)
+FILE_COLORS = 256 - 5
+BLOCK_MAP_COLORS = [
+    qRgb(232, 232, 232),  # 空闲
+    qRgb(110, 110, 110),  # 已用，尚未确定所属文件或只被快照引用
+    qRgb(220, 40, 40),  # 上次保存后分配
+    qRgb(245, 165, 50),  # 上次保存后释放
+    qRgb(255, 255, 255),  # 卷末尾之后的空位
+] + [
+    # 文件颜色避开表示未保存修改的红色和橙色
+    QColor.fromHsv(90 + index * 37 % 210, 110 + index * 53 % 120, 200).rgb()
+    for index in range(FILE_COLORS)
+]
+# 这些事件会整体改变位图或块链，收到后重新建立块图
+BLOCK_MAP_RESET = {
+    "volume.format",
+    "volume.resize",
+    "image.load",
+    "snapshot.rollback",
+    "fsck.report",
+}
+
+
+class FileContentDialog(QDialog):
+    # 分页查看文件：通过 read_range(偏移, 长度) 每次只读一页，打开大文件不需要读入全部内容
+    def __init__(self, title, size, read_range, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.size = size
+        self.read_range = read_range
+        self.page_start = 0  # 当前页第一个字符的字节偏移
+        self.page_bytes = b""
+        self.search_from = 0  # 下一次查找的起始偏移
+
+        layout = QVBoxLayout(self)
+        self.info_label = QLabel(self)
+        layout.addWidget(self.info_label)
+
+        self.text_edit = QPlainTextEdit(self)
+        self.text_edit.setReadOnly(True)
+        layout.addWidget(self.text_edit)
+
+        # 页滚动条的每一格对应一页
+        self.page_bar = QScrollBar(Qt.Horizontal, self)
+        self.page_bar.setRange(0, max(0, (size - 1) // VIEWER_PAGE_SIZE))
+        self.page_bar.setPageStep(1)
+        self.page_bar.valueChanged.connect(
+            lambda page: self.show_page(page * VIEWER_PAGE_SIZE)
+        )
+        layout.addWidget(self.page_bar)
+
+        navigation_layout = QHBoxLayout()
+        previous_button = QPushButton("Previous", self)
+        previous_button.clicked.connect(
+            lambda: self.show_page(self.page_start - VIEWER_PAGE_SIZE)
+        )
+        navigation_layout.addWidget(previous_button)
+        next_button = QPushButton("Next", self)
+        next_button.clicked.connect(
+            lambda: self.show_page(self.page_start + VIEWER_PAGE_SIZE)
+        )
+        navigation_layout.addWidget(next_button)
+        self.offset_box = QLineEdit(self)
+        self.offset_box.setPlaceholderText("Byte offset (e.g. 4096 or 0x1000)")
+        self.offset_box.returnPressed.connect(self.jump_to_offset)
+        navigation_layout.addWidget(self.offset_box)
+        go_button = QPushButton("Go", self)
+        go_button.clicked.connect(self.jump_to_offset)
+        navigation_layout.addWidget(go_button)
+        layout.addLayout(navigation_layout)
+
+        search_layout = QHBoxLayout()
+        self.search_box = QLineEdit(self)
+        self.search_box.setPlaceholderText("Find text")
+        self.search_box.returnPressed.connect(self.find_next)
+        self.search_box.textChanged.connect(self.reset_search)
+        search_layout.addWidget(self.search_box)
+        find_button = QPushButton("Find Next", self)
+        find_button.clicked.connect(self.find_next)
+        search_layout.addWidget(find_button)
+        self.full_screen_button = QPushButton("Full Screen", self)
+        self.full_screen_button.clicked.connect(self.toggle_full_screen)
+        search_layout.addWidget(self.full_screen_button)
+        layout.addLayout(search_layout)
+
+        self.setLayout(layout)
+        self.resize(600, 400)
+        self.show_page(0)
+
+    def show_page(self, offset):
+        # 显示 offset 所在的页；页的边界落在多字节字符中间时，该字符归前一页
+        page = min(max(0, offset), max(0, self.size - 1)) // VIEWER_PAGE_SIZE
+        start = page * VIEWER_PAGE_SIZE
+        try:
+            data = self.read_range(start, VIEWER_PAGE_SIZE + 3)
+        except Exception as e:
+            self.text_edit.setPlainText(f"Error reading file: {e}")
+            return
+        skip = 0
+        while start > 0 and skip < min(3, len(data)) and data[skip] & 0xC0 == 0x80:
+            skip += 1
+        end = min(VIEWER_PAGE_SIZE, len(data))
+        while end < len(data) and data[end] & 0xC0 == 0x80:
+            end += 1
+        self.page_start = start + skip
+        self.page_bytes = bytes(data[skip:end])
+        text = self.page_bytes.decode("utf-8", errors="replace")
+        if start + VIEWER_PAGE_SIZE >= self.size:
+            text = text.rstrip("\x00")  # 去掉末尾的空字节
+        self.text_edit.setPlainText(text)
+
+        self.page_bar.blockSignals(True)
+        self.page_bar.setValue(page)
+        self.page_bar.blockSignals(False)
+        self.info_label.setText(
+            f"Bytes {self.page_start}-{self.page_start + len(self.page_bytes)} "
+            f"of {self.size} (page {page + 1} of {self.page_bar.maximum() + 1})"
+        )
+
+    def jump_to_offset(self):
+        try:
+            offset = int(self.offset_box.text().strip(), 0)
+        except ValueError:
+            self.info_label.setText("Invalid offset.")
+            return
+        self.show_page(offset)
+        self.select_bytes(max(0, min(offset, self.size - 1)), 0)
+
+    def select_bytes(self, offset, length):
+        # 在当前页中选中从字节偏移 offset 开始的 length 个字节
+        relative = offset - self.page_start
+        if relative < 0:
+            return
+        prefix = self.page_bytes[:relative].decode("utf-8", errors="replace")
+        selected = self.page_bytes[relative : relative + length]
+        cursor = self.text_edit.textCursor()
+        cursor.setPosition(len(prefix))
+        cursor.setPosition(
+            len(prefix) + len(selected.decode("utf-8", errors="replace")),
+            QTextCursor.KeepAnchor,
+        )
+        self.text_edit.setTextCursor(cursor)
+        self.text_edit.ensureCursorVisible()
+
+    def reset_search(self):
+        self.search_from = 0
+
+    def find_next(self):
+        # 分段读取文件查找，相邻两段重叠 len(needle) - 1 个字节，避免漏掉跨段的匹配
+        needle = self.search_box.text().encode("utf-8")
+        if not needle:
+            return
+        position = self.search_from
+        while position < self.size:
+            chunk = self.read_range(position, SEARCH_CHUNK_SIZE + len(needle) - 1)
+            index = chunk.find(needle)
+            if index != -1:
+                found = position + index
+                self.search_from = found + 1
+                self.show_page(found)
+                self.select_bytes(found, len(needle))
+                return
+            position += SEARCH_CHUNK_SIZE
+        self.search_from = 0  # 下一次从文件开头重新查找
+        self.info_label.setText(f"'{self.search_box.text()}' not found.")
+
+    def toggle_full_screen(self):
+        if self.isFullScreen():
+            self.showNormal()
+            self.full_screen_button.setText("Full Screen")
+        else:
+            self.showFullScreen()
+            self.full_screen_button.setText("Exit Full Screen")
+
+
+class SearchResultsDialog(QDialog):
+    def __init__(self, title, results, on_select, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.on_select = on_select
+
+        layout = QVBoxLayout(self)
+        self.result_list = QListWidget(self)
+        for path, fcb in results:
+            item = QListWidgetItem(path, self.result_list)
+            item.setData(Qt.UserRole, fcb)
+        self.result_list.itemDoubleClicked.connect(self.select_result)
+        layout.addWidget(self.result_list)
+
+        self.setLayout(layout)
+        self.resize(600, 400)
+
+    def select_result(self, item):
+        # 双击结果后在主窗口的目录树中定位该项目
+        self.on_select(item.data(Qt.UserRole))
+        self.accept()
+
+
+class SnapshotBrowserDialog(QDialog):
+    # 只读浏览快照内容，目录在展开时才读取
+    def __init__(self, view, parent=None):
+        super().__init__(parent)
+        self.view = view
+        self.setWindowTitle(f"Snapshot {view.snapshot.name} (read-only)")
+
+        layout = QVBoxLayout(self)
+        self.tree = QTreeWidget(self)
+        self.tree.setHeaderLabels(["Name", "Size"])
+        self.tree.itemExpanded.connect(self.load_children)
+        self.tree.itemDoubleClicked.connect(self.open_file)
+        layout.addWidget(self.tree)
+
+        root_item = self.add_item(self.tree, view.root, "/root")
+        root_item.setExpanded(True)
+
+        self.setLayout(layout)
+        self.resize(600, 400)
+
+    def add_item(self, parent, entry, path):
+        item = QTreeWidgetItem(parent)
+        item.setText(0, entry.name)
+        item.setData(0, Qt.UserRole, path)
+        if entry.is_directory:
+            item.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+            item.setData(1, Qt.UserRole, False)  # 子项目是否已加载
+        else:
+            item.setText(1, f"{entry.size} bytes")
+        return item
+
+    def load_children(self, item):
+        if item.data(1, Qt.UserRole):
+            return
+        item.setData(1, Qt.UserRole, True)
+        path = item.data(0, Qt.UserRole)
+        for entry in self.view.list_directory(path):
+            self.add_item(item, entry, f"{path}/{entry.name}")
+
+    def open_file(self, item, column):
+        path = item.data(0, Qt.UserRole)
+        entry = self.view.find(path)
+        if entry is None or entry.is_directory:
+            return
+        dialog = FileContentDialog(
+            f"{path} @ {self.view.snapshot.name}",
+            entry.size,
+            lambda offset, length: self.view.fs.read_fcb_range(entry, offset, length),
+            self,
+        )
+        dialog.exec_()
+
+
+class BlockMapView(QWidget):
+    # 卷中每个块画成一个单元格。所有单元格是一张 8 位索引色 QImage 的像素，初始内容直接
+    # 复制位图（0 和 1 正好是空闲和已用的颜色编号），之后只根据引擎的分配和释放事件修改
+    # 变化的单元格；按文件着色由定时器分段完成，块数很多时界面也不会停顿
+    summary_changed = pyqtSignal(str)
+
+    def __init__(self, fs, parent=None):
+        super().__init__(parent)
+        self.fs = fs
+        self.pending = []  # 尚未画到块图上的事件 (类型, 块号列表)
+        self.setMouseTracking(True)
+        self.reset()
+        fs.events.subscribe(self.on_event, DEBUG)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.tick)
+        self.timer.start(BLOCK_MAP_INTERVAL)
+
+    def detach(self):
+        self.timer.stop()
+        self.fs.events.unsubscribe(self.on_event)
+
+    def reset(self):
+        count = self.fs.num_blocks
+        columns = 1 << (max(1, int(count**0.5)) - 1).bit_length()
+        self.columns = min(max(columns, BLOCK_MAP_COLUMNS[0]), BLOCK_MAP_COLUMNS[1])
+        self.rows = -(-count // self.columns)
+        self.cell = max(1, BLOCK_MAP_WIDTH // self.columns)  # 单元格边长（像素）
+        self.image = QImage(self.columns, self.rows, QImage.Format_Indexed8)
+        self.image.setColorTable(BLOCK_MAP_COLORS)
+        bits = self.image.bits()
+        bits.setsize(self.image.byteCount())
+        self.cells = memoryview(bits)  # 每行字节数等于列数（列数是 4 的倍数）
+        self.cells[:count] = self.fs.bitmap
+        self.cells[count:] = bytes([OUTSIDE]) * (len(self.cells) - count)
+        self.owners = array("i", [-1]) * count  # 每个块所在块链的首块号
+        self.owner_cache = None  # 首块号 -> FCB，悬停时按需建立
+        self.dirty = set()  # 上次保存之后分配或释放的块
+        self.coloring = self.color_files()
+        self.setFixedSize(self.columns * self.cell, self.rows * self.cell)
+        self.update()
+
+    def on_event(self, event):
+        # 引擎的事件在执行操作时同步发出，这里只记下来，由定时器批量画出
+        if event.kind in ("block.allocate", "block.free"):
+            if "blocks" in event.fields:
+                self.pending.append((event.kind, event.fields["blocks"]))
+        elif event.kind in BLOCK_MAP_RESET or event.kind == "image.save":
+            self.pending.append((event.kind, None))
+
+    def tick(self):
+        pending, self.pending = self.pending, []
+        changed = bool(pending)
+        for kind, blocks in pending:
+            if kind in BLOCK_MAP_RESET:
+                self.reset()
+            elif kind == "image.save":
+                self.mark_saved()
+            else:
+                self.mark_changed(kind, blocks)
+        if self.coloring is not None:
+            changed = True
+            deadline = time.perf_counter() + BLOCK_MAP_SLICE
+            for _ in self.coloring:
+                if time.perf_counter() > deadline:
+                    break
+            else:
+                self.coloring = None
+        if changed:
+            self.update()
+            self.summary_changed.emit(self.summary())
+
+    def color_files(self):
+        # 遍历目录树，沿每个文件的块链记录所属的链并着色；是生成器，由 tick 分段执行
+        stack = [self.fs.root]
+        while stack:
+            fcb = stack.pop()
+            if fcb.is_directory:
+                stack.extend(fcb.children.values())
+            elif fcb.address != -1:
+                yield from self.mark_chain(fcb.address)
+            yield
+
+    def mark_chain(self, head):
+        color = self.file_color(head)
+        fat, owners, cells, dirty = self.fs.fat, self.owners, self.cells, self.dirty
+        block = head
+        steps = 0
+        while block != -1 and owners[block] != head:
+            owners[block] = head
+            if block not in dirty:
+                cells[block] = color
+            block = fat[block]
+            steps += 1
+            if steps % 4096 == 0:
+                yield
+
+    def file_color(self, head):
+        return OUTSIDE + 1 + head * 2654435761 % FILE_COLORS
+
+    def mark_changed(self, kind, blocks):
+        owners, cells, dirty = self.owners, self.cells, self.dirty
+        self.owner_cache = None
+        if kind == "block.allocate":
+            head, color = blocks[0], ALLOCATED
+        else:
+            head, color = -1, FREED
+        for block in blocks:
+            if block < len(owners):
+                owners[block] = head
+                cells[block] = color
+                dirty.add(block)
+
+    def mark_saved(self):
+        # 保存后不再区分未保存的修改，按当前状态重新着色
+        bitmap, owners, cells = self.fs.bitmap, self.owners, self.cells
+        for block in self.dirty:
+            if block >= len(owners):
+                continue
+            if not bitmap[block]:
+                cells[block] = FREE
+            elif owners[block] != -1:
+                cells[block] = self.file_color(owners[block])
+            else:
+                cells[block] = USED
+        self.dirty.clear()
+
+    def paintEvent(self, event):
+        # 只画需要重绘的行，放大时不做平滑，每个块保持为清晰的方格
+        rect = event.rect()
+        first = rect.top() // self.cell
+        last = min(self.rows, rect.bottom() // self.cell + 1)
+        if first >= last:
+            return
+        painter = QPainter(self)
+        painter.drawImage(
+            QRect(0, first * self.cell, self.width(), (last - first) * self.cell),
+            self.image,
+            QRect(0, first, self.columns, last - first),
+        )
+
+    def block_at(self, position):
+        column = position.x() // self.cell
+        block = position.y() // self.cell * self.columns + column
+        if column >= self.columns or not 0 <= block < len(self.owners):
+            return None
+        return block
+
+    def owner_of(self, block):
+        head = self.owners[block]
+        if head == -1:
+            return None
+        if self.owner_cache is None:
+            self.owner_cache = {
+                fcb.address: fcb
+                for fcb in self.fs.name_index.by_inode.values()
+                if not fcb.is_directory and fcb.address != -1
+            }
+        return self.owner_cache.get(head)
+
+    def describe(self, block):
+        if not self.fs.bitmap[block]:
+            lines = [f"Block {block}: free"]
+        else:
+            lines = [f"Block {block}: used"]
+            fcb = self.owner_of(block)
+            if fcb is not None:
+                lines.append(self.fs.get_path(fcb))
+            elif self.coloring is not None:
+                lines.append("(still scanning files)")
+            else:
+                lines.append("(held by a snapshot or waiting to be reclaimed)")
+        if block in self.dirty:
+            lines.append("Changed since the last save")
+        return "\n".join(lines)
+
+    def mouseMoveEvent(self, event):
+        block = self.block_at(event.pos())
+        if block is None:
+            QToolTip.hideText()
+            return
+        QToolTip.showText(event.globalPos(), self.describe(block), self)
+
+    def summary(self):
+        used = self.fs.num_blocks - self.fs.free_count
+        text = (
+            f"{self.fs.num_blocks} blocks of {self.fs.block_size} bytes, {used} used, "
+            f"{len(self.dirty)} changed since the last save."
+        )
+        if self.coloring is not None:
+            text += " Scanning files..."
+        return text
+
+
+class BlockMapDialog(QDialog):
+    # 非模态窗口，打开时可以继续操作文件系统，块图随分配和释放实时更新
+    def __init__(self, fs, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Block Map")
+
+        layout = QVBoxLayout(self)
+        legend = QLabel(self)
+        legend.setText(
+            "  ".join(
+                f'<span style="color:{QColor(BLOCK_MAP_COLORS[index]).name()}">'
+                f"&#9632;</span> {name}"
+                for index, name in (
+                    (FREE, "Free"),
+                    (USED, "Used"),
+                    (OUTSIDE + 1, "File (one color per file)"),
+                    (ALLOCATED, "Allocated since save"),
+                    (FREED, "Freed since save"),
+                )
+            )
+        )
+        layout.addWidget(legend)
+
+        self.view = BlockMapView(fs, self)
+        scroll_area = QScrollArea(self)
+        scroll_area.setWidget(self.view)
+        scroll_area.setAlignment(Qt.AlignHCenter)
+        layout.addWidget(scroll_area)
+
+        self.summary_label = QLabel(self.view.summary(), self)
+        self.view.summary_changed.connect(self.summary_label.setText)
+        layout.addWidget(self.summary_label)
+
+        self.finished.connect(lambda result: self.view.detach())
+        self.setLayout(layout)
+        self.resize(self.view.width() + 60, min(self.view.height() + 120, 720))
@@ -0,0 +1,191 @@
+from bisect import bisect_left, bisect_right, insort
+from fnmatch import fnmatchcase
+
+GLOB_CHARS = "*?["
+CHUNK_SIZE = 512  # 排序列表每块的目标长度
+
+
+def literal_prefix(pattern):
+    # 通配符模式中第一个通配符之前的部分，用于缩小查找范围
+    for i, ch in enumerate(pattern):
+        if ch in GLOB_CHARS:
+            return pattern[:i]
+    return pattern
+
+
+def check_page_size(size):
+    if size < 1:
+        raise ValueError(f"page size must be at least 1, got {size}")
+
+
+class DirectoryIndex:
+    # 目录项索引：名字到 FCB 的映射，同时维护按名字排序的分块列表，
+    # 支持有序遍历、前缀/通配符查询以及基于游标的分页。
+    # 排序列表分成若干长度不超过 2 * CHUNK_SIZE 的块，插入和删除只移动一个块内的元素，
+    # 先在各块最大名字的列表中二分找到所在的块
+    def __init__(self, entries=None):
+        self._entries = dict(entries) if entries else {}
+        self._build()
+
+    def _build(self):
+        names = sorted(self._entries)
+        self._chunks = [
+            names[i : i + CHUNK_SIZE] for i in range(0, len(names), CHUNK_SIZE)
+        ]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._version = 0  # 增删目录项时加一，遍历中发现变化时报错
+
+    def __getstate__(self):
+        # 只保存映射，排序列表在加载时重建
+        return (self._entries,)
+
+    def __setstate__(self, state):
+        self._entries = state[0]
+        self._build()
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __getitem__(self, name):
+        return self._entries[name]
+
+    def __setitem__(self, name, fcb):
+        if name not in self._entries:
+            self._insert(name)
+        self._entries[name] = fcb
+
+    def _insert(self, name):
+        self._version += 1
+        if not self._chunks:
+            self._chunks.append([name])
+            self._maxes.append(name)
+            return
+        k = min(bisect_left(self._maxes, name), len(self._chunks) - 1)
+        chunk = self._chunks[k]
+        insort(chunk, name)
+        self._maxes[k] = chunk[-1]
+        if len(chunk) > 2 * CHUNK_SIZE:
+            # 过长的块对半拆开
+            self._chunks[k : k + 1] = [chunk[:CHUNK_SIZE], chunk[CHUNK_SIZE:]]
+            self._maxes[k : k + 1] = [chunk[CHUNK_SIZE - 1], chunk[-1]]
+
+    def __delitem__(self, name):
+        del self._entries[name]
+        self._version += 1
+        k = bisect_left(self._maxes, name)
+        chunk = self._chunks[k]
+        del chunk[bisect_left(chunk, name)]
+        if chunk:
+            self._maxes[k] = chunk[-1]
+        else:
+            del self._chunks[k]
+            del self._maxes[k]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        for name, _ in self._walk(0, 0):
+            yield name
+
+    def _locate(self, name, after):
+        # 第一个不小于 name（after 为 True 时为大于 name）的名字所在的 (块号, 块内位置)
+        find = bisect_right if after else bisect_left
+        k = find(self._maxes, name)
+        if k == len(self._chunks):
+            return k, 0
+        return k, find(self._chunks[k], name)
+
+    def _walk(self, k, i):
+        # 从 (块号, 块内位置) 开始按顺序产生 (名字, FCB)，不复制排序列表
+        version = self._version
+        chunks = self._chunks
+        while k < len(chunks):
+            chunk = chunks[k]
+            while i < len(chunk):
+                if self._version != version:
+                    raise RuntimeError("directory changed during iteration")
+                name = chunk[i]
+                yield name, self._entries[name]
+                i += 1
+            k += 1
+            i = 0
+
+    def get(self, name, default=None):
+        return self._entries.get(name, default)
+
+    def pop(self, name, *default):
+        if name not in self._entries:
+            if default:
+                return default[0]
+            raise KeyError(name)
+        fcb = self._entries[name]
+        del self[name]
+        return fcb
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        for _, fcb in self._walk(0, 0):
+            yield fcb
+
+    def items(self):
+        return self._walk(0, 0)
+
+    def irange(self, after=None):
+        # 按名字顺序遍历 after 之后的目录项
+        if after is None:
+            return self._walk(0, 0)
+        return self._walk(*self._locate(after, True))
+
+    def prefix(self, prefix, after=None):
+        k, i = self._locate(prefix, False)
+        if after is not None and after >= prefix:
+            k, i = self._locate(after, True)
+        for name, fcb in self._walk(k, i):
+            if not name.startswith(prefix):
+                break
+            yield name, fcb
+
+    def glob(self, pattern, after=None):
+        for name, fcb in self.prefix(literal_prefix(pattern), after):
+            if fnmatchcase(name, pattern):
+                yield name, fcb
+
+    def page(self, cursor=None, limit=100, pattern=None):
+        # 返回 (本页目录项, 下一页游标)，游标为本页最后一个名字，没有更多时为 None
+        check_page_size(limit)
+        source = self.irange(cursor) if pattern is None else self.glob(pattern, cursor)
+        entries = []
+        for entry in source:
+            if len(entries) == limit:
+                return entries, entries[-1][0]
+            entries.append(entry)
+        return entries, None
+
+
+class DirectoryPager:
+    # 目录列表的惰性分页迭代器，每次只从索引中取出一页
+    def __init__(self, index, page_size=100, pattern=None, cursor=None):
+        check_page_size(page_size)  # 创建时就检查，错误在调用方而不是第一次翻页时报告
+        self.index = index
+        self.page_size = page_size
+        self.pattern = pattern
+        self.cursor = cursor
+        self.has_more = True
+
+    def next_page(self):
+        if not self.has_more:
+            return []
+        entries, next_cursor = self.index.page(
+            self.cursor, self.page_size, self.pattern
+        )
+        if entries:
+            self.cursor = entries[-1][0]
+        self.has_more = next_cursor is not None
+        return entries
+
+    def __iter__(self):
+        while self.has_more:
+            yield from self.next_page()
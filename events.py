@@ -0,0 +1,95 @@
+import sys
+import time
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+DISABLED = ERROR + 1  # 没有订阅者时的阈值，任何事件都不会被处理
+
+
+class Event:
+    # 一条结构化事件：级别、类型（如 "file.write"）、消息模板和字段，消息在需要时才格式化
+    __slots__ = ("time", "level", "kind", "template", "fields")
+
+    def __init__(self, level, kind, template, fields):
+        self.time = time.time()
+        self.level = level
+        self.kind = kind
+        self.template = template
+        self.fields = fields
+
+    @property
+    def message(self):
+        return self.template.format(**self.fields)
+
+    def __str__(self):
+        stamp = time.strftime("%H:%M:%S", time.localtime(self.time))
+        return f"{stamp} [{LEVEL_NAMES.get(self.level, self.level)}] {self.message}"
+
+
+class EventStream:
+    # 事件流：低于所有订阅者级别的事件在 emit 中直接返回，既不创建事件也不格式化消息
+    def __init__(self):
+        self.listeners = []  # [(回调, 最低级别), ...]
+        self.threshold = DISABLED
+
+    def subscribe(self, listener, level=INFO):
+        self.listeners.append((listener, level))
+        self.threshold = min(self.threshold, level)
+
+    def unsubscribe(self, listener):
+        self.listeners = [entry for entry in self.listeners if entry[0] != listener]
+        self.threshold = min((level for _, level in self.listeners), default=DISABLED)
+
+    def enabled(self, level):
+        return level >= self.threshold
+
+    def emit(self, level, kind, template, **fields):
+        if level < self.threshold:
+            return
+        event = Event(level, kind, template, fields)
+        for listener, minimum in self.listeners:
+            if level >= minimum:
+                listener(event)
+
+    def debug(self, kind, template, **fields):
+        self.emit(DEBUG, kind, template, **fields)
+
+    def info(self, kind, template, **fields):
+        self.emit(INFO, kind, template, **fields)
+
+    def warning(self, kind, template, **fields):
+        self.emit(WARNING, kind, template, **fields)
+
+    def error(self, kind, template, **fields):
+        self.emit(ERROR, kind, template, **fields)
+
+
+def print_event(event):
+    # 把带时间和级别的事件输出到标准错误，命令行的 --verbose 使用
+    print(event, file=sys.stderr)
+
+
+class EventLog:
+    # 固定容量的事件环形缓冲，drain() 取出上次之后的新事件，供界面定时批量显示
+    def __init__(self, capacity=1000):
+        self.events = deque(maxlen=capacity)
+        self.pending = deque(maxlen=capacity)
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def append(self, event):
+        self.events.append(event)
+        self.pending.append(event)
+
+    def drain(self):
+        events = list(self.pending)
+        self.pending.clear()
+        return events
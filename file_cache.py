@@ -0,0 +1,72 @@
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_CAPACITY = 8 * 1024 * 1024  # 内容缓存最多保存的字符数
+DEFAULT_WRITE_DELAY = 1.0  # 同一文件最后一次写入后等待多久再写入数据块（秒）
+
+
+class ContentCache:
+    # 已解码文件内容的 LRU 缓存：inode -> (版本, 文本)，版本不同即视为失效
+    def __init__(self, capacity=DEFAULT_CACHE_CAPACITY):
+        self.capacity = capacity
+        self.used = 0
+        self.entries = OrderedDict()
+
+    def get(self, inode, version):
+        entry = self.entries.get(inode)
+        if entry is None or entry[0] != version:
+            return None
+        self.entries.move_to_end(inode)
+        return entry[1]
+
+    def put(self, inode, version, text):
+        self.invalidate(inode)
+        if len(text) > self.capacity // 4:
+            return  # 太大的文件不缓存，避免把其他文件全部挤出
+        self.entries[inode] = (version, text)
+        self.used += len(text)
+        while self.used > self.capacity:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.used -= len(evicted)
+
+    def invalidate(self, inode):
+        entry = self.entries.pop(inode, None)
+        if entry is not None:
+            self.used -= len(entry[1])
+
+    def clear(self):
+        self.entries.clear()
+        self.used = 0
+
+
+class WriteBuffer:
+    # 写回缓冲：同一文件的连续写入只保留最后一次的数据，到期或需要时才写入数据块
+    def __init__(self, delay=DEFAULT_WRITE_DELAY):
+        self.delay = delay
+        self.pending = OrderedDict()  # inode -> (fcb, 数据, 压缩设置, 最后写入时间)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def put(self, fcb, data, compression=None):
+        self.pending.pop(fcb.inode, None)
+        self.pending[fcb.inode] = (fcb, bytes(data), compression, time.monotonic())
+
+    def get(self, inode):
+        return self.pending.get(inode)
+
+    def pop(self, inode):
+        return self.pending.pop(inode, None)
+
+    def due(self):
+        # 距最后一次写入已超过 delay 的文件；按写入时间排序，遇到未到期的即可停止
+        deadline = time.monotonic() - self.delay
+        inodes = []
+        for inode, (_, _, _, written) in self.pending.items():
+            if written > deadline:
+                break
+            inodes.append(inode)
+        return inodes
+
+    def clear(self):
+        self.pending.clear()
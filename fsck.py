@@ -0,0 +1,172 @@
+from array import array
+
+COMPARE_CHUNK = 4096  # 比较位图时每次比较的字节数
+
+
+class FsckReport:
+    def __init__(self):
+        self.errors = []  # 发现的问题
+        self.repairs = []  # 已执行的修复
+        self.files = 0
+        self.directories = 0
+        self.blocks_in_use = 0
+
+    @property
+    def clean(self):
+        return not self.errors
+
+    def error(self, message):
+        self.errors.append(message)
+
+    def repair(self, message):
+        self.repairs.append(message)
+
+    def summary(self):
+        lines = [
+            f"{self.directories} directories, {self.files} files, "
+            f"{self.blocks_in_use} blocks in use.",
+            f"{len(self.errors)} problems found, {len(self.repairs)} repaired.",
+        ]
+        lines.extend(f"  problem: {message}" for message in self.errors)
+        lines.extend(f"  repaired: {message}" for message in self.repairs)
+        return "\n".join(lines)
+
+
+def differing_blocks(a, b):
+    # 找出两个等长 bytearray 中不同的位置，先整段比较，只在不同的段中逐字节查找
+    for start in range(0, len(a), COMPARE_CHUNK):
+        end = start + COMPARE_CHUNK
+        if a[start:end] != b[start:end]:
+            for i in range(start, min(end, len(a))):
+                if a[i] != b[i]:
+                    yield i
+
+
+def check_volume(fs, repair=False, verify_data=False):
+    # 一次遍历目录树和所有块链，时间与卷大小成线性关系
+    report = FsckReport()
+    num_blocks = fs.num_blocks
+    owner = array("I", [0]) * num_blocks  # 每个块所属文件的序号，0 表示未被引用
+    reachable = bytearray(num_blocks)
+    inodes = set()
+    serial = 0
+
+    stack = [fs.root]
+    while stack:
+        fcb = stack.pop()
+        if fcb.inode in inodes:
+            report.error(f"duplicate inode {fcb.inode} at {fs.get_path(fcb)}")
+            if repair:
+                fcb.inode = fs.new_inode()
+                report.repair(f"assigned new inode {fcb.inode}")
+        inodes.add(fcb.inode)
+
+        if fcb.is_directory:
+            report.directories += 1
+            for name, child in fcb.children.items():
+                if child.name != name:
+                    report.error(
+                        f"entry {name} in {fs.get_path(fcb)} is named {child.name}"
+                    )
+                    if repair:
+                        child.name = name
+                        report.repair(f"renamed entry to {name}")
+                if child.parent is not fcb:
+                    child.parent = fcb
+                stack.append(child)
+            continue
+
+        report.files += 1
+        serial += 1
+        path = fs.get_path(fcb)
+        expected = fs.blocks_needed(fs.stored_size(fcb))
+        previous = -1
+        block = fcb.address
+        length = 0
+        while block != -1:
+            problem = None
+            if length == expected:
+                problem = f"{path}: chain is longer than the file needs"
+            elif not 0 <= block < num_blocks:
+                problem = f"{path}: invalid block number {block}"
+            elif owner[block] == serial:
+                problem = f"{path}: chain has a cycle at block {block}"
+            elif owner[block]:
+                report.error(f"{path}: block {block} is cross-linked with another file")
+                if not repair:
+                    break
+                block = fs.unshare_chain(fcb, previous, block)
+                if block is not None:
+                    report.repair(f"{path}: copied shared blocks to a private chain")
+                    continue  # 从拷贝出的新块继续检查
+                problem = f"{path}: not enough space to copy shared blocks"
+            if problem:
+                report.error(problem)
+                if repair:
+                    truncate_chain(fs, fcb, previous, length)
+                    report.repair(f"{path}: truncated to {length} blocks")
+                break
+            owner[block] = serial
+            reachable[block] = 1
+            if not fs.bitmap[block]:
+                report.error(f"{path}: block {block} is in use but marked free")
+                if repair:
+                    fs.bitmap[block] = 1
+                    fs.free_count -= 1
+                    report.repair(f"marked block {block} as used")
+            previous = block
+            block = fs.fat[block]
+            length += 1
+        else:
+            if length < expected:
+                report.error(f"{path}: chain has {length} blocks, expected {expected}")
+                if repair:
+                    truncate_chain(fs, fcb, previous, length)
+                    report.repair(f"{path}: size reduced to fit {length} blocks")
+
+    # 快照仍然引用的块和等待回收的块不是泄漏
+    for snapshot in fs.snapshots:
+        for block in snapshot.deadlist:
+            reachable[block] = 1
+    for block in fs.reclaim_queue:
+        reachable[block] = 1
+
+    leaked = []
+    for block in differing_blocks(fs.bitmap, reachable):
+        if fs.bitmap[block]:
+            leaked.append(block)
+    if leaked:
+        report.error(f"{len(leaked)} blocks are allocated but not referenced")
+        if repair:
+            fs._free_blocks(leaked)
+            report.repair(f"freed {len(leaked)} orphaned blocks")
+
+    free_count = fs.bitmap.count(0)
+    if free_count != fs.free_count:
+        report.error(f"free block count is {fs.free_count}, actual {free_count}")
+        if repair:
+            fs.free_count = free_count
+            report.repair("recomputed free block count")
+    report.blocks_in_use = num_blocks - free_count
+
+    if verify_data:
+        for block in range(num_blocks):
+            if fs.bitmap[block] and not fs.verify_block(block):
+                report.error(f"block {block} fails its checksum")
+    return report
+
+
+def truncate_chain(fs, fcb, last_block, length):
+    # 在 last_block 处截断块链，并缩小文件大小使其与剩余的块一致
+    if last_block == -1:
+        fcb.address = -1
+    else:
+        fs.fat[last_block] = -1
+    capacity = length * fs.block_size
+    if fcb.codec is not None and fcb.chunks:
+        fcb.chunks = [
+            (offset, size) for offset, size in fcb.chunks if offset + size <= capacity
+        ]
+        fcb.size = min(fcb.size, len(fcb.chunks) * fcb.chunk_size)
+    else:
+        fcb.size = min(fcb.size, capacity)
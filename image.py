@@ -0,0 +1,297 @@
+import io
+import mmap
+import pickle
+import struct
+from array import array
+
+from directory_index import DirectoryIndex
+
+# 镜像布局：文件头 | 目录记录（先序）| 历史记录 | 对齐的块表和数据区 | 超级块
+# 启动时只读超级块和根目录，其余目录在第一次访问时读取，数据区和 FAT 通过内存映射按页读入
+# 名字记录保存所有目录项的名字和父目录，查找时不必读入整棵目录树
+IMAGE_MAGIC = b"TJFSIMG3"
+HEADER = struct.Struct("<8sQ")  # 魔数 + 超级块偏移
+ALIGNMENT = mmap.ALLOCATIONGRANULARITY  # 映射区域的起始偏移必须按此对齐
+COPY_CHUNK = 1024 * 1024  # 复制未加载的目录记录时每次读写的字节数
+# 目录记录表：按先序排列的 inode、偏移、长度、子树中的记录数，以及按 inode 排序的下标
+TABLE_FIELDS = (
+    "record_inode",
+    "record_offset",
+    "record_length",
+    "record_span",
+    "record_order",
+)
+
+
+def is_image(filename):
+    with open(filename, "rb") as f:
+        return f.read(len(IMAGE_MAGIC)) == IMAGE_MAGIC
+
+
+class LazyChildren:
+    # 尚未从镜像读入的目录内容，第一次访问目录的 children 时读取
+    def __init__(self, image, inode):
+        self.image = image
+        self.inode = inode
+
+    def __deepcopy__(self, memo):
+        # 复制未加载的目录时直接从镜像读一份独立的副本
+        return self.image.read_directory(self.inode)
+
+
+class FcbRef:
+    # 历史版本中对其他记录里 FCB 的引用，全部加载后替换为对象
+    def __init__(self, inode):
+        self.inode = inode
+
+
+class RecordPickler(pickle.Pickler):
+    # 只把 members 中的 FCB 写进本条记录，其他 FCB 和已加载目录的内容写成引用
+    def __init__(self, file, top, members, directories, fcb_class):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.top = top
+        self.members = members
+        self.directories = directories  # id(目录索引) -> 目录 inode
+        self.fcb_class = fcb_class
+
+    def persistent_id(self, obj):
+        if obj is self.top:
+            return None
+        cls = type(obj)
+        if cls is LazyChildren:
+            return ("dir", obj.inode)
+        if cls is FcbRef:
+            return ("fcb", obj.inode)
+        if cls is DirectoryIndex:
+            inode = self.directories.get(id(obj))
+            return None if inode is None else ("dir", inode)
+        if cls is self.fcb_class and id(obj) not in self.members:
+            return ("fcb", obj.inode)
+        return None
+
+
+class RecordUnpickler(pickle.Unpickler):
+    def __init__(self, file, image):
+        super().__init__(file)
+        self.image = image
+
+    def persistent_load(self, pid):
+        kind, inode = pid
+        if kind == "dir":
+            return LazyChildren(self.image, inode)
+        return FcbRef(inode)
+
+
+class ImageReader:
+    # 打开的镜像文件：按需读取目录记录，把块表和数据区映射到内存
+    def __init__(self, on_directory_loaded=None):
+        self.filename = None
+        self.file = None
+        self.superblock = None
+        self.table = None
+        self.maps = []
+        self.views = []
+        self.on_directory_loaded = on_directory_loaded
+
+    def open(self, filename):
+        self.close()
+        self.filename = filename
+        self.file = open(filename, "rb")
+        try:
+            header = self.file.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise EOFError("image header is truncated")
+            magic, offset = HEADER.unpack(header)
+            if magic != IMAGE_MAGIC:
+                raise pickle.UnpicklingError("not a file system image")
+            self.file.seek(offset)
+            self.superblock = self.unpickle(self.file.read())
+            self.table = {name: self.region(name, "Q") for name in TABLE_FIELDS}
+        except Exception:
+            self.close()
+            raise
+        return self.superblock
+
+    def close(self):
+        # 关闭前先释放所有内存视图，否则映射无法关闭
+        for view in self.views:
+            view.release()
+        for mapped in self.maps:
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # 调用者仍持有 read_bytes 返回的视图，映射在视图释放后自动关闭
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+        self.table = None
+        self.maps = []
+        self.views = []
+
+    def unpickle(self, data):
+        return RecordUnpickler(io.BytesIO(data), self).load()
+
+    def region(self, name, typecode=None):
+        # 把区域映射到内存（写时复制，修改不会写回镜像）；typecode 为 None 时返回字节映射
+        offset, length = self.superblock["regions"][name]
+        mapped = mmap.mmap(
+            self.file.fileno(), length, access=mmap.ACCESS_COPY, offset=offset
+        )
+        self.maps.append(mapped)
+        if typecode is None:
+            return mapped
+        view = memoryview(mapped).cast(typecode)
+        self.views.append(view)
+        return view
+
+    def read(self, offset, length):
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def read_region(self, name):
+        return self.read(*self.superblock["regions"][name])
+
+    def find_record(self, inode):
+        # 在按 inode 排序的下标中二分查找目录记录
+        order = self.table["record_order"]
+        inodes = self.table["record_inode"]
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if inodes[order[middle]] < inode:
+                low = middle + 1
+            else:
+                high = middle
+        if low == len(order) or inodes[order[low]] != inode:
+            raise KeyError(f"directory record {inode} not found")
+        return order[low]
+
+    def read_directory(self, inode):
+        position = self.find_record(inode)
+        return self.unpickle(
+            self.read(
+                self.table["record_offset"][position],
+                self.table["record_length"][position],
+            )
+        )
+
+    def load_directory(self, directory, inode):
+        children = self.read_directory(inode)
+        for child in children.values():
+            child.parent = directory
+        if self.on_directory_loaded is not None:
+            self.on_directory_loaded(children)
+        return children
+
+    def load_names(self):
+        # 返回 [(inode, 名字, 父目录 inode), ...]，镜像中没有名字记录时返回 None
+        names = self.superblock.get("names")
+        if names is None:
+            return None
+        return self.unpickle(self.read(*names))
+
+    def load_history(self):
+        history = self.superblock.get("history")
+        if history is None:
+            return {}
+        return self.unpickle(self.read(*history))
+
+    def copy_subtree(self, f, inode, table):
+        # 未加载的目录子树在镜像中是连续的一段记录，整段复制并平移偏移
+        first = self.find_record(inode)
+        last = first + self.table["record_span"][first] - 1
+        start = self.table["record_offset"][first]
+        end = self.table["record_offset"][last] + self.table["record_length"][last]
+        shift = f.tell() - start
+        self.file.seek(start)
+        remaining = end - start
+        while remaining:
+            data = self.file.read(min(COPY_CHUNK, remaining))
+            f.write(data)
+            remaining -= len(data)
+        for position in range(first, last + 1):
+            table["record_inode"].append(self.table["record_inode"][position])
+            table["record_offset"].append(self.table["record_offset"][position] + shift)
+            table["record_length"].append(self.table["record_length"][position])
+            table["record_span"].append(self.table["record_span"][position])
+
+
+def align(f):
+    f.write(bytes(-f.tell() % ALIGNMENT))
+
+
+def write_image(filename, state, root, history, regions, names=None):
+    # state 为超级块字段，history 为只被快照引用的 FCB，regions 为 {名字: 块表或数据区}，
+    # names 为所有目录项的 (inode, 名字, 父目录 inode)
+    fcb_class = root.__class__
+    # 已加载目录的索引在父目录的记录中写成引用，每个目录单独一条记录
+    directories = {}
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        children = directory.__dict__["children"]
+        if type(children) is LazyChildren:
+            continue
+        directories[id(children)] = directory.inode
+        stack.extend(child for child in children.values() if child.is_directory)
+
+    table = {name: array("Q") for name in TABLE_FIELDS[:-1]}
+    with open(filename, "wb") as f:
+        f.write(HEADER.pack(IMAGE_MAGIC, 0))
+        # 按先序写出目录记录，None 表示子树结束，回填子树中的记录数
+        stack = [(root, None)]
+        while stack:
+            directory, position = stack.pop()
+            if directory is None:
+                table["record_span"][position] = len(table["record_inode"]) - position
+                continue
+            children = directory.__dict__["children"]
+            if type(children) is LazyChildren:
+                children.image.copy_subtree(f, children.inode, table)
+                continue
+            position = len(table["record_inode"])
+            offset = f.tell()
+            members = {id(child) for child in children.values()}
+            RecordPickler(f, children, members, directories, fcb_class).dump(children)
+            table["record_inode"].append(directory.inode)
+            table["record_offset"].append(offset)
+            table["record_length"].append(f.tell() - offset)
+            table["record_span"].append(0)
+            stack.append((None, position))
+            stack.extend(
+                (child, None)
+                for child in reversed(list(children.values()))
+                if child.is_directory
+            )
+
+        history_region = None
+        if history:
+            offset = f.tell()
+            members = {id(fcb) for fcb in history.values()}
+            RecordPickler(f, history, members, directories, fcb_class).dump(history)
+            history_region = (offset, f.tell() - offset)
+
+        names_region = None
+        if names is not None:
+            offset = f.tell()
+            pickle.dump(names, f, protocol=pickle.HIGHEST_PROTOCOL)
+            names_region = (offset, f.tell() - offset)
+
+        inodes = table["record_inode"]
+        table["record_order"] = array(
+            "Q", sorted(range(len(inodes)), key=inodes.__getitem__)
+        )
+        regions = dict(regions, **table)
+        state = dict(
+            state, regions={}, history=history_region, names=names_region, root=root
+        )
+        for name, data in regions.items():
+            align(f)
+            offset = f.tell()
+            f.write(data)
+            state["regions"][name] = (offset, f.tell() - offset)
+
+        offset = f.tell()
+        RecordPickler(f, state, {id(root)}, directories, fcb_class).dump(state)
+        f.seek(0)
+        f.write(HEADER.pack(IMAGE_MAGIC, offset))
@@ -0,0 +1,572 @@
+import argparse
+import fcntl
+import json
+import os
+import selectors
+import socket
+import struct
+import time
+from collections import deque
+
+from events import WARNING
+from simple_file_system import FileSystem
+
+# 帧格式：负载长度 | 请求编号 | 帧类型 | 负载；请求和结果用 JSON，文件内容用原始字节
+FRAME = struct.Struct("<IIB")
+CALL = 1  # 客户端 -> 服务器：[操作名, 参数列表]
+DATA = 2  # 双向：读写流中的一段文件内容
+END = 3  # 客户端 -> 服务器：写入流结束
+RESULT = 4  # 服务器 -> 客户端：操作结果
+ERROR = 5  # 服务器 -> 客户端：错误信息
+MAX_FRAME = 16 * 1024 * 1024  # 单帧最大负载，超过则断开连接
+STREAM_CHUNK = 64 * 1024  # 读写流每帧的字节数
+HIGH_WATER = 1024 * 1024  # 待发送数据超过此值时暂停读取该连接的请求
+TICK_INTERVAL = 0.5  # 空闲时处理写回缓冲和快照块回收的间隔（秒）
+LIST_PAGE = 1000  # ls 每次返回的目录项数
+DEFAULT_SOCKET = "filesystem.sock"
+DEFAULT_VOLUME_SIZE = 1024 * 1024
+DEFAULT_BLOCK_SIZE = 1024
+UPLOAD_OPS = {"write"}  # 参数之后还有写入流的操作
+
+# 各操作参数允许的类型（按位置，精确匹配，bool 不算作 int），调用引擎前检查；
+# write 的第一个参数是上传的文件内容
+STR = (str,)
+OPTIONAL_STR = (str, type(None))
+INT = (int,)
+OPTIONAL_INT = (int, type(None))
+BOOL = (bool,)
+ARGUMENT_TYPES = {
+    "pwd": (),
+    "cd": (STR,),
+    "stat": (STR,),
+    "ls": (OPTIONAL_STR, OPTIONAL_STR, INT, OPTIONAL_STR),
+    "mkdir": (STR,),
+    "create": (STR, INT),
+    "delete": (STR,),
+    "rename": (STR, STR),
+    "move": (STR, STR),
+    "copy": (STR,),
+    "paste": (OPTIONAL_STR,),
+    "find": (STR, OPTIONAL_INT),
+    "search": (STR, BOOL),
+    "write": ((bytes,), STR, OPTIONAL_STR, BOOL),
+    "read": (STR, INT, OPTIONAL_INT),
+    "save": (),
+    "fsck": (BOOL,),
+    "snapshot": (STR,),
+    "snapshots": (),
+}
+
+
+class VolumeError(IOError):
+    # 服务器拒绝请求或操作失败
+    pass
+
+
+def encode_frame(kind, request_id, payload=b""):
+    return FRAME.pack(len(payload), request_id, kind) + payload
+
+
+def encode_json(value):
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def check_arguments(op, args):
+    # 返回参数问题的描述，没有问题时返回 None
+    types = ARGUMENT_TYPES[op]
+    if len(args) > len(types):
+        return f"expected at most {len(types)} arguments, got {len(args)}"
+    for position, (value, allowed) in enumerate(zip(args, types)):
+        if type(value) not in allowed:
+            return f"argument {position + 1} cannot be {type(value).__name__}"
+    return None
+
+
+def split_frames(buffer):
+    # 从接收缓冲中取出所有完整的帧，返回 [(请求编号, 类型, 负载), ...]
+    frames = []
+    start = 0
+    while len(buffer) - start >= FRAME.size:
+        length, request_id, kind = FRAME.unpack_from(buffer, start)
+        if length > MAX_FRAME:
+            raise VolumeError(f"frame of {length} bytes exceeds the limit")
+        end = start + FRAME.size + length
+        if end > len(buffer):
+            break
+        frames.append((request_id, kind, bytes(buffer[start + FRAME.size : end])))
+        start = end
+    del buffer[:start]
+    return frames
+
+
+class Connection:
+    # 一个客户端连接：收发缓冲、上传中的写入、进行中的读取流，以及它自己的当前目录和剪贴板
+    def __init__(self, sock, root):
+        self.sock = sock
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        self.uploads = {}  # 请求编号 -> (操作名, 参数, 已收到的数据)
+        self.streams = deque()  # (请求编号, 生成器)
+        self.cwd = root
+        self.clipboard = (None, None)
+
+    def send(self, kind, request_id, payload=b""):
+        self.outbox += encode_frame(kind, request_id, payload)
+
+
+class VolumeServer:
+    # 在 Unix 域套接字上提供一个卷：单线程事件循环，请求按到达顺序在引擎上执行，
+    # 同一连接可以连续发送多个请求而不等待结果，结果按请求编号区分
+    def __init__(self, fs, socket_path, filename=None):
+        self.fs = fs
+        self.socket_path = socket_path
+        self.filename = filename  # 保存镜像的位置，None 表示不保存
+        self.selector = selectors.DefaultSelector()
+        self.connections = {}
+        self.listener = None
+        self.lock = None
+        self.running = False
+        self.problems = []  # 当前请求执行期间引擎报告的警告和错误
+        fs.events.subscribe(self.problems.append, WARNING)
+
+    def open(self):
+        if self.filename is not None:
+            # 同一个镜像只能由一个服务器打开，避免两个进程互相覆盖保存的内容
+            self.lock = open(self.filename + ".lock", "w")
+            try:
+                fcntl.flock(self.lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self.lock.close()
+                self.lock = None
+                raise VolumeError(f"{self.filename} is in use by another server")
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.socket_path)
+        self.listener.listen(128)
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+
+    def close(self):
+        for conn in list(self.connections.values()):
+            self.drop(conn)
+        if self.listener is not None:
+            self.selector.unregister(self.listener)
+            self.listener.close()
+            self.listener = None
+            os.unlink(self.socket_path)
+        if self.filename is not None:
+            self.fs.save_to_disk(self.filename)
+        if self.lock is not None:
+            self.lock.close()
+            self.lock = None
+
+    def serve_forever(self):
+        self.running = True
+        next_tick = time.monotonic() + TICK_INTERVAL
+        while self.running:
+            busy = any(conn.streams for conn in self.connections.values())
+            timeout = 0 if busy else max(0, next_tick - time.monotonic())
+            for key, mask in self.selector.select(timeout):
+                if key.fileobj is self.listener:
+                    self.accept()
+                    continue
+                conn = key.data
+                if mask & selectors.EVENT_READ:
+                    self.receive(conn)
+                if mask & selectors.EVENT_WRITE and conn.sock.fileno() != -1:
+                    self.transmit(conn)
+            self.pump_streams()
+            if time.monotonic() >= next_tick:
+                self.fs.flush_writes(due_only=True)
+                self.fs.reclaim_step()
+                next_tick = time.monotonic() + TICK_INTERVAL
+
+    def stop(self):
+        self.running = False
+
+    def accept(self):
+        try:
+            sock, _ = self.listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        conn = Connection(sock, self.fs.root)
+        self.connections[sock.fileno()] = conn
+        self.selector.register(sock, selectors.EVENT_READ, conn)
+
+    def drop(self, conn):
+        self.connections.pop(conn.sock.fileno(), None)
+        self.selector.unregister(conn.sock)
+        conn.sock.close()
+
+    def update_interest(self, conn):
+        # 待发送的数据过多时不再读取新请求，客户端读取结果后再恢复
+        mask = selectors.EVENT_WRITE if conn.outbox else 0
+        if len(conn.outbox) < HIGH_WATER:
+            mask |= selectors.EVENT_READ
+        self.selector.modify(conn.sock, mask, conn)
+
+    def receive(self, conn):
+        try:
+            data = conn.sock.recv(STREAM_CHUNK * 4)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.drop(conn)
+            return
+        conn.inbox += data
+        try:
+            frames = split_frames(conn.inbox)
+        except VolumeError:
+            self.drop(conn)
+            return
+        for request_id, kind, payload in frames:
+            self.handle_frame(conn, request_id, kind, payload)
+        self.transmit(conn)
+
+    def transmit(self, conn):
+        if conn.outbox:
+            try:
+                sent = conn.sock.send(conn.outbox)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                self.drop(conn)
+                return
+            del conn.outbox[:sent]
+        self.update_interest(conn)
+
+    def handle_frame(self, conn, request_id, kind, payload):
+        if kind == CALL:
+            try:
+                op, args = json.loads(payload)
+            except (TypeError, ValueError):
+                op, args = None, None
+            if not isinstance(op, str) or not isinstance(args, list):
+                conn.send(ERROR, request_id, encode_json("malformed request"))
+                return
+            if op in UPLOAD_OPS:
+                conn.uploads[request_id] = (op, args, bytearray())
+            else:
+                self.execute(conn, request_id, op, args)
+        elif kind == DATA and request_id in conn.uploads:
+            conn.uploads[request_id][2].extend(payload)
+        elif kind == END and request_id in conn.uploads:
+            op, args, data = conn.uploads.pop(request_id)
+            self.execute(conn, request_id, op, [bytes(data)] + args)
+        else:
+            conn.send(ERROR, request_id, encode_json("unexpected frame"))
+
+    def execute(self, conn, request_id, op, args):
+        handler = getattr(self, "op_" + op, None)
+        if handler is None or op not in ARGUMENT_TYPES:
+            conn.send(ERROR, request_id, encode_json(f"unknown operation {op}"))
+            return
+        problem = check_arguments(op, args)
+        if problem is not None:
+            message = f"Bad arguments for {op}: {problem}"
+            conn.send(ERROR, request_id, encode_json(message))
+            return
+        self.problems.clear()
+        self.enter(conn)
+        try:
+            result = handler(conn, *args)
+        except (TypeError, ValueError) as e:
+            self.fs.events.warning(
+                "ipc.request", "Bad arguments for {op}: {error}", op=op, error=e
+            )
+            result = None
+        except Exception as e:
+            # 引擎中的意外错误只让本次请求失败，服务器继续为其他请求服务
+            self.fs.events.error("ipc.request", "{op} failed: {error}", op=op, error=e)
+            result = None
+        finally:
+            self.leave(conn)
+        if self.problems:
+            message = "\n".join(event.message for event in self.problems)
+            conn.send(ERROR, request_id, encode_json(message))
+        elif hasattr(result, "__next__"):
+            conn.streams.append((request_id, result))
+        else:
+            conn.send(RESULT, request_id, encode_json(result))
+
+    def enter(self, conn):
+        # 切换到该连接的当前目录和剪贴板；目录已被其他客户端删除时回到根目录
+        fs = self.fs
+        cwd = conn.cwd
+        if cwd is not fs.root and fs.name_index.get(cwd.inode) is not cwd:
+            conn.cwd = fs.root
+        fs.current_directory = conn.cwd
+        fs.copied_entry, fs.copied_payload = conn.clipboard
+
+    def leave(self, conn):
+        fs = self.fs
+        conn.cwd = fs.current_directory
+        conn.clipboard = (fs.copied_entry, fs.copied_payload)
+        fs.copied_entry, fs.copied_payload = None, None
+
+    def pump_streams(self):
+        # 每个连接每轮只发送每个读取流的一段，多个大文件的读取互不阻塞
+        for conn in list(self.connections.values()):
+            if not conn.streams or len(conn.outbox) >= HIGH_WATER:
+                continue
+            request_id, stream = conn.streams[0]
+            try:
+                kind, payload = next(stream)
+            except StopIteration:
+                conn.streams.popleft()
+                continue
+            except Exception as e:
+                # 读取出错（如校验和不匹配）时以错误结束该流
+                kind, payload = ERROR, encode_json(f"read failed: {e}")
+            conn.send(kind, request_id, payload)
+            if kind != DATA:
+                conn.streams.popleft()
+            self.transmit(conn)
+
+    def lookup(self, path):
+        fcb = self.fs.find_fcb_by_path(path)
+        if fcb is None:
+            self.fs.events.warning("ipc.lookup", "{path} not found.", path=path)
+        return fcb
+
+    def op_pwd(self, conn):
+        return self.fs.get_path(self.fs.current_directory)
+
+    def op_cd(self, conn, path):
+        if path == "..":
+            fcb = self.fs.current_directory.parent or self.fs.root
+        else:
+            fcb = self.lookup(path)
+        if fcb is not None and not fcb.is_directory:
+            self.fs.events.warning(
+                "directory.change", "{path} is not a directory.", path=path
+            )
+        elif fcb is not None:
+            self.fs.current_directory = fcb
+        return self.fs.get_path(self.fs.current_directory)
+
+    def op_stat(self, conn, path):
+        fcb = self.lookup(path)
+        if fcb is None:
+            return None
+        return {
+            "name": fcb.name,
+            "path": self.fs.get_path(fcb),
+            "is_directory": fcb.is_directory,
+            "size": fcb.size,
+            "inode": fcb.inode,
+            "blocks": 0 if fcb.is_directory else self.fs.count_blocks(fcb),
+        }
+
+    def op_ls(self, conn, path=None, cursor=None, limit=LIST_PAGE, pattern=None):
+        pager = self.fs.list_directory(path, limit, pattern, cursor)
+        if pager is None:
+            return None
+        entries = pager.next_page()
+        return {
+            "entries": [[name, fcb.is_directory, fcb.size] for name, fcb in entries],
+            "cursor": pager.cursor if pager.has_more else None,
+        }
+
+    def op_mkdir(self, conn, name):
+        self.fs.create_directory(name)
+
+    def op_create(self, conn, name, size=0):
+        self.fs.create_file(name, size)
+
+    def op_delete(self, conn, path):
+        self.fs.delete(path)
+
+    def op_rename(self, conn, path, new_name):
+        self.fs.rename(path, new_name)
+
+    def op_move(self, conn, src, dst_dir):
+        self.fs.move(src, dst_dir)
+
+    def op_copy(self, conn, path):
+        self.fs.copy_entry(path)
+
+    def op_paste(self, conn, target=None):
+        self.fs.paste_entry(target)
+
+    def op_find(self, conn, pattern, limit=None):
+        return self.fs.find(pattern, limit)
+
+    def op_search(self, conn, query, phrase=True):
+        return [path for path, _ in self.fs.search_content(query, phrase)]
+
+    def op_write(self, conn, data, path, compression=None, buffered=False):
+        if buffered:
+            self.fs.buffer_write(path, data, compression)
+        else:
+            self.fs.write_file(path, data, compression)
+
+    def op_read(self, conn, path, offset=0, length=None):
+        fcb = self.lookup(path)
+        if fcb is None:
+            return None
+        if fcb.is_directory:
+            self.fs.events.warning("file.read", "{path} is a directory.", path=path)
+            return None
+        self.fs.flush_file(fcb)
+        end = fcb.size if length is None else min(fcb.size, offset + length)
+        return self.read_stream(fcb, max(0, offset), end)
+
+    def read_stream(self, fcb, offset, end):
+        # 分段读取；其他客户端在读取过程中修改或删除了文件时以错误结束
+        version = fcb.version
+        start = offset
+        while offset < end:
+            if fcb.version != version or self.fs.name_index.get(fcb.inode) is not fcb:
+                yield ERROR, encode_json(f"{fcb.name} changed during the read.")
+                return
+            chunk = self.fs.read_fcb_range(fcb, offset, min(STREAM_CHUNK, end - offset))
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield DATA, chunk
+        yield RESULT, encode_json(offset - start)
+
+    def op_save(self, conn):
+        if self.filename is None:
+            self.fs.events.warning("image.save", "The server has no image file.")
+            return
+        self.fs.save_to_disk(self.filename)
+
+    def op_fsck(self, conn, repair=False):
+        return self.fs.fsck(repair).summary()
+
+    def op_snapshot(self, conn, name):
+        self.fs.create_snapshot(name)
+
+    def op_snapshots(self, conn):
+        return self.fs.list_snapshots()
+
+
+class VolumeClient:
+    # 客户端库：call() 发送请求并等待结果；submit() 只发送请求，之后用 result() 取结果，
+    # 可以一次发送多个请求（流水线），read()/iter_read() 和 write() 分段传输文件内容
+    def __init__(self, socket_path=DEFAULT_SOCKET):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.next_id = 1
+        self.buffer = bytearray()
+        self.pending = {}  # 请求编号 -> 已收到但尚未取走的帧
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, op, *args):
+        request_id = self.next_id
+        self.next_id += 1
+        self.sock.sendall(encode_frame(CALL, request_id, encode_json([op, list(args)])))
+        self.pending[request_id] = deque()
+        return request_id
+
+    def submit_write(self, path, data, compression=None, buffered=False):
+        # data 可以是字节串，也可以是逐段产生字节串的可迭代对象
+        request_id = self.submit("write", path, compression, buffered)
+        chunks = [data] if isinstance(data, (bytes, bytearray, memoryview)) else data
+        for chunk in chunks:
+            view = memoryview(chunk)
+            for start in range(0, len(view), STREAM_CHUNK):
+                piece = view[start : start + STREAM_CHUNK]
+                self.sock.sendall(FRAME.pack(len(piece), request_id, DATA))
+                self.sock.sendall(piece)
+        self.sock.sendall(encode_frame(END, request_id))
+        return request_id
+
+    def receive_frames(self):
+        while True:
+            frames = split_frames(self.buffer)
+            if frames:
+                for request_id, kind, payload in frames:
+                    self.pending.setdefault(request_id, deque()).append((kind, payload))
+                return
+            data = self.sock.recv(STREAM_CHUNK * 4)
+            if not data:
+                raise VolumeError("connection closed by the server")
+            self.buffer += data
+
+    def frames(self, request_id):
+        # 依次产生某个请求的帧，直到结果或错误；其他请求的帧留在 pending 中
+        queue = self.pending[request_id]
+        while True:
+            while not queue:
+                self.receive_frames()
+            kind, payload = queue.popleft()
+            if kind == DATA:
+                yield payload
+                continue
+            del self.pending[request_id]
+            if kind == ERROR:
+                raise VolumeError(json.loads(payload))
+            yield json.loads(payload)
+            return
+
+    def result(self, request_id):
+        *data, value = self.frames(request_id)
+        return b"".join(data) if data else value
+
+    def call(self, op, *args):
+        return self.result(self.submit(op, *args))
+
+    def iter_read(self, path, offset=0, length=None):
+        frames = self.frames(self.submit("read", path, offset, length))
+        for frame in frames:
+            if isinstance(frame, bytes):
+                yield frame
+
+    def read(self, path, offset=0, length=None):
+        return b"".join(self.iter_read(path, offset, length))
+
+    def write(self, path, data, compression=None, buffered=False):
+        return self.result(self.submit_write(path, data, compression, buffered))
+
+    def listdir(self, path=None, pattern=None):
+        # 逐页取出整个目录，返回 [(名字, 是否目录, 大小), ...]
+        entries = []
+        cursor = None
+        while True:
+            page = self.call("ls", path, cursor, LIST_PAGE, pattern)
+            entries.extend(tuple(entry) for entry in page["entries"])
+            cursor = page["cursor"]
+            if cursor is None:
+                return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a volume over a Unix socket.")
+    parser.add_argument("image", nargs="?", default="filesystem.dat")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    args = parser.parse_args()
+
+    fs = FileSystem(DEFAULT_VOLUME_SIZE, DEFAULT_BLOCK_SIZE)
+    if os.path.exists(args.image):
+        if not fs.load_from_disk(args.image):
+            parser.exit(1, f"Cannot load {args.image}.\n")
+    else:
+        fs.format()
+    server = VolumeServer(fs, args.socket, args.image)
+    server.open()
+    print(f"Serving {args.image} on {args.socket}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
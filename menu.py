@@ -1,80 +1,147 @@
-from PyQt5.QtWidgets import QAction
-
-
-def create_menu_bar(main_window):
-    menubar = main_window.menuBar()
-
-    # File Menu
-    file_menu = menubar.addMenu("File")
-
-    new_file_action = QAction("New File", main_window)
-    new_file_action.triggered.connect(
-        lambda: main_window.create_file_in_current_directory()
-    )
-    file_menu.addAction(new_file_action)
-
-    new_dir_action = QAction("New Directory", main_window)
-    new_dir_action.triggered.connect(
-        lambda: main_window.create_directory_in_current_directory()
-    )
-    file_menu.addAction(new_dir_action)
-
-    open_action = QAction("Open", main_window)
-    open_action.triggered.connect(lambda: main_window.open_entry())
-    file_menu.addAction(open_action)
-
-    save_action = QAction("Save", main_window)
-    save_action.triggered.connect(lambda: main_window.save_and_notify())
-    file_menu.addAction(save_action)
-
-    copy_action = QAction("Copy", main_window)
-    copy_action.triggered.connect(lambda: main_window.copy_entry(None))
-    file_menu.addAction(copy_action)
-
-    paste_action = QAction("Paste", main_window)
-    paste_action.triggered.connect(lambda: main_window.paste_entry())
-    file_menu.addAction(paste_action)
-
-    exit_action = QAction("Exit", main_window)
-    exit_action.triggered.connect(main_window.close)
-    file_menu.addAction(exit_action)
-
-    # Edit Menu
-    edit_menu = menubar.addMenu("Edit")
-
-    rename_action = QAction("Rename", main_window)
-    rename_action.triggered.connect(lambda: main_window.rename_entry())
-    edit_menu.addAction(rename_action)
-
-    delete_action = QAction("Delete", main_window)
-    delete_action.triggered.connect(
-        lambda: main_window.delete_entry(main_window.tree.currentItem())
-    )
-    edit_menu.addAction(delete_action)
-
-    # View Menu
-    view_menu = menubar.addMenu("View")
-
-    refresh_action = QAction("Refresh", main_window)
-    refresh_action.triggered.connect(lambda: main_window.refresh_view())
-    view_menu.addAction(refresh_action)
-
-    properties_action_view = QAction("Properties", main_window)
-    properties_action_view.triggered.connect(
-        lambda: main_window.show_properties(main_window.tree.currentItem())
-    )
-    view_menu.addAction(properties_action_view)
-
-    # Tools Menu
-    tools_menu = menubar.addMenu("Tools")
-
-    format_action = QAction("Format", main_window)
-    format_action.triggered.connect(lambda: main_window.format_disk())
-    tools_menu.addAction(format_action)
-
-    # Help Menu
-    help_menu = menubar.addMenu("Help")
-
-    about_action = QAction("About", main_window)
-    about_action.triggered.connect(lambda: main_window.show_about())
-    help_menu.addAction(about_action)
+from PyQt5.QtWidgets import QAction
+
+
+def create_menu_bar(main_window):
+    menubar = main_window.menuBar()
+
+    # File Menu
+    file_menu = menubar.addMenu("File")
+
+    new_file_action = QAction("New File", main_window)
+    new_file_action.triggered.connect(
+        lambda: main_window.create_file_in_current_directory()
+    )
+    file_menu.addAction(new_file_action)
+
+    new_dir_action = QAction("New Directory", main_window)
+    new_dir_action.triggered.connect(
+        lambda: main_window.create_directory_in_current_directory()
+    )
+    file_menu.addAction(new_dir_action)
+
+    open_action = QAction("Open", main_window)
+    open_action.triggered.connect(lambda: main_window.open_entry())
+    file_menu.addAction(open_action)
+
+    save_action = QAction("Save", main_window)
+    save_action.triggered.connect(lambda: main_window.save_and_notify())
+    file_menu.addAction(save_action)
+
+    copy_action = QAction("Copy", main_window)
+    copy_action.triggered.connect(lambda: main_window.copy_entry(None))
+    file_menu.addAction(copy_action)
+
+    paste_action = QAction("Paste", main_window)
+    paste_action.triggered.connect(lambda: main_window.paste_entry())
+    file_menu.addAction(paste_action)
+
+    exit_action = QAction("Exit", main_window)
+    exit_action.triggered.connect(main_window.close)
+    file_menu.addAction(exit_action)
+
+    # Edit Menu
+    edit_menu = menubar.addMenu("Edit")
+
+    rename_action = QAction("Rename", main_window)
+    rename_action.triggered.connect(lambda: main_window.rename_entry())
+    edit_menu.addAction(rename_action)
+
+    move_action = QAction("Move", main_window)
+    move_action.triggered.connect(lambda: main_window.move_entry())
+    edit_menu.addAction(move_action)
+
+    delete_action = QAction("Delete", main_window)
+    delete_action.triggered.connect(
+        lambda: main_window.delete_entry(main_window.tree.currentItem())
+    )
+    edit_menu.addAction(delete_action)
+
+    # View Menu
+    view_menu = menubar.addMenu("View")
+
+    refresh_action = QAction("Refresh", main_window)
+    refresh_action.triggered.connect(lambda: main_window.refresh_view())
+    view_menu.addAction(refresh_action)
+
+    properties_action_view = QAction("Properties", main_window)
+    properties_action_view.triggered.connect(
+        lambda: main_window.show_properties(main_window.tree.currentItem())
+    )
+    view_menu.addAction(properties_action_view)
+
+    disk_usage_action = QAction("Disk Usage", main_window)
+    disk_usage_action.triggered.connect(lambda: main_window.show_disk_usage())
+    view_menu.addAction(disk_usage_action)
+
+    block_map_action = QAction("Block Map", main_window)
+    block_map_action.triggered.connect(lambda: main_window.show_block_map())
+    view_menu.addAction(block_map_action)
+
+    # Tools Menu
+    tools_menu = menubar.addMenu("Tools")
+
+    format_action = QAction("Format", main_window)
+    format_action.triggered.connect(lambda: main_window.format_disk())
+    tools_menu.addAction(format_action)
+
+    fsck_action = QAction("Check File System", main_window)
+    fsck_action.triggered.connect(lambda: main_window.check_file_system())
+    tools_menu.addAction(fsck_action)
+
+    snapshot_menu = tools_menu.addMenu("Snapshots")
+
+    take_snapshot_action = QAction("Take Snapshot", main_window)
+    take_snapshot_action.triggered.connect(lambda: main_window.take_snapshot())
+    snapshot_menu.addAction(take_snapshot_action)
+
+    browse_snapshot_action = QAction("Browse Snapshot", main_window)
+    browse_snapshot_action.triggered.connect(lambda: main_window.browse_snapshot())
+    snapshot_menu.addAction(browse_snapshot_action)
+
+    rollback_snapshot_action = QAction("Rollback to Snapshot", main_window)
+    rollback_snapshot_action.triggered.connect(
+        lambda: main_window.rollback_snapshot()
+    )
+    snapshot_menu.addAction(rollback_snapshot_action)
+
+    delete_snapshot_action = QAction("Delete Snapshot", main_window)
+    delete_snapshot_action.triggered.connect(lambda: main_window.delete_snapshot())
+    snapshot_menu.addAction(delete_snapshot_action)
+
+    resize_action = QAction("Resize Volume", main_window)
+    resize_action.triggered.connect(lambda: main_window.resize_volume())
+    tools_menu.addAction(resize_action)
+
+    inline_action = QAction("Inline Threshold", main_window)
+    inline_action.triggered.connect(lambda: main_window.set_inline_threshold())
+    tools_menu.addAction(inline_action)
+
+    search_content_action = QAction("Search Content", main_window)
+    search_content_action.triggered.connect(lambda: main_window.search_content())
+    tools_menu.addAction(search_content_action)
+
+    compression_action = QAction("Volume Compression", main_window)
+    compression_action.triggered.connect(lambda: main_window.set_volume_compression())
+    tools_menu.addAction(compression_action)
+
+    allocation_action = QAction("Allocation Policy", main_window)
+    allocation_action.triggered.connect(lambda: main_window.set_allocation_policy())
+    tools_menu.addAction(allocation_action)
+
+    fragmentation_action = QAction("Fragmentation Report", main_window)
+    fragmentation_action.triggered.connect(lambda: main_window.show_fragmentation())
+    tools_menu.addAction(fragmentation_action)
+
+    # 默认关闭，打开时询问轨迹文件名
+    trace_action = QAction("Record Trace", main_window)
+    trace_action.setCheckable(True)
+    trace_action.toggled.connect(main_window.toggle_trace)
+    tools_menu.addAction(trace_action)
+    main_window.trace_action = trace_action
+
+    # Help Menu
+    help_menu = menubar.addMenu("Help")
+
+    about_action = QAction("About", main_window)
+    about_action.triggered.connect(lambda: main_window.show_about())
+    help_menu.addAction(about_action)
@@ -0,0 +1,110 @@
+import re
+from fnmatch import fnmatchcase
+
+GRAM_SIZE = 3
+GLOB_SPLIT = re.compile(r"\*|\?|\[[^\]]*\]")
+
+
+def name_grams(name):
+    return {name[i : i + GRAM_SIZE] for i in range(len(name) - GRAM_SIZE + 1)}
+
+
+class SavedName:
+    # 镜像中保存的目录项名字，用于查找尚未读入的目录项
+    __slots__ = ("inode", "name", "parent")
+
+    def __init__(self, inode, name, parent):
+        self.inode = inode
+        self.name = name
+        self.parent = parent  # 父目录的 inode
+
+
+class NameIndex:
+    # 全卷名字索引：inode -> FCB，名字 -> inode 集合，三元组 -> 名字集合
+    # 由创建、删除、重命名、粘贴增量维护，查找时无需遍历目录树
+    def __init__(self):
+        self.by_inode = {}
+        self.by_name = {}
+        self.grams = {}
+
+    @classmethod
+    def from_saved(cls, entries):
+        # entries 为镜像中保存的 (inode, 名字, 父目录 inode) 列表
+        index = cls()
+        for inode, name, parent in entries:
+            index.add(SavedName(inode, name, parent))
+        return index
+
+    def __len__(self):
+        return len(self.by_inode)
+
+    def get(self, inode):
+        return self.by_inode.get(inode)
+
+    def add(self, fcb):
+        self.by_inode[fcb.inode] = fcb
+        inodes = self.by_name.get(fcb.name)
+        if inodes is None:
+            inodes = self.by_name[fcb.name] = set()
+            for gram in name_grams(fcb.name):
+                self.grams.setdefault(gram, set()).add(fcb.name)
+        inodes.add(fcb.inode)
+
+    def remove(self, fcb, name=None):
+        # name 为索引中记录的名字，重命名时与 fcb.name 不同
+        name = fcb.name if name is None else name
+        self.by_inode.pop(fcb.inode, None)
+        inodes = self.by_name.get(name)
+        if inodes is None:
+            return
+        inodes.discard(fcb.inode)
+        if not inodes:
+            del self.by_name[name]
+            for gram in name_grams(name):
+                names = self.grams.get(gram)
+                if names is not None:
+                    names.discard(name)
+                    if not names:
+                        del self.grams[gram]
+
+    def add_tree(self, fcb):
+        stack = [fcb]
+        while stack:
+            entry = stack.pop()
+            self.add(entry)
+            if entry.is_directory:
+                stack.extend(entry.children.values())
+
+    def remove_tree(self, fcb):
+        stack = [fcb]
+        while stack:
+            entry = stack.pop()
+            self.remove(entry)
+            if entry.is_directory:
+                stack.extend(entry.children.values())
+
+    def rename(self, fcb, old_name):
+        self.remove(fcb, old_name)
+        self.add(fcb)
+
+    def candidate_names(self, pattern):
+        # 用模式中的字面片段的三元组缩小候选名字集合
+        if not GLOB_SPLIT.search(pattern):
+            return [pattern] if pattern in self.by_name else []
+        candidates = None
+        for fragment in GLOB_SPLIT.split(pattern):
+            for gram in name_grams(fragment):
+                names = self.grams.get(gram, set())
+                candidates = set(names) if candidates is None else candidates & names
+                if not candidates:
+                    return []
+        if candidates is None:
+            # 模式中没有足够长的字面片段，只能检查所有不同的名字
+            candidates = self.by_name.keys()
+        return [name for name in candidates if fnmatchcase(name, pattern)]
+
+    def find(self, pattern):
+        result = []
+        for name in self.candidate_names(pattern):
+            result.extend(self.by_inode[inode] for inode in self.by_name[name])
+        return result
@@ -1,416 +1,1860 @@
-import os
-import pickle
-import copy
-from PyQt5.QtWidgets import QMessageBox
-
-
-class FileControlBlock:
-    def __init__(self, name, is_directory, size=0, address=-1):
-        self.name = name
-        self.is_directory = is_directory
-        self.size = size
-        self.address = address
-        self.children = {}  # 字典，只有当 is_directory 为 True 时才有意义
-
-
-class FileSystem:
-    def __init__(self, size, block_size):
-        self.size = size
-        self.block_size = block_size
-        self.num_blocks = size // block_size
-        self.storage = bytearray(size)  # 存储器，存放文件数据
-        self.bitmap = [0] * self.num_blocks  # 位图，记录哪些块被占用
-        self.fat = [-1] * self.num_blocks  # FAT，记录每个块的下一个块号
-        self.root = FileControlBlock("root", True)
-        self.current_directory = self.root
-        self.copied_entry = None  # 是否有复制文件
-
-    def format(self):
-        self.storage = bytearray(self.size)
-        self.bitmap = [0] * self.num_blocks  # 0表示空闲，1表示已占用
-        self.fat = [-1] * self.num_blocks  # -1表示未分配
-        self.root = FileControlBlock("root", True)
-        self.current_directory = self.root
-        self.copied_entry = None
-        print("File system formatted.")
-
-    def save_to_disk(self, filename):
-        with open(filename, "wb") as f:
-            pickle.dump((self.storage, self.bitmap, self.fat, self.root), f)
-        print(f"File system saved to {filename}.")
-
-    def load_from_disk(self, filename):
-        if os.path.exists(filename):
-            try:  # 尝试加载文件系统
-                with open(filename, "rb") as f:
-                    self.storage, self.bitmap, self.fat, self.root = pickle.load(f)
-                    self.current_directory = self.root
-                print(f"File system loaded from {filename}.")
-            except (pickle.UnpicklingError, EOFError, AttributeError) as e:
-                print(f"Failed to load file system from {filename}: {str(e)}")
-                self.format()  # 重新格式化文件系统
-        else:
-            print(f"{filename} does not exist.")
-
-    def allocate_block(self):
-        for i in range(self.num_blocks):
-            if self.bitmap[i] == 0:
-                self.bitmap[i] = 1
-                return i
-        error_message = "No free blocks available."
-        print(error_message)
-        QMessageBox.warning(
-            None,
-            "Error",
-            error_message,
-        )
-        return -1
-
-    def free_block(self, block_num):
-        self.bitmap[block_num] = 0
-        self.fat[block_num] = -1
-
-    def create_file(self, name, size):
-        if name in self.current_directory.children:
-            print(f"File or directory {name} already exists.")
-            return
-        num_blocks_needed = (size + self.block_size - 1) // self.block_size  # 向上取整
-
-        # 检查是否有足够的空闲块
-        if self.bitmap.count(0) < num_blocks_needed:
-            error_message = f"Not enough space to create file {name}."
-            print(error_message)
-            QMessageBox.warning(
-                None,
-                "Error",
-                error_message,
-            )
-            return
-
-        blocks = []
-        try:
-            for _ in range(num_blocks_needed):
-                blocks.append(self.allocate_block())
-        except Exception as e:
-            for block in blocks:
-                self.free_block(block)
-            print(f"Failed to create file {name}: {str(e)}")
-            return
-        for i in range(num_blocks_needed - 1):
-            self.fat[blocks[i]] = blocks[i + 1]  # 链接各个块
-        self.fat[blocks[-1]] = -1  # 最后一个块指向 -1 表示结束
-        fcb = FileControlBlock(name, False, size, blocks[0])  # 创建文件控制块
-        self.current_directory.children[name] = fcb  # 加入当前目录
-        print(f"File {name} created.")
-
-    def clear_file_data(self, fcb):
-        block = fcb.address
-        while block != -1:
-            next_block = self.fat[block]  # 得到下一个块号
-            # 清空数据块
-            self.storage[block * self.block_size : (block + 1) * self.block_size] = (
-                bytearray(self.block_size)
-            )  # 将当前块的所有字节重置为 0（通过创建一个新的空字节数组 bytearray(self.block_size)）。
-            self.free_block(block)
-            block = next_block
-
-    def delete_file(self, name):
-        if name in self.current_directory.children:
-            fcb = self.current_directory.children[name]
-            if not fcb.is_directory:
-                # 如果复制的文件被删除，则清空剪贴板内容
-                if self.copied_entry and self.copied_entry.name == fcb.name:
-                    self.copied_entry = None
-                    error_message = (
-                        "Copied content cleared because the file is deleted."
-                    )
-                    print(error_message)
-                    QMessageBox.information(
-                        None,
-                        "Clipboard Cleared",
-                        error_message,
-                    )
-
-                block = fcb.address
-                while block != -1:
-                    next_block = self.fat[block]
-                    self.storage[
-                        block * self.block_size : (block + 1) * self.block_size
-                    ] = bytearray(self.block_size)
-                    self.free_block(block)
-                    block = next_block
-
-                del self.current_directory.children[name]
-                print(f"File {name} deleted.")
-            else:
-                print(f"{name} is not a file.")
-        else:
-            print(f"File {name} not found.")
-
-    def create_directory(self, name):
-        if name in self.current_directory.children:
-            print(f"File or directory {name} already exists.")
-            return
-        fcb = FileControlBlock(name, True)
-        self.current_directory.children[name] = fcb
-        print(f"Directory {name} created.")
-
-    def delete_directory(self, name):
-        if name in self.current_directory.children:
-            fcb = self.current_directory.children[name]
-            if fcb.is_directory:
-                # 检查剪贴板内容是否在将要删除的目录中
-                if self.copied_entry and self.is_fcb_in_directory(
-                    self.copied_entry, fcb
-                ):
-                    self.copied_entry = None
-                    error_message = (
-                        "Copied content cleared because the directory is deleted."
-                    )
-                    print(error_message)
-                    QMessageBox.information(
-                        None,
-                        "Clipboard Cleared",
-                        error_message,
-                    )
-
-                # 递归删除子目录和文件
-                for sub_entry in list(fcb.children.keys()):
-                    if fcb.children[sub_entry].is_directory:
-                        self.delete_directory(sub_entry)
-                    else:
-                        self.delete_file(sub_entry)
-
-                del self.current_directory.children[name]
-                print(f"Directory {name} and its contents deleted.")
-            else:
-                print(f"{name} is not a directory.")
-        else:
-            print(f"Directory {name} not found.")
-
-    def is_fcb_in_directory(self, fcb, directory):
-        # 判断文件控制块是否在目录中
-        if fcb in directory.children.values():
-            return True
-        for child in directory.children.values():
-            if child.is_directory and self.is_fcb_in_directory(fcb, child):
-                return True
-        return False
-
-    def change_directory(self, path):
-        if path == "..":
-            # 回到上一级目录
-            if self.current_directory.name != "root":
-                self.current_directory = self.root
-            else:
-                print("Already at the root directory.")
-        elif path in self.current_directory.children:
-            # 进入子目录
-            fcb = self.current_directory.children[path]
-            if fcb.is_directory:
-                self.current_directory = fcb
-                print(f"Changed directory to {path}.")
-            else:
-                print(f"{path} is not a directory.")
-        else:
-            print(f"Directory {path} not found.")
-
-    def open_file(self, path):
-        fcb = self.find_fcb_by_path(path)
-        if fcb and not fcb.is_directory:
-            fcb.is_open = True
-            print(f"File {path} opened.")
-        else:
-            print(f"File {path} not found or is a directory.")
-
-    def close_file(self, path):
-        fcb = self.find_fcb_by_path(path)
-        if fcb and not fcb.is_directory and hasattr(fcb, "is_open") and fcb.is_open:
-            fcb.is_open = False
-            print(f"File {path} closed.")
-        else:
-            print(f"File {path} is not open or is a directory.")
-
-    def write_file(self, path, data):
-        fcb = self.find_fcb_by_path(path)
-        if fcb is None:
-            print(f"File {path} not found.")
-            return
-
-        if fcb.is_directory:
-            print(f"{path} is a directory, cannot write to it.")
-            return
-
-        if not hasattr(fcb, "is_open") or not fcb.is_open:
-            self.open_file(path)
-
-        current_size = len(data)
-        num_blocks_needed = (current_size + self.block_size - 1) // self.block_size
-
-        # 检查是否有足够的空闲块
-        if self.bitmap.count(0) < num_blocks_needed:
-            error_message = f"Not enough space to write to file {path}."
-            print(error_message)
-            QMessageBox.warning(
-                None,
-                "Error",
-                error_message,
-            )
-            return
-
-        # 清空原有文件数据
-        self.clear_file_data(fcb)
-
-        blocks = []
-        try:
-            for _ in range(num_blocks_needed):
-                blocks.append(self.allocate_block())
-        except Exception as e:
-            for block in blocks:
-                self.free_block(block)
-            print(f"Failed to write to file {path}: {str(e)}")
-            return
-
-        for i in range(num_blocks_needed - 1):
-            # 链接各个块
-            self.fat[blocks[i]] = blocks[i + 1]
-        self.fat[blocks[-1]] = -1
-
-        fcb.address = blocks[0]
-        fcb.size = current_size
-
-        index = 0
-        block = fcb.address
-        while block != -1 and index < current_size:
-            end = min(index + self.block_size, current_size)
-            # 确保不超出数据的总大小 current_size。
-            self.storage[
-                block * self.block_size : block * self.block_size + end - index
-            ] = data[
-                index:end
-            ]  # 将当前块的数据写入到文件中。
-            index = end
-            block = self.fat[block]
-
-        print(f"Data written to file {path}.")
-        self.close_file(path)
-
-    def read_file(self, path):
-        fcb = self.find_fcb_by_path(path)
-        if fcb is None:
-            print(f"File {path} not found.")
-            return None
-
-        if fcb.is_directory:
-            print(f"{path} is a directory, cannot read from it.")
-            return None
-
-        if not hasattr(fcb, "is_open") or not fcb.is_open:
-            self.open_file(path)
-
-        data = bytearray()
-        block = fcb.address
-        bytes_left = fcb.size
-        while block != -1 and bytes_left > 0:
-            bytes_to_read = min(self.block_size, bytes_left)
-            data.extend(
-                self.storage[
-                    block * self.block_size : block * self.block_size + bytes_to_read
-                ]
-            )  # 将当前块的数据追加到 data 字节数组中。
-            bytes_left -= bytes_to_read
-            block = self.fat[block]
-
-        try:
-            # 去掉末尾的空字节！
-            data_str = data.decode("utf-8").rstrip("\x00")
-            print(f"Data read from file {path}: {data_str}")
-            return data_str
-        except (UnicodeDecodeError, Exception) as e:
-            print(f"Error decoding data from file {path}: {e}")
-            return None
-        finally:
-            self.close_file(path)
-
-    def list_directory(self):
-        for entry in self.current_directory.children:
-            print(entry)
-
-    def copy_entry(self, name):
-        fcb = self.find_fcb_by_path(name)
-        if fcb is None:
-            print(f"{name} not found.")
-            return
-
-        if fcb.is_directory:
-            error_message = "Cannot copy a directory. Only files can be copied."
-            print(error_message)
-            QMessageBox.warning(None, "Copy Error", error_message)
-            return
-
-        self.copied_entry = copy.deepcopy(fcb)
-        print(f"Copied {name}.")
-
-    def find_fcb_by_path(self, path):
-        # 解析路径，找到文件控制块
-        path_parts = path.strip("/").split("/")
-        fcb = self.root if path_parts[0] == "root" else self.current_directory
-        if path_parts[0] == "root":
-            fcb = self.root
-            path_parts.pop(0)
-        for part in path_parts:
-            if fcb.is_directory and part in fcb.children:
-                # 进入子目录
-                fcb = fcb.children[part]
-            else:
-                return None
-        return fcb
-
-    def paste_entry(self, target_dir_name=None):
-        if not self.copied_entry:
-            print("No entry to paste.")
-            QMessageBox.warning(
-                None,
-                "Paste Error",
-                "There is nothing to paste. Please copy a file or directory first.",
-            )
-            return
-
-        target_dir = self.current_directory
-        if target_dir_name:
-            target_dir = self.current_directory.children.get(
-                target_dir_name, self.current_directory
-            )  # 目标目录可能不存在，则使用当前目录
-
-        if target_dir is None or not target_dir.is_directory:
-            print("Invalid target directory.")
-            QMessageBox.warning(
-                None,
-                "Paste Error",
-                "The target directory is invalid or not a directory.",
-            )
-            return
-
-        new_name = self.copied_entry.name
-        base_name = new_name
-        count = 1
-        while new_name in target_dir.children:
-            # 重命名文件，使其不与已有文件重名
-            new_name = f"{base_name}({count})"
-            count += 1
-
-        new_entry = copy.deepcopy(self.copied_entry)
-        new_entry.name = new_name
-        target_dir.children[new_name] = new_entry
-        if new_entry.is_directory:
-            # 复制目录时，递归复制其所有子目录和文件
-            self._update_fcb_references(new_entry, target_dir)
-        print(f"Pasted {new_name}.")
-
-    def _update_fcb_references(self, fcb, parent):
-        # 更新文件控制块的父目录引用
-        for name, child in fcb.children.items():
-            if child.is_directory:
-                self._update_fcb_references(child, fcb)
-            else:
-                parent.children[name] = child
+import os
+import pickle
+import copy
+import uuid
+import zlib
+from array import array
+from compression import (
+    COMPRESSION_METHODS,
+    NO_COMPRESSION,
+    DEFAULT_CHUNK_SIZE,
+    compress_data,
+    decompress_chunk,
+    ChunkCache,
+)
+from directory_index import DirectoryIndex, DirectoryPager
+from name_index import NameIndex
+from content_index import ContentIndex, tokenize
+from snapshot import Snapshot, SnapshotView, capture_state, state_at
+from fsck import check_volume
+from file_cache import ContentCache, WriteBuffer
+from events import EventStream
+from allocator import (
+    ALLOCATION_POLICIES,
+    DEFAULT_POLICY,
+    FragmentationReport,
+    free_extents,
+    make_allocator,
+)
+from usage import Usage, VolumeUsage, compute_usage
+from image import ImageReader, LazyChildren, FcbRef, is_image, write_image
+
+IMAGE_VERSION = 3  # 镜像格式版本：1 为旧的元组格式，2 为 pickle 字典，3 为按需加载的分段格式
+DEFAULT_INLINE_THRESHOLD = 512  # 不超过该大小的文件直接存放在 FCB 中
+
+
+class ChecksumError(IOError):
+    # 读取数据块时校验和不匹配
+    pass
+
+
+class FileControlBlock:
+    # 旧镜像中反序列化出来的 FCB 没有以下属性，用类属性作为默认值
+    compression = None  # 文件的压缩设置：None 表示跟随卷设置，"none" 表示不压缩
+    codec = None  # 实际存储所用的压缩算法，None 表示按原样存储
+    chunks = None  # 压缩块表 [(偏移, 长度), ...]
+    chunk_size = 0  # 每个压缩块对应的逻辑字节数
+    inode = 0  # 卷内唯一编号，0 表示尚未分配
+    parent = None  # 父目录，不写入镜像，加载时重建
+    inline_data = None  # 小文件的内联数据，不为 None 时文件不占用数据块
+    _versions = None  # 快照引用的历史状态 [(快照时刻, 状态), ...]
+    _mod_epoch = 0  # 当前状态开始生效的时刻
+    version = 0  # 每次写入数据加一，用于判断缓存的内容是否过期
+    usage = None  # 目录子树的汇总（Usage），None 表示尚未计算
+    is_open = False
+
+    def __init__(self, name, is_directory, size=0, address=-1):
+        self.name = name
+        self.is_directory = is_directory
+        self.size = size  # 逻辑大小
+        self.address = address
+        self.children = DirectoryIndex()  # 有序目录索引，只有当 is_directory 为 True 时才有意义
+
+    @property
+    def children(self):
+        # 从按需加载的镜像中读出的目录，第一次访问时才读取其内容
+        children = self.__dict__["children"]
+        if type(children) is LazyChildren:
+            children = children.image.load_directory(self, children.inode)
+            self.__dict__["children"] = children
+        return children
+
+    @children.setter
+    def children(self, children):
+        self.__dict__["children"] = children
+
+    def __getstate__(self):
+        # 不保存父目录引用和打开状态，避免复制单个 FCB 时连带复制整棵目录树
+        state = self.__dict__.copy()
+        state.pop("parent", None)
+        state.pop("is_open", None)
+        return state
+
+
+class FileSystem:
+    def __init__(
+        self,
+        size,
+        block_size,
+        compression=None,
+        inline_threshold=DEFAULT_INLINE_THRESHOLD,
+        allocation=DEFAULT_POLICY,
+    ):
+        self._create_volume(size, block_size)
+        self.allocator = make_allocator(allocation)  # 块分配策略，按卷设置
+        self.root = FileControlBlock("root", True)
+        self.current_directory = self.root
+        self.copied_entry = None  # 是否有复制文件
+        self.copied_payload = None  # 复制时文件的存储数据，粘贴时写入新的块
+        self.verify_checksums = True  # 读取时校验数据块
+        self.next_inode = 1
+        self.epoch = 0  # 当前时刻，每创建一个快照加一
+        self.snapshots = []  # 按时刻排序的快照列表
+        self.reclaim_queue = []  # 删除快照后等待后台释放的块
+        self.image = ImageReader(self._directory_loaded)  # 当前映射的镜像文件
+        self.history = {}  # 只被快照引用的 FCB，None 表示还在镜像中未读取
+        self.fully_loaded = True  # 目录树是否已全部读入内存
+        self.needs_check = False  # 旧格式镜像加载后需要做一次一致性检查
+        self.name_index = NameIndex()  # 全卷名字索引，只包含已读入的目录项
+        self.saved_names = None  # 镜像中保存的名字索引，第一次查找时读取
+        self.content_index = ContentIndex()  # 文件内容索引，None 表示需要重建
+        self.saved_index = None  # 镜像旁保存的内容索引（路径, 镜像编号），第一次搜索时读取
+        self.stale_inodes = set()  # 读取保存的内容索引之前内容有变化的文件
+        self._prepare_tree()
+        self.compression = compression  # 卷默认压缩算法，None 表示不压缩
+        self.chunk_size = DEFAULT_CHUNK_SIZE
+        self.chunk_cache = ChunkCache()  # 已解压数据块缓存
+        self.content_cache = ContentCache()  # 已解码的文件内容缓存
+        self.write_buffer = WriteBuffer()  # 尚未写入数据块的文件内容
+        self.events = EventStream()  # 操作结果和错误通过事件流通知订阅者
+        self.inline_threshold = inline_threshold
+
+    def format(self, size=None, block_size=None):
+        # 格式化时可以指定新的卷大小和块大小，不指定则沿用原来的参数；
+        # 卷保存在内存中，内存不足时报告错误并保持原来的卷
+        size = size if size is not None else self.size
+        try:
+            self._create_volume(
+                size, block_size if block_size is not None else self.block_size
+            )
+        except MemoryError:
+            self.events.error(
+                "volume.format",
+                "Not enough memory for a {size}-byte volume.",
+                size=size,
+                title="Format Error",
+            )
+            return False
+        self.image.close()
+        self.root = FileControlBlock("root", True)
+        self.current_directory = self.root
+        self.copied_entry = None
+        self.allocator = make_allocator(self.allocator.name)
+        self.chunk_cache.clear()
+        self.content_cache.clear()
+        self.write_buffer.clear()
+        self.next_inode = 1
+        self.epoch = 0
+        self.snapshots = []
+        self.reclaim_queue = []
+        self.history = {}
+        self.fully_loaded = True
+        self.needs_check = False
+        self.content_index = ContentIndex()
+        self.saved_index = None
+        self._prepare_tree()
+        self.events.info("volume.format", "File system formatted.")
+        return True
+
+    def _create_volume(self, size, block_size):
+        # 先分配全部存储，内存不足时抛出 MemoryError，卷的状态不变
+        num_blocks = size // block_size
+        storage = bytearray(num_blocks * block_size)  # 存储器，存放文件数据
+        # 位图，记录哪些块被占用：0表示空闲，1表示已占用
+        bitmap = bytearray(num_blocks)
+        # FAT，记录每个块的下一个块号：-1表示未分配或链尾
+        fat = array("i", [-1]) * num_blocks
+        block_birth = array("I", [0]) * num_blocks  # 每个块被分配时的时刻
+        # 每个块的 CRC32 校验和，空闲块内容全为 0
+        zero_checksum = zlib.crc32(bytes(block_size))
+        checksums = array("I", [zero_checksum]) * num_blocks
+        self.block_size = block_size
+        self.num_blocks = num_blocks
+        self.size = num_blocks * block_size
+        self.storage = storage
+        self.bitmap = bitmap
+        self.fat = fat
+        self.block_birth = block_birth
+        self.zero_checksum = zero_checksum
+        self.checksums = checksums
+        self.free_count = num_blocks  # 空闲块数量
+
+    def resize(self, new_size):
+        # 在线调整卷大小：在末尾扩展或截去存储器、位图和 FAT，已有文件数据保持原位
+        new_blocks = new_size // self.block_size
+        if new_blocks < 1:
+            self.events.warning(
+                "volume.resize", "Volume must contain at least one block."
+            )
+            return False
+        if new_blocks < self.num_blocks and self.bitmap.find(1, new_blocks) != -1:
+            self.events.warning(
+                "volume.resize",
+                "Cannot shrink volume: blocks beyond the new end are in use.",
+            )
+            return False
+        extra = new_blocks - self.num_blocks
+        try:
+            # 块表较小，先复制；数据区最后一步才替换或扩展，内存不足时卷保持不变
+            self._materialize()
+            self._resize_storage(new_blocks)
+        except MemoryError:
+            self.events.error(
+                "volume.resize",
+                "Not enough memory to grow the volume to {size} bytes.",
+                size=new_blocks * self.block_size,
+                title="Resize Error",
+            )
+            return False
+        if new_blocks < self.num_blocks:
+            del self.bitmap[new_blocks:]
+            del self.fat[new_blocks:]
+            del self.block_birth[new_blocks:]
+            del self.checksums[new_blocks:]
+        else:
+            self.bitmap.extend(bytes(extra))
+            self.fat.extend(array("i", [-1]) * extra)
+            self.block_birth.extend(array("I", [0]) * extra)
+            self.checksums.extend(array("I", [self.zero_checksum]) * extra)
+        self.free_count += new_blocks - self.num_blocks
+        self.num_blocks = new_blocks
+        self.size = new_blocks * self.block_size
+        self.events.info(
+            "volume.resize",
+            "Volume resized to {size} bytes ({new_blocks} blocks).",
+            size=self.size,
+            new_blocks=new_blocks,
+        )
+        return True
+
+    def _resize_storage(self, num_blocks):
+        # 内存中的数据区原地扩展或截断；映射自镜像的，或者调用方仍持有 read_bytes
+        # 返回的视图而不能改变长度的，复制出新的数据区，原来的视图仍然可以读取
+        if type(self.storage) is bytearray:
+            try:
+                self._resize_in_place(num_blocks)
+                return
+            except BufferError:
+                pass
+        self.storage = self._materialize_storage(num_blocks)
+        self._resize_in_place(num_blocks)
+
+    def _resize_in_place(self, num_blocks):
+        length = num_blocks * self.block_size
+        if length < len(self.storage):
+            del self.storage[length:]
+        elif length > len(self.storage):
+            self.storage.extend(bytes(length - len(self.storage)))
+
+    def _materialize_storage(self, num_blocks):
+        # 把数据区复制为新的 bytearray，缩小时只复制保留的部分
+        length = min(num_blocks, self.num_blocks) * self.block_size
+        with memoryview(self.storage) as view, view[:length] as kept:
+            return bytearray(kept)
+
+    def _materialize(self):
+        # 把映射自镜像的块表复制到内存中，以便改变它们的长度；已在内存中的保持不变
+        if type(self.fat) is memoryview:
+            self.fat = array("i", self.fat.tobytes())
+        if type(self.checksums) is memoryview:
+            self.checksums = array("I", self.checksums.tobytes())
+        if type(self.block_birth) is memoryview:
+            self.block_birth = array("I", self.block_birth.tobytes())
+
+    def _map_regions(self):
+        # 数据区和块表通过内存映射按页读入，位图较小，直接读入内存
+        self.storage = self.image.region("storage")
+        self.fat = self.image.region("fat", "i")
+        self.checksums = self.image.region("checksums", "I")
+        self.block_birth = self.image.region("block_birth", "I")
+
+    def save_to_disk(self, filename):
+        self.flush_writes()
+        image_id = uuid.uuid4().hex  # 每次保存生成新编号，用于匹配内容索引文件
+        state = {
+            "version": IMAGE_VERSION,
+            "image_id": image_id,
+            "size": self.size,
+            "block_size": self.block_size,
+            "compression": self.compression,
+            "chunk_size": self.chunk_size,
+            "next_inode": self.next_inode,
+            "inline_threshold": self.inline_threshold,
+            "epoch": self.epoch,
+            "snapshots": self.snapshots,
+            "reclaim_queue": self.reclaim_queue,
+            "free_count": self.free_count,
+            "allocation": self.allocator.name,
+        }
+        regions = {
+            "bitmap": self.bitmap,
+            "fat": self.fat,
+            "checksums": self.checksums,
+            "block_birth": self.block_birth,
+            "storage": self.storage,
+        }
+        # 先写到临时文件，未读入的目录记录从旧镜像中原样复制
+        temp = filename + ".tmp"
+        names = self._name_entries()
+        write_image(temp, state, self.root, self._history_entries(), regions, names)
+        # 替换旧镜像前关闭对它的映射（Windows 上不能替换仍被映射的文件），然后映射新镜像
+        self.image.close()
+        os.replace(temp, filename)
+        self.image.open(filename)
+        self._map_regions()
+        self.saved_names = None
+        if self.saved_index is not None:
+            self._load_saved_index()
+        if self.content_index is not None:
+            self.content_index.save(filename + ".idx", image_id)
+        self.events.info(
+            "image.save", "File system saved to {filename}.", filename=filename
+        )
+
+    def _name_entries(self):
+        # 所有目录项的 (inode, 名字, 父目录 inode)；未读入的子树取自原镜像中保存的名字，
+        # 原镜像没有名字记录时返回 None，下次查找时再读入整棵目录树
+        entries = []
+        below = None  # 原镜像中的目录项，按父目录 inode 分组
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            children = directory.__dict__["children"]
+            if type(children) is LazyChildren:
+                if children.image is not self.image:
+                    return None  # 来自其他镜像的目录，没有对应的名字记录
+                if below is None:
+                    saved = self._saved_name_index()
+                    if saved is None:
+                        return None
+                    below = {}
+                    for entry in saved.by_inode.values():
+                        below.setdefault(entry.parent, []).append(entry)
+                pending = [directory.inode]
+                while pending:
+                    for entry in below.get(pending.pop(), ()):
+                        entries.append((entry.inode, entry.name, entry.parent))
+                        pending.append(entry.inode)
+                continue
+            for child in children.values():
+                entries.append((child.inode, child.name, directory.inode))
+                if child.is_directory:
+                    stack.append(child)
+        return entries
+
+    def _history_entries(self):
+        # 找出已不在目录树中、只被历史版本引用的 FCB，它们单独保存在镜像的历史记录中
+        live = set()
+        pending = []
+        stack = [self.root]
+        while stack:
+            fcb = stack.pop()
+            live.add(id(fcb))
+            pending.append(fcb)
+            children = fcb.__dict__["children"]
+            if type(children) is not LazyChildren:
+                stack.extend(children.values())
+        if self.history is None:
+            self.history = self.image.load_history()
+        # 目录树没有全部读入时，未读入的目录可能还引用着原有的历史记录，全部保留
+        history = {} if self.fully_loaded else dict(self.history)
+        pending.extend(history.values())
+        while pending:
+            fcb = pending.pop()
+            referenced = [
+                child
+                for _, state in fcb._versions or ()
+                for child in state.get("children", {}).values()
+            ]
+            if id(fcb) not in live:
+                referenced.extend(fcb.children.values())
+            for child in referenced:
+                if (
+                    type(child) is FileControlBlock
+                    and id(child) not in live
+                    and child.inode not in history
+                ):
+                    history[child.inode] = child
+                    pending.append(child)
+        self.history = history
+        return history
+
+    def load_from_disk(self, filename):
+        if not os.path.exists(filename):
+            self.events.warning(
+                "image.load", "{filename} does not exist.", filename=filename
+            )
+            return False
+        try:  # 尝试加载文件系统
+            if is_image(filename):
+                state = self._open_image(filename)
+            else:
+                state = self._unpickle_image(filename)
+        except (
+            pickle.UnpicklingError,
+            EOFError,
+            AttributeError,
+            KeyError,
+            ValueError,
+            OSError,
+        ) as e:
+            # 不再自动格式化，避免覆盖可能还能修复的镜像，由调用方决定如何处理
+            self.events.error(
+                "image.load",
+                "Failed to load file system from {filename}: {error}",
+                filename=filename,
+                error=str(e),
+            )
+            return False
+        self.compression = state.get("compression")
+        self.chunk_size = state.get("chunk_size", DEFAULT_CHUNK_SIZE)
+        self.inline_threshold = state.get("inline_threshold", DEFAULT_INLINE_THRESHOLD)
+        self.epoch = state.get("epoch", 0)
+        self.snapshots = state.get("snapshots", [])
+        self.reclaim_queue = state.get("reclaim_queue", [])
+        self.allocator = make_allocator(state.get("allocation", DEFAULT_POLICY))
+        # 内容索引与镜像分开保存，第一次搜索时才读取，缺失或不匹配时重建
+        self.content_index = None
+        self.saved_index = None
+        self.stale_inodes = set()
+        if "image_id" in state:
+            self.saved_index = (filename + ".idx", state["image_id"])
+        self.current_directory = self.root
+        self.copied_entry = None
+        self.chunk_cache.clear()
+        self.content_cache.clear()
+        self.write_buffer.clear()
+        self.events.info(
+            "image.load", "File system loaded from {filename}.", filename=filename
+        )
+        return True
+
+    def _open_image(self, filename):
+        # 按需加载的镜像：只读超级块，根目录和子目录在第一次访问时读取
+        image = ImageReader(self._directory_loaded)
+        state = image.open(filename)
+        bitmap = bytearray(image.read_region("bitmap"))
+        self.image.close()
+        self.image = image
+        self._map_regions()
+        self.bitmap = bitmap
+        self.block_size = state["block_size"]
+        self.size = state["size"]
+        self.num_blocks = self.size // self.block_size
+        self.free_count = state["free_count"]
+        self.zero_checksum = zlib.crc32(bytes(self.block_size))
+        self.next_inode = state["next_inode"]
+        self.root = state["root"]
+        self.root.parent = None
+        self.history = None
+        self.fully_loaded = False
+        self.needs_check = False
+        self.name_index = NameIndex()
+        self.saved_names = None
+        self.name_index.add(self.root)
+        return state
+
+    def _unpickle_image(self, filename):
+        # 旧格式镜像整体反序列化，加载后全部在内存中
+        with open(filename, "rb") as f:
+            state = pickle.load(f)
+        self.image.close()
+        if isinstance(state, tuple):
+            # 旧格式：(storage, bitmap, fat, root)
+            self.storage, self.bitmap, self.fat, self.root = state
+            self.block_size = len(self.storage) // len(self.bitmap)
+            state = {}
+        else:
+            self.storage = state["storage"]
+            self.bitmap = state["bitmap"]
+            self.fat = state["fat"]
+            self.root = state["root"]
+            self.block_size = state["block_size"]
+        self.next_inode = state.get("next_inode", 1)
+        self.history = {}
+        self.fully_loaded = True
+        self.needs_check = True
+        self._prepare_tree()
+        # 旧镜像中位图和 FAT 是列表，转换为紧凑的 bytearray 和 array
+        self.bitmap = bytearray(self.bitmap)
+        self.fat = array("i", self.fat)
+        self.size = len(self.storage)
+        self.num_blocks = len(self.bitmap)
+        self.block_birth = state.get("block_birth") or (
+            array("I", [0]) * self.num_blocks
+        )
+        self.free_count = self.bitmap.count(0)
+        self.zero_checksum = zlib.crc32(bytes(self.block_size))
+        self.checksums = state.get("checksums") or array(
+            "I",
+            (self.block_checksum(block) for block in range(self.num_blocks)),
+        )
+        return state
+
+    def _directory_loaded(self, children):
+        # 目录内容从镜像读入后加入名字索引
+        for child in children.values():
+            self.name_index.add(child)
+
+    def load_all(self):
+        # 把镜像中尚未读入的目录和历史记录全部读入，并把历史版本中的引用换成对象
+        if self.fully_loaded:
+            return
+        stack = [self.root]
+        while stack:
+            stack.extend(stack.pop().children.values())
+        if self.history is None:
+            self.history = self.image.load_history()
+        fcbs = dict(self.history)
+        fcbs.update(self.name_index.by_inode)
+        for fcb in list(fcbs.values()):
+            for _, state in fcb._versions or ():
+                self._resolve_refs(state.get("children"), fcbs)
+            if fcb.inode in self.history:
+                self._resolve_refs(fcb.children, fcbs)
+        self.fully_loaded = True
+
+    def _resolve_refs(self, children, fcbs):
+        for name, child in list((children or {}).items()):
+            if type(child) is FcbRef:
+                children[name] = fcbs[child.inode]
+
+    def _prepare_tree(self):
+        # 重建父目录引用和名字索引；旧镜像中目录的 children 是普通字典，
+        # 转换为有序目录索引，并为没有 inode 的 FCB 分配编号
+        self.name_index = NameIndex()
+        self.root.parent = None
+        stack = [self.root]
+        while stack:
+            fcb = stack.pop()
+            if not isinstance(fcb.children, DirectoryIndex):
+                fcb.children = DirectoryIndex(fcb.children)
+            if not fcb.inode or fcb.inode in self.name_index.by_inode:
+                fcb.inode = self.new_inode()
+            self.next_inode = max(self.next_inode, fcb.inode + 1)
+            self.name_index.add(fcb)
+            for child in fcb.children.values():
+                child.parent = fcb
+                stack.append(child)
+        compute_usage(self.root, self._file_usage, reuse=False)
+
+    def new_inode(self):
+        inode = self.next_inode
+        self.next_inode += 1
+        return inode
+
+    def attach_entry(self, directory, name, fcb):
+        # 把 FCB（可以是整棵子树）挂到目录下，为新子树分配 inode 并加入名字索引
+        self._preserve(directory)
+        fcb.name = name
+        fcb.parent = directory
+        directory.children[name] = fcb
+        stack = [fcb]
+        while stack:
+            entry = stack.pop()
+            entry.inode = self.new_inode()
+            # 新项目不属于任何已有快照，去掉从被复制项目带来的历史状态
+            entry.__dict__.pop("_versions", None)
+            entry._mod_epoch = self.epoch
+            self.name_index.add(entry)
+            for child in entry.children.values():
+                child.parent = entry
+                stack.append(child)
+        if fcb.is_directory:
+            compute_usage(fcb, self._file_usage, reuse=False)
+        self._adjust_usage(directory, self._entry_usage(fcb))
+
+    def detach_entry(self, directory, name):
+        # 把目录项从目录中摘下，并从名字索引中删除整棵子树
+        self._preserve(directory)
+        self._adjust_usage(directory, self._entry_usage(directory.children[name]), -1)
+        fcb = directory.children.pop(name)
+        self.name_index.remove_tree(fcb)
+        self._unindex_content(fcb)
+        fcb.parent = None
+        return fcb
+
+    def paste_as(self, target_dir, new_name):
+        # 把剪贴板中的项目复制一份粘贴到目标目录，数据写入新分配的块，不与原文件共用块链
+        new_entry = copy.deepcopy(self.copied_entry)
+        if new_entry.address != -1:
+            payload = self.copied_payload or b""
+            if self.free_count < self.blocks_needed(len(payload)):
+                self.events.warning(
+                    "entry.paste",
+                    "Not enough space to paste {new_name}.",
+                    new_name=new_name,
+                )
+                return None
+            new_entry.address = self._store_payload(payload, target_dir)
+        self.attach_entry(target_dir, new_name, new_entry)
+        self._index_content(new_entry)
+        return new_entry
+
+    def _index_content(self, fcb):
+        if fcb.is_directory:
+            return
+        if self.content_index is None:
+            if self.saved_index is not None:
+                self.stale_inodes.add(fcb.inode)
+            return
+        data = self.read_fcb_range(fcb, 0, fcb.size)
+        self.content_index.index_file(
+            fcb.inode, data.decode("utf-8", errors="ignore").rstrip("\x00")
+        )
+
+    def _unindex_content(self, fcb):
+        if self.content_index is None and self.saved_index is None:
+            return
+        stack = [fcb]
+        while stack:
+            entry = stack.pop()
+            if self.content_index is None:
+                self.stale_inodes.add(entry.inode)
+            else:
+                self.content_index.remove_file(entry.inode)
+            stack.extend(entry.children.values())
+
+    def _load_saved_index(self):
+        # 读取镜像旁保存的内容索引，再更新读取前内容有变化的文件
+        filename, image_id = self.saved_index
+        stale, self.stale_inodes = self.stale_inodes, set()
+        self.saved_index = None
+        self.content_index = ContentIndex.load(filename, image_id)
+        if self.content_index is None:
+            return
+        for inode in stale:
+            self.content_index.remove_file(inode)
+            fcb = self.name_index.get(inode)
+            if fcb is not None:
+                self._index_content(fcb)
+
+    def ensure_name_index(self):
+        # 名字索引只包含已读入的目录项，全卷查找前先读入整个目录树
+        self.load_all()
+        return self.name_index
+
+    def _saved_name_index(self):
+        if self.saved_names is None:
+            entries = self.image.load_names()
+            if entries is not None:
+                self.saved_names = NameIndex.from_saved(entries)
+        return self.saved_names
+
+    def find_entries(self, pattern):
+        # 按名字查找，返回 FCB 列表；目录树未全部读入时用镜像中保存的名字定位，
+        # 只读入匹配项所在的目录，读入后的目录项都在名字索引中
+        saved = None if self.fully_loaded else self._saved_name_index()
+        if saved is None:
+            return self.ensure_name_index().find(pattern)
+        for entry in saved.find(pattern):
+            if self.name_index.get(entry.inode) is None:
+                self._load_saved_path(saved, entry)
+        return self.name_index.find(pattern)
+
+    def _load_saved_path(self, saved, entry):
+        # 沿保存的父目录向上找到已读入的目录，再逐级读入到该目录项；
+        # 该目录的内容若已读入，说明此项已被删除或移走
+        names = []
+        while True:
+            names.append(entry.name)
+            directory = self.name_index.get(entry.parent)
+            if directory is not None:
+                break
+            entry = saved.get(entry.parent)
+            if entry is None:
+                return
+        if type(directory.__dict__["children"]) is not LazyChildren:
+            return
+        for name in reversed(names[1:]):
+            directory = directory.children.get(name)
+            if directory is None:
+                return
+        directory.children  # 读入匹配项所在的目录
+
+    def ensure_content_index(self):
+        # 内容索引缺失时读取所有文件重建
+        self.load_all()
+        self.flush_writes()
+        if self.saved_index is not None:
+            self._load_saved_index()
+        if self.content_index is None:
+            self.content_index = ContentIndex()
+            for fcb in list(self.name_index.by_inode.values()):
+                self._index_content(fcb)
+            self.events.info("index.rebuild", "Content index rebuilt.")
+        return self.content_index
+
+    def search_content(self, query, phrase=True):
+        # 返回 [(路径, [字节偏移, ...]), ...]；phrase 为 False 时查找包含所有词的文件
+        index = self.ensure_content_index()
+        if phrase:
+            matches = index.search_phrase(query)
+        else:
+            matches = index.search_all(term for term, _, _ in tokenize(query))
+        return sorted(
+            (self.get_path(self.name_index.get(inode)), offsets)
+            for inode, offsets in matches.items()
+        )
+
+    def _check_name(self, kind, name):
+        # 名字不能为空，不能包含路径分隔符，也不能是 . 或 ..，否则无法按路径访问
+        if name and "/" not in name and name not in (".", ".."):
+            return True
+        self.events.warning(kind, "Invalid name {new_name}.", new_name=name)
+        return False
+
+    def rename_fcb(self, fcb, new_name):
+        directory = fcb.parent
+        if directory is None:
+            self.events.warning("entry.rename", "Cannot rename the root directory.")
+            return False
+        if not self._check_name("entry.rename", new_name):
+            return False
+        if new_name in directory.children:
+            self.events.warning(
+                "entry.rename",
+                "File or directory {new_name} already exists.",
+                new_name=new_name,
+            )
+            return False
+        old_name = fcb.name
+        self._preserve(directory)
+        self._preserve(fcb)
+        del directory.children[old_name]
+        fcb.name = new_name
+        directory.children[new_name] = fcb
+        self.name_index.rename(fcb, old_name)
+        self.events.info(
+            "entry.rename",
+            "Renamed {old_name} to {new_name}.",
+            old_name=old_name,
+            new_name=new_name,
+        )
+        return True
+
+    def get_path(self, fcb):
+        # 沿父目录引用得到完整路径
+        parts = []
+        while fcb.parent is not None:
+            parts.append(fcb.name)
+            fcb = fcb.parent
+        return "/root/" + "/".join(reversed(parts))
+
+    def _file_usage(self, fcb):
+        return Usage(1, 0, fcb.size, self.blocks_needed(self._stored_bytes(fcb)))
+
+    def _entry_usage(self, fcb):
+        # 一个目录项对父目录汇总的贡献：文件本身，或目录自身加上它的整个子树
+        if not fcb.is_directory:
+            return self._file_usage(fcb)
+        usage = compute_usage(fcb, self._file_usage).copy()
+        usage.directories += 1
+        return usage
+
+    def _adjust_usage(self, directory, delta, sign=1):
+        # 沿父目录链更新汇总，时间与目录深度成正比；尚未计算汇总的目录在查询时再计算
+        while directory is not None:
+            if directory.usage is not None:
+                directory.usage.add(delta, sign)
+            directory = directory.parent
+
+    def du(self, path):
+        # 返回文件或目录子树的汇总（Usage），目录的结果不含目录自身
+        fcb = self.find_fcb_by_path(path)
+        if fcb is None:
+            self.events.warning("volume.usage", "{path} not found.", path=path)
+            return None
+        self.flush_writes()
+        if not fcb.is_directory:
+            return self._file_usage(fcb)
+        return compute_usage(fcb, self._file_usage).copy()
+
+    def df(self):
+        self.flush_writes()
+        return VolumeUsage(self, compute_usage(self.root, self._file_usage))
+
+    def find(self, pattern, limit=None):
+        # 按名字（支持通配符）在整个卷中查找，返回路径列表
+        paths = sorted(
+            self.get_path(fcb) for fcb in self.find_entries(pattern)
+        )
+        return paths if limit is None else paths[:limit]
+
+    def _preserve(self, fcb):
+        # 修改 FCB 之前调用：若当前状态仍被快照引用，先把它保存为历史版本
+        if not self.snapshots or fcb._mod_epoch > self.snapshots[-1].epoch:
+            return
+        if fcb._versions is None:
+            fcb._versions = []
+        fcb._versions.append((self.snapshots[-1].epoch, capture_state(fcb)))
+        fcb._mod_epoch = self.epoch
+
+    def create_snapshot(self, name):
+        # O(1) 创建快照：只记录当前时刻，之后的修改按写时复制保留旧的块和元数据
+        if self.find_snapshot(name) is not None:
+            self.events.warning(
+                "snapshot.create", "Snapshot {name} already exists.", name=name
+            )
+            return None
+        self.flush_writes()
+        snapshot = Snapshot(name, self.epoch)
+        self.snapshots.append(snapshot)
+        self.epoch += 1
+        self.events.info("snapshot.create", "Snapshot {name} created.", name=name)
+        return snapshot
+
+    def find_snapshot(self, name):
+        for snapshot in self.snapshots:
+            if snapshot.name == name:
+                return snapshot
+        return None
+
+    def list_snapshots(self):
+        return [snapshot.name for snapshot in self.snapshots]
+
+    def snapshot_view(self, name):
+        snapshot = self.find_snapshot(name)
+        if snapshot is None:
+            self.events.warning(
+                "snapshot.view", "Snapshot {name} not found.", name=name
+            )
+            return None
+        self.load_all()
+        self.flush_writes()
+        return SnapshotView(self, snapshot)
+
+    def delete_snapshot(self, name):
+        # 死亡列表中仍被更早快照引用的块移交给前一个快照，其余交给后台释放
+        snapshot = self.find_snapshot(name)
+        if snapshot is None:
+            self.events.warning(
+                "snapshot.delete", "Snapshot {name} not found.", name=name
+            )
+            return False
+        index = self.snapshots.index(snapshot)
+        previous = self.snapshots[index - 1] if index > 0 else None
+        for block in snapshot.deadlist:
+            if previous is not None and self.block_birth[block] <= previous.epoch:
+                previous.deadlist.append(block)
+            else:
+                self.reclaim_queue.append(block)
+        del self.snapshots[index]
+        self.prune_versions()
+        self.events.info("snapshot.delete", "Snapshot {name} deleted.", name=name)
+        return True
+
+    def reclaim_step(self, limit=4096):
+        # 后台释放删除快照后不再被引用的块，每次最多处理 limit 个，返回剩余数量
+        if self.reclaim_queue:
+            blocks = self.reclaim_queue[-limit:]
+            del self.reclaim_queue[-limit:]
+            self._free_blocks(blocks)
+        return len(self.reclaim_queue)
+
+    def prune_versions(self):
+        # 删除没有快照再引用的历史版本
+        self.load_all()
+        epochs = [snapshot.epoch for snapshot in self.snapshots]
+        stack = [self.root]
+        while stack:
+            fcb = stack.pop()
+            if fcb._versions:
+                kept = []
+                previous_tag = -1
+                for tag, state in fcb._versions:
+                    if any(previous_tag < epoch <= tag for epoch in epochs):
+                        kept.append((tag, state))
+                    previous_tag = tag
+                fcb._versions = kept or None
+            if fcb.is_directory:
+                stack.extend(fcb.children.values())
+
+    def rollback_snapshot(self, name):
+        # 回滚到快照：删除更新的快照，恢复快照时刻的元数据，释放之后分配的块
+        snapshot = self.find_snapshot(name)
+        if snapshot is None:
+            self.events.warning(
+                "snapshot.rollback", "Snapshot {name} not found.", name=name
+            )
+            return False
+        self.load_all()
+        self.flush_writes()
+        while self.snapshots[-1] is not snapshot:
+            self.delete_snapshot(self.snapshots[-1].name)
+        # 当前活动文件系统中快照之后分配的块都不再被引用
+        newer = set()
+        stack = [self.root]
+        while stack:
+            fcb = stack.pop()
+            if fcb.is_directory:
+                stack.extend(fcb.children.values())
+                continue
+            block = fcb.address
+            while block != -1 and block not in newer:
+                if self.block_birth[block] > snapshot.epoch:
+                    newer.add(block)
+                block = self.fat[block]
+        # 快照死亡列表中的块重新被活动文件系统引用
+        snapshot.deadlist = []
+        stack = [self.root]
+        while stack:
+            fcb = stack.pop()
+            state = state_at(fcb, snapshot.epoch)
+            if state is not None:
+                for field, value in state.items():
+                    if field != "children":
+                        setattr(fcb, field, value)
+                if fcb.is_directory:
+                    fcb.children = DirectoryIndex(state["children"])
+                if "_mod_epoch" not in state:
+                    fcb._mod_epoch = snapshot.epoch  # 旧镜像中的历史版本没有记录
+            if fcb.is_directory:
+                stack.extend(fcb.children.values())
+        self._free_blocks(newer)
+        self.prune_versions()
+        self.current_directory = self.root
+        self.copied_entry = None
+        self.chunk_cache.clear()
+        self.content_cache.clear()
+        self.content_index = None  # 第一次内容搜索时重建
+        self.saved_index = None
+        self._prepare_tree()
+        self.events.info(
+            "snapshot.rollback", "Rolled back to snapshot {name}.", name=name
+        )
+        return True
+
+    def allocate_block(self, directory=None):
+        blocks = self.allocate_blocks(1, directory)
+        return blocks[0] if blocks else -1
+
+    def allocate_blocks(self, count, directory=None):
+        # 由卷的分配策略选出 count 个空闲块并标记为已占用；directory 为文件所在目录
+        if count > self.free_count:
+            self.events.error(
+                "block.allocate", "No free blocks available.", title="Error"
+            )
+            return None
+        blocks = self.allocator.allocate(self.bitmap, count, directory)
+        for block in blocks:
+            self.bitmap[block] = 1
+            self.block_birth[block] = self.epoch
+        self.free_count -= len(blocks)
+        if blocks:
+            # 一次分配的块按顺序链接成一条块链，块图据此记录每个块所属的链
+            self.events.debug(
+                "block.allocate",
+                "Allocated {count} blocks.",
+                count=len(blocks),
+                blocks=blocks,
+            )
+        return blocks
+
+    def set_allocation_policy(self, name):
+        # 只影响之后分配的块，已有文件在下次写入时按新策略重新分配
+        if name not in ALLOCATION_POLICIES:
+            self.events.warning(
+                "volume.allocation", "Unknown allocation policy {name}.", name=name
+            )
+            return False
+        self.allocator = make_allocator(name)
+        self.events.info(
+            "volume.allocation", "Allocation policy set to {name}.", name=name
+        )
+        return True
+
+    def fragmentation(self):
+        # 统计每个文件的块链被分成几段连续区间，以及空闲空间的分段情况
+        self.load_all()
+        self.flush_writes()
+        report = FragmentationReport()
+        for fcb in self.name_index.by_inode.values():
+            if fcb.is_directory or fcb.address == -1:
+                continue
+            extents = 1
+            block = fcb.address
+            while self.fat[block] != -1:
+                if self.fat[block] != block + 1:
+                    extents += 1
+                block = self.fat[block]
+            report.files += 1
+            report.extents += extents
+            if extents > 1:
+                report.fragmented_files += 1
+        for _, length in free_extents(self.bitmap):
+            report.free_extents += 1
+            report.largest_free_extent = max(report.largest_free_extent, length)
+        return report
+
+    def free_block(self, block_num):
+        self._free_blocks([block_num])
+
+    def blocks_needed(self, size):
+        return (size + self.block_size - 1) // self.block_size  # 向上取整
+
+    def _store_payload(self, payload, directory=None):
+        # 分配新块存放数据并链接成块链，同时记录校验和，返回首块号（没有数据时为 -1）
+        count = self.blocks_needed(len(payload))
+        blocks = self.allocate_blocks(count, directory) or []
+        for i, block in enumerate(blocks):
+            start = block * self.block_size
+            data = payload[i * self.block_size : (i + 1) * self.block_size]
+            self.storage[start : start + len(data)] = data
+            if len(data) < self.block_size:
+                # 块的剩余部分清零，保证校验和与内容一致
+                self.storage[start + len(data) : start + self.block_size] = bytes(
+                    self.block_size - len(data)
+                )
+            self.checksums[block] = self.block_checksum(block)
+            self.fat[block] = blocks[i + 1] if i + 1 < len(blocks) else -1
+        return blocks[0] if blocks else -1
+
+    def block_checksum(self, block):
+        start = block * self.block_size
+        return zlib.crc32(self.storage[start : start + self.block_size])
+
+    def verify_block(self, block):
+        return self.block_checksum(block) == self.checksums[block]
+
+    def stored_size(self, fcb):
+        # 文件在块链中实际存储的字节数（压缩文件为压缩后的大小）
+        self.flush_file(fcb)
+        return self._stored_bytes(fcb)
+
+    def _stored_bytes(self, fcb):
+        if fcb.inline_data is not None:
+            return 0
+        if fcb.codec is not None and fcb.chunks:
+            offset, length = fcb.chunks[-1]
+            return offset + length
+        return fcb.size
+
+    def unshare_chain(self, fcb, previous, block):
+        # 为 fcb 复制从 block 开始的（与其他文件共用的）块链，返回新链的首块号；空间不足时返回 None
+        old_blocks = []
+        seen = set()
+        while block != -1 and block not in seen:
+            seen.add(block)
+            old_blocks.append(block)
+            block = self.fat[block]
+        if len(old_blocks) > self.free_count:
+            return None
+        payload = bytearray()
+        for block in old_blocks:
+            payload.extend(
+                self.storage[block * self.block_size : (block + 1) * self.block_size]
+            )
+        head = self._store_payload(payload, fcb.parent)
+        self.chunk_cache.invalidate(fcb.address)
+        if previous == -1:
+            self._preserve(fcb)
+            fcb.address = head
+        else:
+            self.fat[previous] = head
+        return head
+
+    def fsck(self, repair=False, verify_data=False):
+        # 检查位图、FAT 与目录树是否一致，repair 为 True 时修复发现的问题
+        self.load_all()
+        self.flush_writes()
+        report = check_volume(self, repair, verify_data)
+        if report.repairs:
+            # 修复可能改了 inode 或条目名，重建名字索引和用量，内容索引下次搜索时重建
+            self.chunk_cache.clear()
+            self.content_cache.clear()
+            self._prepare_tree()
+            self.content_index = None
+            self.saved_index = None
+        self.events.info("fsck.report", "{summary}", summary=report.summary())
+        return report
+
+    def create_file(self, name, size):
+        if name in self.current_directory.children:
+            self.events.warning(
+                "file.create", "File or directory {name} already exists.", name=name
+            )
+            return
+        if size <= self.inline_threshold:
+            # 小文件直接存放在 FCB 中，不经过位图和 FAT
+            fcb = FileControlBlock(name, False, size)
+            fcb.inline_data = bytes(size)
+            self.attach_entry(self.current_directory, name, fcb)
+            self.events.info("file.create", "File {name} created.", name=name)
+            return
+        num_blocks_needed = (size + self.block_size - 1) // self.block_size  # 向上取整
+
+        # 检查是否有足够的空闲块
+        if self.free_count < num_blocks_needed:
+            self.events.error(
+                "file.create",
+                "Not enough space to create file {name}.",
+                title="Error",
+                name=name,
+            )
+            return
+
+        blocks = self.allocate_blocks(num_blocks_needed, self.current_directory)
+        for i in range(num_blocks_needed - 1):
+            self.fat[blocks[i]] = blocks[i + 1]  # 链接各个块
+        self.fat[blocks[-1]] = -1  # 最后一个块指向 -1 表示结束
+        fcb = FileControlBlock(name, False, size, blocks[0])  # 创建文件控制块
+        self.attach_entry(self.current_directory, name, fcb)  # 加入当前目录
+        self.events.info("file.create", "File {name} created.", name=name)
+
+    def clear_file_data(self, fcb):
+        self.free_chains([fcb])
+
+    def free_chains(self, fcbs):
+        # 一次性释放多个文件的块链：先收集所有块号，再按连续区间批量清零并更新位图和 FAT
+        blocks = set()
+        for fcb in fcbs:
+            self.chunk_cache.invalidate(fcb.address)
+            block = fcb.address
+            while block != -1 and block not in blocks:
+                blocks.add(block)
+                block = self.fat[block]
+        return self._release_blocks(blocks)
+
+    def _release_blocks(self, blocks):
+        # 仍被最新快照引用的块（在快照之前分配）放入该快照的死亡列表，其余立即释放
+        if self.snapshots:
+            latest = self.snapshots[-1]
+            held = [block for block in blocks if self.block_birth[block] <= latest.epoch]
+            latest.deadlist.extend(held)
+            blocks = [block for block in blocks if self.block_birth[block] > latest.epoch]
+        return self._free_blocks(blocks)
+
+    def _free_blocks(self, blocks):
+        blocks = sorted(blocks)
+        self.chunk_cache.invalidate_blocks(blocks)
+        start = 0
+        while start < len(blocks):
+            end = start + 1
+            while end < len(blocks) and blocks[end] == blocks[end - 1] + 1:
+                end += 1
+            first, count = blocks[start], end - start
+            self.free_count += count - self.bitmap.count(0, first, first + count)
+            self.storage[
+                first * self.block_size : (first + count) * self.block_size
+            ] = bytes(count * self.block_size)
+            self.bitmap[first : first + count] = bytes(count)
+            self.fat[first : first + count] = array("i", [-1]) * count
+            self.checksums[first : first + count] = (
+                array("I", [self.zero_checksum]) * count
+            )
+            start = end
+        if blocks:
+            self.events.debug(
+                "block.free", "Freed {count} blocks.", count=len(blocks), blocks=blocks
+            )
+        return len(blocks)
+
+    def delete_file(self, name):
+        if name in self.current_directory.children:
+            fcb = self.current_directory.children[name]
+            if not fcb.is_directory:
+                # 如果复制的文件被删除，则清空剪贴板内容
+                if self.copied_entry and self.copied_entry.inode == fcb.inode:
+                    self.copied_entry = None
+                    self.events.info(
+                        "clipboard.clear",
+                        "Copied content cleared because the file is deleted.",
+                        title="Clipboard Cleared",
+                    )
+
+                self.clear_file_data(fcb)
+                self.detach_entry(self.current_directory, name)
+                self.events.info("file.delete", "File {name} deleted.", name=name)
+            else:
+                self.events.warning("file.delete", "{name} is not a file.", name=name)
+        else:
+            self.events.warning("file.delete", "File {name} not found.", name=name)
+
+    def create_directory(self, name):
+        if name in self.current_directory.children:
+            self.events.warning(
+                "directory.create",
+                "File or directory {name} already exists.",
+                name=name,
+            )
+            return
+        fcb = FileControlBlock(name, True)
+        self.attach_entry(self.current_directory, name, fcb)
+        self.events.info("directory.create", "Directory {name} created.", name=name)
+
+    def delete_directory(self, name):
+        if name in self.current_directory.children:
+            fcb = self.current_directory.children[name]
+            if fcb.is_directory:
+                # 检查剪贴板内容是否在将要删除的目录中
+                if self.copied_entry and self.is_fcb_in_directory(
+                    self.copied_entry, fcb
+                ):
+                    self.copied_entry = None
+                    self.events.info(
+                        "clipboard.clear",
+                        "Copied content cleared because the directory is deleted.",
+                        title="Clipboard Cleared",
+                    )
+
+                self.delete_tree(fcb)
+                self.events.info(
+                    "directory.delete",
+                    "Directory {name} and its contents deleted.",
+                    name=name,
+                )
+            else:
+                self.events.warning(
+                    "directory.delete", "{name} is not a directory.", name=name
+                )
+        else:
+            self.events.warning(
+                "directory.delete", "Directory {name} not found.", name=name
+            )
+
+    def delete_tree(self, fcb):
+        # 非递归地删除整个子树：先摘下子树，再遍历一遍收集所有文件，批量释放数据块
+        self.detach_entry(fcb.parent, fcb.name)
+        files = []
+        stack = [fcb]
+        while stack:
+            entry = stack.pop()
+            if entry.is_directory:
+                stack.extend(entry.children.values())
+            else:
+                files.append(entry)
+        return self.free_chains(files)
+
+    def delete(self, path):
+        # 按路径删除文件或目录
+        fcb = self.find_fcb_by_path(path)
+        if fcb is None or fcb is self.root:
+            self.events.warning(
+                "entry.delete", "{path} not found or cannot be deleted.", path=path
+            )
+            return False
+        if self.copied_entry and (
+            self.copied_entry.inode == fcb.inode
+            or self.is_fcb_in_directory(self.copied_entry, fcb)
+        ):
+            self.copied_entry = None
+            self.events.info(
+                "clipboard.clear", "Copied content cleared because it is deleted."
+            )
+        if self.current_directory is fcb or self.is_fcb_in_directory(
+            self.current_directory, fcb
+        ):
+            self.current_directory = fcb.parent
+        self.delete_tree(fcb)
+        self.events.info("entry.delete", "{path} deleted.", path=path)
+        return True
+
+    def rename(self, path, new_name):
+        # 重命名只修改目录项，不移动数据块
+        fcb = self.find_fcb_by_path(path)
+        if fcb is None:
+            self.events.warning("entry.rename", "{path} not found.", path=path)
+            return False
+        return self.rename_fcb(fcb, new_name)
+
+    def move(self, src, dst_dir, new_name=None):
+        # 把文件或目录移动到另一个目录下，new_name 不为 None 时同时改名；
+        # 只重新链接元数据，不复制数据块，检查全部通过后才修改，失败时不留下中间状态
+        fcb = self.find_fcb_by_path(src)
+        target = self.find_fcb_by_path(dst_dir)
+        if fcb is None or fcb is self.root:
+            self.events.warning(
+                "entry.move", "{src} not found or cannot be moved.", src=src
+            )
+            return False
+        if target is None or not target.is_directory:
+            self.events.warning(
+                "entry.move", "Target directory {dst_dir} not found.", dst_dir=dst_dir
+            )
+            return False
+        if target is fcb or self.is_fcb_in_directory(target, fcb):
+            self.events.warning("entry.move", "Cannot move {src} into itself.", src=src)
+            return False
+        if new_name is not None and not self._check_name("entry.move", new_name):
+            return False
+        name = fcb.name if new_name is None else new_name
+        if fcb.parent is target and name == fcb.name:
+            return True
+        if name in target.children:
+            self.events.warning(
+                "entry.move",
+                "File or directory {name} already exists in {dst_dir}.",
+                name=name,
+                dst_dir=dst_dir,
+            )
+            return False
+        self._preserve(fcb.parent)
+        self._preserve(target)
+        usage = self._entry_usage(fcb)
+        self._adjust_usage(fcb.parent, usage, -1)
+        self._adjust_usage(target, usage)
+        del fcb.parent.children[fcb.name]
+        if name != fcb.name:
+            self._preserve(fcb)
+            old_name = fcb.name
+            fcb.name = name
+            self.name_index.rename(fcb, old_name)
+        target.children[name] = fcb
+        fcb.parent = target
+        self.events.info(
+            "entry.move", "Moved {src} to {dst_dir}.", src=src, dst_dir=dst_dir
+        )
+        return True
+
+    def is_fcb_in_directory(self, fcb, directory):
+        # 判断文件控制块是否在目录中：通过 inode 找到卷中的 FCB，沿父目录向上查找
+        entry = self.name_index.get(fcb.inode)
+        if entry is None:
+            return False
+        entry = entry.parent
+        while entry is not None:
+            if entry is directory:
+                return True
+            entry = entry.parent
+        return False
+
+    def change_directory(self, path):
+        if path == "..":
+            # 回到上一级目录
+            if self.current_directory.name != "root":
+                self.current_directory = self.root
+            else:
+                self.events.warning(
+                    "directory.change", "Already at the root directory."
+                )
+        elif path in self.current_directory.children:
+            # 进入子目录
+            fcb = self.current_directory.children[path]
+            if fcb.is_directory:
+                self.current_directory = fcb
+                self.events.info(
+                    "directory.change", "Changed directory to {path}.", path=path
+                )
+            else:
+                self.events.warning(
+                    "directory.change", "{path} is not a directory.", path=path
+                )
+        else:
+            self.events.warning(
+                "directory.change", "Directory {path} not found.", path=path
+            )
+
+    def open_file(self, path):
+        fcb = self.find_fcb_by_path(path)
+        if fcb and not fcb.is_directory:
+            self._open_fcb(fcb, path)
+        else:
+            self.events.warning(
+                "file.open", "File {path} not found or is a directory.", path=path
+            )
+
+    def close_file(self, path):
+        fcb = self.find_fcb_by_path(path)
+        if fcb and not fcb.is_directory and fcb.is_open:
+            self._close_fcb(fcb, path)
+        else:
+            self.events.warning(
+                "file.close", "File {path} is not open or is a directory.", path=path
+            )
+
+    def _open_fcb(self, fcb, path):
+        fcb.is_open = True
+        self.events.debug("file.open", "File {path} opened.", path=path)
+
+    def _close_fcb(self, fcb, path):
+        fcb.is_open = False
+        self.events.debug("file.close", "File {path} closed.", path=path)
+
+    def buffer_write(self, path, data, compression=None):
+        # 写入先放进写回缓冲，短时间内对同一文件的多次写入只写一次数据块
+        fcb = self.find_fcb_by_path(path)
+        if fcb is None or fcb.is_directory:
+            self.events.warning(
+                "file.write", "File {path} not found or is a directory.", path=path
+            )
+            return False
+        self.write_buffer.put(fcb, data, compression)
+        self.events.debug("file.buffer", "Data buffered for file {path}.", path=path)
+        return True
+
+    def flush_writes(self, due_only=False):
+        # 把写回缓冲中的内容写入数据块；due_only 为 True 时只写已到期的，返回剩余数量
+        inodes = self.write_buffer.due() if due_only else list(self.write_buffer.pending)
+        for inode in inodes:
+            self.flush_file(self.write_buffer.get(inode)[0])
+        return len(self.write_buffer)
+
+    def flush_file(self, fcb):
+        # 读取文件的存储数据前，先写入它在写回缓冲中的内容；已删除的文件直接丢弃
+        entry = self.write_buffer.get(fcb.inode)
+        if entry is None or entry[0] is not fcb:
+            return  # 快照中的副本等其他对象不触发写入
+        self.write_buffer.pop(fcb.inode)
+        if self.name_index.get(fcb.inode) is fcb:
+            _, data, compression, _ = entry
+            self._write_fcb(fcb, self.get_path(fcb), data, compression)
+
+    def write_file(self, path, data, compression=None):
+        fcb = self.find_fcb_by_path(path)
+        if fcb is None:
+            self.events.warning("file.write", "File {path} not found.", path=path)
+            return
+
+        if fcb.is_directory:
+            self.events.warning(
+                "file.write", "{path} is a directory, cannot write to it.", path=path
+            )
+            return
+
+        # 直接写入时，缓冲中更早的内容已被覆盖
+        self.write_buffer.pop(fcb.inode)
+        self._write_fcb(fcb, path, data, compression)
+
+    def _write_fcb(self, fcb, path, data, compression=None):
+        if not fcb.is_open:
+            self._open_fcb(fcb, path)
+
+        self._preserve(fcb)
+        before = self._file_usage(fcb)
+        if compression is not None:
+            # 指定压缩算法时同时更新该文件的压缩设置
+            fcb.compression = compression
+
+        current_size = len(data)
+        if current_size <= self.inline_threshold:
+            # 小文件内联存放；原来占用的数据块全部释放
+            self.clear_file_data(fcb)
+            fcb.address = -1
+            fcb.inline_data = bytes(data)
+            fcb.size = current_size
+            fcb.codec = None
+            fcb.chunks = None
+            fcb.chunk_size = 0
+            fcb.version += 1
+            self._adjust_usage(fcb.parent, self._file_usage(fcb).add(before, -1))
+            self._index_content(fcb)
+            self.events.info("file.write", "Data written to file {path}.", path=path)
+            self._close_fcb(fcb, path)
+            return
+
+        codec = self.resolve_compression(fcb)
+        chunks = None
+        payload = data
+        if codec and current_size > 0:
+            payload, chunks = compress_data(data, codec, self.chunk_size)
+            if len(payload) >= current_size:
+                # 压缩没有收益（如已压缩过的数据），按原样存储
+                codec, chunks, payload = None, None, data
+        else:
+            codec = None
+        stored_size = len(payload)
+        num_blocks_needed = (stored_size + self.block_size - 1) // self.block_size
+
+        # 检查是否有足够的空闲块：原有块中只有快照之后分配的会真正被释放
+        if self.free_count + self._releasable_blocks(fcb) < num_blocks_needed:
+            self.events.error(
+                "file.write",
+                "Not enough space to write to file {path}.",
+                title="Error",
+                path=path,
+            )
+            self._close_fcb(fcb, path)
+            return
+
+        # 清空原有文件数据
+        self.clear_file_data(fcb)
+
+        # 分配新块、链接并写入数据
+        fcb.address = self._store_payload(payload, fcb.parent)
+        fcb.inline_data = None  # 超过阈值的文件转为块存储
+        if fcb.address == -1 and stored_size:
+            # 分配失败时旧数据已释放，退回为空文件，保持元数据与块链一致
+            fcb.size, fcb.codec, fcb.chunks, fcb.chunk_size = 0, None, None, 0
+            fcb.version += 1
+            self._adjust_usage(fcb.parent, self._file_usage(fcb).add(before, -1))
+            self._index_content(fcb)
+            self.events.error(
+                "file.write",
+                "Not enough space to write to file {path}.",
+                title="Error",
+                path=path,
+            )
+            self._close_fcb(fcb, path)
+            return
+        fcb.size = current_size
+        fcb.codec = codec
+        fcb.chunks = chunks
+        fcb.chunk_size = self.chunk_size if codec else 0
+        fcb.version += 1
+        self._adjust_usage(fcb.parent, self._file_usage(fcb).add(before, -1))
+
+        self._index_content(fcb)
+        self.events.info("file.write", "Data written to file {path}.", path=path)
+        self._close_fcb(fcb, path)
+
+    def read_file(self, path, encoding="utf-8", errors="strict"):
+        # 文本读取：在 read_bytes 之上解码，长度只由 fcb.size 决定，内容原样保留
+        fcb = self.find_fcb_by_path(path)
+        if fcb is None:
+            self.events.warning("file.read", "File {path} not found.", path=path)
+            return None
+
+        if fcb.is_directory:
+            self.events.warning(
+                "file.read", "{path} is a directory, cannot read from it.", path=path
+            )
+            return None
+
+        pending = self.write_buffer.get(fcb.inode)
+        cached = (encoding, errors) == ("utf-8", "strict")  # 缓存只保存默认解码的结果
+        if pending is None and cached:
+            # 内容没有变化时直接使用缓存，不再读取块链和解码
+            data_str = self.content_cache.get(fcb.inode, fcb.version)
+            if data_str is not None:
+                self.events.debug(
+                    "file.read", "Data read from file {path} (cached).", path=path
+                )
+                return data_str
+
+        if not fcb.is_open:
+            self._open_fcb(fcb, path)
+
+        try:
+            if pending is not None:
+                # 还在写回缓冲中的内容直接返回，不必先写入数据块
+                data_str = str(pending[1], encoding, errors)
+            else:
+                with self.read_fcb_view(fcb) as view:
+                    data_str = str(view, encoding, errors)
+            if pending is None and cached:
+                self.content_cache.put(fcb.inode, fcb.version, data_str)
+            self.events.debug(
+                "file.read",
+                "Data read from file {path}: {length} characters.",
+                path=path,
+                length=len(data_str),
+            )
+            return data_str
+        except (UnicodeDecodeError, Exception) as e:
+            self.events.error(
+                "file.read",
+                "Error decoding data from file {path}: {error}",
+                path=path,
+                error=e,
+            )
+            return None
+        finally:
+            self._close_fcb(fcb, path)
+
+    def read_bytes(self, path, offset=0, length=None):
+        # 二进制读取，返回 memoryview：连续存放的未压缩数据直接是存储器的切片，不复制；
+        # 视图只在下一次修改卷之前有效，需要保留时用 bytes() 复制，用完后尽早 release()
+        fcb = self.find_fcb_by_path(path)
+        if fcb is None or fcb.is_directory:
+            self.events.warning(
+                "file.read", "File {path} not found or is a directory.", path=path
+            )
+            return None
+        return self.read_fcb_view(fcb, offset, length)
+
+    def readinto(self, path, buffer, offset=0):
+        # 从 offset 开始读入调用者提供的缓冲区（任何可写的缓冲区对象），返回读入的字节数；
+        # 未压缩的数据从存储器直接复制到缓冲区，只复制一次
+        fcb = self.find_fcb_by_path(path)
+        if fcb is None or fcb.is_directory:
+            self.events.warning(
+                "file.read", "File {path} not found or is a directory.", path=path
+            )
+            return None
+        return self.readinto_fcb(fcb, buffer, offset)
+
+    def read_range(self, path, offset, length):
+        # 按逻辑偏移读取文件的一部分，压缩文件只解压涉及到的块
+        fcb = self.find_fcb_by_path(path)
+        if fcb is None or fcb.is_directory:
+            self.events.warning(
+                "file.read", "File {path} not found or is a directory.", path=path
+            )
+            return None
+        return self.read_fcb_range(fcb, offset, length)
+
+    def read_fcb_range(self, fcb, offset, length):
+        with self.read_fcb_view(fcb, offset, length) as view:
+            return bytes(view)
+
+    def read_fcb_view(self, fcb, offset=0, length=None):
+        self.flush_file(fcb)
+        offset = max(0, offset)
+        length = fcb.size - offset if length is None else length
+        length = max(0, min(length, fcb.size - offset))
+        if length == 0:
+            return memoryview(b"")
+        if fcb.inline_data is not None:
+            return memoryview(fcb.inline_data)[offset : offset + length]
+        if fcb.codec is None:
+            extents = self._stored_extents(fcb, offset, length)
+            if len(extents) == 1 and extents[0][1] == length:
+                start = extents[0][0]
+                return memoryview(self.storage)[start : start + length]
+        # 分散在多段或经过压缩的数据读入一个新缓冲区
+        buffer = bytearray(length)
+        count = self.readinto_fcb(fcb, buffer, offset)
+        return memoryview(buffer)[:count]
+
+    def readinto_fcb(self, fcb, buffer, offset=0):
+        self.flush_file(fcb)
+        with memoryview(buffer) as view, view.cast("B") as target:
+            offset = max(0, offset)
+            length = max(0, min(len(target), fcb.size - offset))
+            if length == 0:
+                return 0
+            if fcb.inline_data is not None:
+                target[:length] = memoryview(fcb.inline_data)[offset : offset + length]
+                return length
+            if fcb.codec is None:
+                return self._copy_stored(fcb, offset, length, target)
+
+            position = 0
+            first = offset // fcb.chunk_size
+            last = (offset + length - 1) // fcb.chunk_size
+            for index in range(first, last + 1):
+                chunk = self._load_chunk(fcb, index)
+                chunk_start = index * fcb.chunk_size
+                start = max(offset, chunk_start) - chunk_start
+                end = min(offset + length, chunk_start + len(chunk)) - chunk_start
+                target[position : position + end - start] = memoryview(chunk)[start:end]
+                position += end - start
+            return position
+
+    def _load_chunk(self, fcb, index):
+        key = (fcb.address, index)
+        chunk = self.chunk_cache.get(key)
+        if chunk is None:
+            chunk_offset, chunk_length = fcb.chunks[index]
+            chunk = decompress_chunk(
+                self._read_stored(fcb, chunk_offset, chunk_length), fcb.codec
+            )
+            self.chunk_cache.put(key, chunk)
+        return chunk
+
+    def _stored_extents(self, fcb, offset, length):
+        # 沿块链找出 [offset, offset + length) 在存储器中的位置，相邻的块合并为一段；
+        # 返回 [(存储器偏移, 长度)]，块链提前结束时总长度小于 length
+        extents = []
+        block = fcb.address
+        for _ in range(offset // self.block_size):
+            if block == -1:
+                return extents
+            block = self.fat[block]
+        position = offset % self.block_size
+        remaining = length
+        while block != -1 and remaining > 0:
+            if self.verify_checksums and not self.verify_block(block):
+                raise ChecksumError(f"Checksum mismatch in block {block}.")
+            size = min(self.block_size - position, remaining)
+            start = block * self.block_size + position
+            if extents and sum(extents[-1]) == start:
+                extents[-1] = (extents[-1][0], extents[-1][1] + size)
+            else:
+                extents.append((start, size))
+            remaining -= size
+            position = 0
+            block = self.fat[block]
+        return extents
+
+    def _copy_stored(self, fcb, offset, length, target):
+        # 把实际存储的数据逐段复制到 target，返回复制的字节数
+        position = 0
+        with memoryview(self.storage) as storage:
+            for start, size in self._stored_extents(fcb, offset, length):
+                target[position : position + size] = storage[start : start + size]
+                position += size
+        return position
+
+    def _read_stored(self, fcb, offset, length):
+        # 从文件的块链中读取实际存储的数据（压缩文件即压缩后的字节）
+        data = bytearray(length)
+        with memoryview(data) as target:
+            count = self._copy_stored(fcb, offset, length, target)
+        del data[count:]
+        return data
+
+    def resolve_compression(self, fcb):
+        # 文件设置优先，未设置时使用卷默认设置
+        method = fcb.compression if fcb.compression is not None else self.compression
+        if method in COMPRESSION_METHODS:
+            return method
+        return None
+
+    def set_volume_compression(self, method):
+        if method not in COMPRESSION_METHODS and method not in (None, NO_COMPRESSION):
+            self.events.warning(
+                "volume.compression",
+                "Unknown compression method {method}.",
+                method=method,
+            )
+            return False
+        self.compression = None if method == NO_COMPRESSION else method
+        self.events.info(
+            "volume.compression", "Volume compression set to {method}.", method=method
+        )
+        return True
+
+    def set_file_compression(self, path, method):
+        # 修改单个文件的压缩设置，并按新设置重新存储已有数据
+        fcb = self.find_fcb_by_path(path)
+        if fcb is None or fcb.is_directory:
+            self.events.warning(
+                "file.compression",
+                "File {path} not found or is a directory.",
+                path=path,
+            )
+            return False
+        if method not in COMPRESSION_METHODS and method not in (None, NO_COMPRESSION):
+            self.events.warning(
+                "file.compression",
+                "Unknown compression method {method}.",
+                method=method,
+            )
+            return False
+        data = self.read_fcb_range(fcb, 0, fcb.size)
+        self._preserve(fcb)
+        fcb.compression = method
+        self.write_file(path, data)
+        return True
+
+    def set_inline_threshold(self, threshold):
+        # 只影响之后写入的文件，已有文件在下次写入时按新阈值存放
+        self.inline_threshold = max(0, threshold)
+        self.events.info(
+            "volume.inline",
+            "Inline threshold set to {threshold} bytes.",
+            threshold=self.inline_threshold,
+        )
+
+    def count_blocks(self, fcb):
+        self.flush_file(fcb)
+        count = 0
+        block = fcb.address
+        while block != -1:
+            count += 1
+            block = self.fat[block]
+        return count
+
+    def _releasable_blocks(self, fcb):
+        # 与 _release_blocks 一致：仍被最新快照引用的块不会被释放
+        latest = self.snapshots[-1].epoch if self.snapshots else -1
+        count = 0
+        block = fcb.address
+        while block != -1:
+            if self.block_birth[block] > latest:
+                count += 1
+            block = self.fat[block]
+        return count
+
+    def physical_size(self, fcb):
+        # 文件实际占用的磁盘空间（整块计算）
+        return self.count_blocks(fcb) * self.block_size
+
+    def list_directory(self, path=None, page_size=100, pattern=None, cursor=None):
+        # 返回目录的惰性分页迭代器，调用方按需调用 next_page() 逐页获取
+        directory = self.current_directory
+        if path is not None:
+            directory = self.find_fcb_by_path(path)
+        if directory is None or not directory.is_directory:
+            self.events.warning(
+                "directory.list", "Directory {path} not found.", path=path
+            )
+            return None
+        return self.list_directory_fcb(directory, page_size, pattern, cursor)
+
+    def list_directory_fcb(self, directory, page_size=100, pattern=None, cursor=None):
+        return DirectoryPager(directory.children, page_size, pattern, cursor)
+
+    def copy_entry(self, name):
+        fcb = self.find_fcb_by_path(name)
+        if fcb is None:
+            self.events.warning("clipboard.copy", "{name} not found.", name=name)
+            return
+
+        if fcb.is_directory:
+            self.events.error(
+                "clipboard.copy",
+                "Cannot copy a directory. Only files can be copied.",
+                title="Copy Error",
+            )
+            return
+
+        self.flush_file(fcb)
+        self.copied_entry = copy.deepcopy(fcb)
+        self.copied_payload = bytes(self._read_stored(fcb, 0, self.stored_size(fcb)))
+        self.events.info("clipboard.copy", "Copied {name}.", name=name)
+
+    def find_fcb_by_path(self, path):
+        # 解析路径，找到文件控制块
+        path_parts = path.strip("/").split("/")
+        fcb = self.root if path_parts[0] == "root" else self.current_directory
+        if path_parts[0] == "root":
+            fcb = self.root
+            path_parts.pop(0)
+        for part in path_parts:
+            if fcb.is_directory and part in fcb.children:
+                # 进入子目录
+                fcb = fcb.children[part]
+            else:
+                return None
+        return fcb
+
+    def paste_entry(self, target_dir_name=None):
+        if not self.copied_entry:
+            self.events.error(
+                "clipboard.paste",
+                "There is nothing to paste. Please copy a file or directory first.",
+                title="Paste Error",
+            )
+            return
+
+        target_dir = self.current_directory
+        if target_dir_name:
+            target_dir = self.current_directory.children.get(
+                target_dir_name, self.current_directory
+            )  # 目标目录可能不存在，则使用当前目录
+
+        if target_dir is None or not target_dir.is_directory:
+            self.events.error(
+                "clipboard.paste",
+                "The target directory is invalid or not a directory.",
+                title="Paste Error",
+            )
+            return
+
+        new_name = self.copied_entry.name
+        base_name = new_name
+        count = 1
+        while new_name in target_dir.children:
+            # 重命名文件，使其不与已有文件重名
+            new_name = f"{base_name}({count})"
+            count += 1
+
+        new_entry = self.paste_as(target_dir, new_name)
+        if new_entry is None:
+            return
+        if new_entry.is_directory:
+            # 复制目录时，递归复制其所有子目录和文件
+            self._update_fcb_references(new_entry, target_dir)
+        self.events.info("clipboard.paste", "Pasted {new_name}.", new_name=new_name)
+
+    def _update_fcb_references(self, fcb, parent):
+        # 更新文件控制块的父目录引用
+        for name, child in fcb.children.items():
+            if child.is_directory:
+                self._update_fcb_references(child, fcb)
+            else:
+                self._preserve(parent)
+                parent.children[name] = child
@@ -0,0 +1,82 @@
+import time
+
+from directory_index import DirectoryIndex
+
+# 快照需要记录的 FCB 字段，目录另外记录 children
+SNAPSHOT_FIELDS = (
+    "name",
+    "size",
+    "address",
+    "compression",
+    "codec",
+    "chunks",
+    "chunk_size",
+    "inline_data",
+)
+
+
+def capture_state(fcb):
+    state = {field: getattr(fcb, field) for field in SNAPSHOT_FIELDS}
+    state["_mod_epoch"] = fcb._mod_epoch  # 回滚时恢复，保证更早的快照继续受写时复制保护
+    if fcb.is_directory:
+        state["children"] = dict(fcb.children.items())
+    return state
+
+
+def state_at(fcb, epoch):
+    # 找到 FCB 在某个快照时刻的状态：第一个标记 >= epoch 的历史版本，没有则为当前状态
+    for tag, state in fcb._versions or ():
+        if tag >= epoch:
+            return state
+    return None
+
+
+class Snapshot:
+    def __init__(self, name, epoch):
+        self.name = name
+        self.epoch = epoch  # 快照对应的时刻
+        self.created = time.time()
+        # 在本快照之后、下一个快照之前被活动文件系统释放的块，仍被本快照引用
+        self.deadlist = []
+
+
+class SnapshotView:
+    # 快照的只读视图：按快照时刻解析每个 FCB 的状态
+    def __init__(self, fs, snapshot):
+        self.fs = fs
+        self.snapshot = snapshot
+        self.root = self.entry(fs.root)
+
+    def entry(self, fcb):
+        # 返回一个脱离目录树的 FCB 副本，字段为快照时刻的值
+        state = state_at(fcb, self.snapshot.epoch) or capture_state(fcb)
+        frozen = fcb.__class__(state["name"], fcb.is_directory)
+        for field in SNAPSHOT_FIELDS:
+            setattr(frozen, field, state[field])
+        frozen.inode = fcb.inode
+        if fcb.is_directory:
+            frozen.children = DirectoryIndex(state["children"])
+        return frozen
+
+    def find(self, path):
+        parts = [part for part in path.strip("/").split("/") if part]
+        if parts and parts[0] == "root":
+            parts.pop(0)
+        entry = self.root
+        for part in parts:
+            if not entry.is_directory or part not in entry.children:
+                return None
+            entry = self.entry(entry.children[part])
+        return entry
+
+    def list_directory(self, path="/root"):
+        directory = self.find(path)
+        if directory is None or not directory.is_directory:
+            return None
+        return [self.entry(child) for child in directory.children.values()]
+
+    def read_file(self, path):
+        entry = self.find(path)
+        if entry is None or entry.is_directory:
+            return None
+        return self.fs.read_fcb_range(entry, 0, entry.size)
@@ -0,0 +1,378 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import zlib
+from array import array
+
+from image import ImageReader, is_image
+
+# 差异同步：把镜像按结构切成单元（每条目录记录、数据区的每个块、块表的每一段），
+# 对每个单元求摘要。副本把自己镜像的清单发给源端，源端只把副本没有的单元写进差异文件，
+# 副本据此从旧镜像中复制未变的单元、写入新单元，得到与源端逐字节相同的镜像
+MANIFEST_MAGIC = b"TJFSMAN1"
+DELTA_MAGIC = b"TJFSDLT1"
+HEADER_LENGTH = struct.Struct("<I")
+TRAILER = struct.Struct("<Q")  # 差异文件头（写在末尾）的偏移
+DIGEST_SIZE = 16  # 单元摘要（BLAKE2b）的字节数
+TABLE_SEGMENT = 4096  # 块表按此大小分段比较
+# 差异操作：COPY (旧镜像偏移, 长度) | DATA (原始长度, 压缩后长度) + 数据 | ZERO (长度, 0)
+OPERATION = struct.Struct("<BQQ")
+COPY, DATA, ZERO = range(3)
+DATA_RUN = 1024 * 1024  # 连续的新数据攒够此长度后压缩写出
+
+
+def digest(data):
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+def image_units(reader, size):
+    # 依次产生覆盖整个镜像文件的单元 (偏移, 长度)：目录记录各自一个单元，
+    # 数据区按块、其余块表按段切分，区域之间的对齐填充、文件头和超级块各为一个单元
+    table = reader.table
+    spans = [
+        (table["record_offset"][i], table["record_length"][i], 0)
+        for i in range(len(table["record_inode"]))
+    ]
+    if reader.superblock.get("history") is not None:
+        spans.append((*reader.superblock["history"], 0))
+    block_size = reader.superblock["block_size"]
+    for name, (offset, length) in reader.superblock["regions"].items():
+        piece = block_size if name == "storage" else TABLE_SEGMENT
+        spans.append((offset, length, piece))
+    spans.sort()
+    position = 0
+    for offset, length, piece in spans:
+        if offset > position:
+            yield position, offset - position
+        piece = piece or length
+        for start in range(offset, offset + length, piece):
+            yield start, min(piece, offset + length - start)
+        position = max(position, offset + length)
+    if position < size:
+        yield position, size - position
+
+
+class Manifest:
+    # 一个镜像的清单：镜像编号、大小、整个文件的摘要，以及按顺序排列的各单元的摘要和长度
+    def __init__(self, image_id, size, image_digest, hashes, lengths):
+        self.image_id = image_id
+        self.size = size
+        self.image_digest = image_digest
+        self.hashes = hashes  # 各单元摘要依次拼接
+        self.lengths = lengths  # array("I")
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def units(self):
+        # 依次产生 (摘要, 偏移, 长度)
+        offset = 0
+        for number, length in enumerate(self.lengths):
+            yield self.digest_at(number), offset, length
+            offset += length
+
+    def digest_at(self, number):
+        return self.hashes[number * DIGEST_SIZE : (number + 1) * DIGEST_SIZE]
+
+    def index(self):
+        # 摘要 -> 镜像中第一个内容为此摘要的单元 (偏移, 长度, 序号)
+        index = {}
+        for number, (key, offset, length) in enumerate(self.units()):
+            index.setdefault(key, (offset, length, number))
+        return index
+
+    def write(self, filename):
+        header = json.dumps(
+            {
+                "image_id": self.image_id,
+                "size": self.size,
+                "digest": self.image_digest.hex(),
+                "units": len(self.lengths),
+            }
+        ).encode("utf-8")
+        # 空闲块的摘要全部相同，压缩后清单的大小主要取决于已用块数
+        body = zlib.compress(self.lengths.tobytes() + self.hashes)
+        with open(filename, "wb") as f:
+            f.write(MANIFEST_MAGIC + HEADER_LENGTH.pack(len(header)) + header + body)
+
+
+def build_manifest(filename):
+    reader = ImageReader()
+    superblock = reader.open(filename)
+    try:
+        size = os.path.getsize(filename)
+        whole = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        hashes = bytearray()
+        lengths = array("I")
+        with open(filename, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mapped, memoryview(mapped) as data:
+            for offset, length in image_units(reader, size):
+                with data[offset : offset + length] as unit:
+                    whole.update(unit)
+                    hashes += digest(unit)
+                lengths.append(length)
+        return Manifest(
+            superblock.get("image_id"), size, whole.digest(), bytes(hashes), lengths
+        )
+    finally:
+        reader.close()
+
+
+def read_manifest(filename):
+    with open(filename, "rb") as f:
+        if f.read(len(MANIFEST_MAGIC)) != MANIFEST_MAGIC:
+            raise ValueError(f"{filename} is not a manifest")
+        (length,) = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+        header = json.loads(f.read(length))
+        body = zlib.decompress(f.read())
+    split = header["units"] * 4
+    lengths = array("I")
+    lengths.frombytes(body[:split])
+    return Manifest(
+        header["image_id"],
+        header["size"],
+        bytes.fromhex(header["digest"]),
+        body[split:],
+        lengths,
+    )
+
+
+def load_manifest(filename):
+    # 参数可以是镜像，也可以是之前保存的清单
+    return build_manifest(filename) if is_image(filename) else read_manifest(filename)
+
+
+class DeltaReport:
+    def __init__(self):
+        self.units = 0
+        self.changed_units = 0
+        self.copied = 0  # 从旧镜像复制的字节数
+        self.literal = 0  # 写入差异文件的新数据字节数（压缩前）
+        self.zero = 0
+        self.delta_size = 0
+        self.image_size = 0
+
+    def summary(self):
+        return (
+            f"{self.changed_units} of {self.units} units changed; "
+            f"{self.copied} bytes copied, {self.literal} bytes sent, "
+            f"{self.zero} zero bytes; delta is {self.delta_size} bytes "
+            f"for a {self.image_size}-byte image."
+        )
+
+
+class DeltaWriter:
+    # 写差异文件：相邻的复制操作在旧镜像中连续时合并，连续的新数据合并后压缩
+    def __init__(self, f, base, block_size):
+        self.f = f
+        self.base = base
+        self.index = base.index()
+        self.zero_digests = {n: digest(bytes(n)) for n in (block_size, TABLE_SEGMENT)}
+        self.following = None  # 上一个单元复制自旧镜像的单元 (偏移, 序号)，优先匹配其后一个
+        self.report = DeltaReport()
+        self.copy = None  # 尚未写出的复制操作 [偏移, 长度]
+        self.data = bytearray()
+        self.zero = 0
+
+    def add(self, unit):
+        # 按摘要决定新镜像中的一个单元如何得到：全零、从旧镜像复制或作为新数据写出
+        key = digest(unit)
+        length = len(unit)
+        report = self.report
+        report.units += 1
+        if self.zero_digests.get(length) == key:
+            # 空闲块等全零的单元不必从旧镜像复制
+            self.add_zero(length)
+            report.zero += length
+            self.following = None
+            return
+        match = self.index.get(key)
+        following = self.following
+        if following is not None and self.base.digest_at(following[1]) == key:
+            match = (following[0], self.base.lengths[following[1]], following[1])
+        if match is None or match[1] != length:
+            self.add_data(unit)
+            report.changed_units += 1
+            report.literal += length
+            self.following = None
+            return
+        self.add_copy(match[0], length)
+        report.copied += length
+        self.following = None
+        if match[2] + 1 < len(self.base):
+            self.following = (match[0] + length, match[2] + 1)
+
+    def add_copy(self, offset, length):
+        if self.copy is not None and sum(self.copy) == offset:
+            self.copy[1] += length
+            return
+        self.flush()
+        self.copy = [offset, length]
+
+    def add_data(self, data):
+        if self.copy is not None or self.zero:
+            self.flush()
+        self.data += data
+        if len(self.data) >= DATA_RUN:
+            self.flush()
+
+    def add_zero(self, length):
+        if self.copy is not None or self.data:
+            self.flush()
+        self.zero += length
+
+    def flush(self):
+        if self.copy is not None:
+            self.f.write(OPERATION.pack(COPY, *self.copy))
+            self.copy = None
+        if self.data:
+            packed = zlib.compress(self.data, 1)
+            self.f.write(OPERATION.pack(DATA, len(self.data), len(packed)))
+            self.f.write(packed)
+            self.data = bytearray()
+        if self.zero:
+            self.f.write(OPERATION.pack(ZERO, self.zero, 0))
+            self.zero = 0
+
+
+def make_delta(filename, base, delta_filename):
+    # 生成把 base（副本镜像的清单）更新为镜像 filename 的差异文件，返回 DeltaReport
+    reader = ImageReader()
+    superblock = reader.open(filename)
+    try:
+        size = os.path.getsize(filename)
+        whole = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        with open(filename, "rb") as source, mmap.mmap(
+            source.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mapped, memoryview(mapped) as data, open(delta_filename, "wb") as f:
+            f.write(DELTA_MAGIC + TRAILER.pack(0))
+            writer = DeltaWriter(f, base, superblock["block_size"])
+            for offset, length in image_units(reader, size):
+                with data[offset : offset + length] as unit:
+                    whole.update(unit)
+                    writer.add(unit)
+            writer.flush()
+            # 文件头写在末尾，生成前不知道整个镜像的摘要
+            header = json.dumps(
+                {
+                    "base_id": base.image_id,
+                    "base_size": base.size,
+                    "image_id": superblock.get("image_id"),
+                    "size": size,
+                    "digest": whole.hexdigest(),
+                }
+            ).encode("utf-8")
+            trailer = f.tell()
+            f.write(header)
+            f.seek(len(DELTA_MAGIC))
+            f.write(TRAILER.pack(trailer))
+    finally:
+        reader.close()
+    report = writer.report
+    report.image_size = size
+    report.delta_size = os.path.getsize(delta_filename)
+    return report
+
+
+def read_delta_header(f):
+    if f.read(len(DELTA_MAGIC)) != DELTA_MAGIC:
+        raise ValueError(f"{f.name} is not a delta file")
+    (trailer,) = TRAILER.unpack(f.read(TRAILER.size))
+    start = f.tell()
+    f.seek(trailer)
+    header = json.loads(f.read())
+    f.seek(start)
+    return header, trailer
+
+
+def read_operation(delta, base):
+    # 执行一条差异操作，分段产生结果镜像中对应的数据
+    kind, first, second = OPERATION.unpack(delta.read(OPERATION.size))
+    if kind == DATA:
+        yield zlib.decompress(delta.read(second))
+        return
+    if kind == ZERO:
+        for start in range(0, first, DATA_RUN):
+            yield bytes(min(DATA_RUN, first - start))
+        return
+    base.seek(first)
+    remaining = second
+    while remaining:
+        data = base.read(min(DATA_RUN, remaining))
+        if not data:
+            raise ValueError(f"{base.name} is truncated")
+        remaining -= len(data)
+        yield data
+
+
+def apply_delta(base_filename, delta_filename, output=None):
+    # 把差异文件应用到副本镜像 base_filename 上；output 为 None 时原地替换。
+    # 旧镜像与生成差异时的不一致，或结果的摘要不符时抛出 ValueError，原镜像保持不变
+    target = output or base_filename
+    temp = target + ".sync"
+    reader = ImageReader()
+    base_id = reader.open(base_filename).get("image_id")
+    reader.close()
+    whole = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    with open(delta_filename, "rb") as delta, open(base_filename, "rb") as base:
+        header, trailer = read_delta_header(delta)
+        if base_id != header["base_id"] or (
+            os.path.getsize(base_filename) != header["base_size"]
+        ):
+            raise ValueError(f"{delta_filename} was not made for {base_filename}")
+        try:
+            with open(temp, "wb") as f:
+                while delta.tell() < trailer:
+                    for data in read_operation(delta, base):
+                        whole.update(data)
+                        f.write(data)
+            if whole.hexdigest() != header["digest"]:
+                raise ValueError(f"{delta_filename} produced a different image")
+        except Exception:
+            os.remove(temp)
+            raise
+    os.replace(temp, target)
+    return header
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synchronize volume images by delta.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    manifest = commands.add_parser("manifest", help="write the manifest of an image")
+    manifest.add_argument("image")
+    manifest.add_argument("-o", "--output", required=True)
+    diff = commands.add_parser(
+        "diff", help="write a delta that brings BASE up to date with IMAGE"
+    )
+    diff.add_argument("image")
+    diff.add_argument("base", help="the replica's image or manifest")
+    diff.add_argument("-o", "--output", required=True)
+    apply = commands.add_parser("apply", help="apply a delta to a replica image")
+    apply.add_argument("base")
+    apply.add_argument("delta")
+    apply.add_argument("-o", "--output", help="write here instead of replacing BASE")
+    args = parser.parse_args()
+
+    if args.command == "manifest":
+        result = build_manifest(args.image)
+        result.write(args.output)
+        print(
+            f"{len(result)} units, manifest is {os.path.getsize(args.output)} bytes "
+            f"for a {result.size}-byte image."
+        )
+    elif args.command == "diff":
+        print(make_delta(args.image, load_manifest(args.base), args.output).summary())
+    else:
+        try:
+            header = apply_delta(args.base, args.delta, args.output)
+        except ValueError as e:
+            parser.exit(1, f"{e}\n")
+        print(f"{args.output or args.base} updated to image {header['image_id']}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+import argparse
+import inspect
+import json
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+from events import WARNING
+from simple_file_system import FileSystem
+
+# 操作轨迹文件：魔数 | 文件头长度 | JSON 文件头（卷参数）| 记录...
+# 每条记录为定长部分加 JSON 参数；写入的数据只记录长度，回放时生成同样长度的数据
+TRACE_MAGIC = b"TJFSTRC1"
+HEADER_LENGTH = struct.Struct("<I")
+# 记录：操作编号, 开始时间（相对轨迹开始，秒）, 耗时, 数据大小, 参数长度
+RECORD = struct.Struct("<BdfqH")
+# "cwd" 不是引擎方法：当前目录变化时插入一条，回放时先切换到该目录；
+# 新的操作只能加在末尾，操作编号是在元组中的位置
+TRACED_OPS = (
+    "cwd",
+    "create_file",
+    "create_directory",
+    "write_file",
+    "buffer_write",
+    "flush_writes",
+    "read_file",
+    "read_range",
+    "delete_file",
+    "delete_directory",
+    "delete",
+    "rename",
+    "move",
+    "copy_entry",
+    "paste_entry",
+    "change_directory",
+    "create_snapshot",
+    "save_to_disk",
+    "paste_as",
+    "rename_fcb",
+    "read_fcb_range",
+    "find_entries",
+)
+OP_CODES = {name: code for code, name in enumerate(TRACED_OPS)}
+DATA_ARGS = {"write_file": 1, "buffer_write": 1}  # 数据参数的位置，不写入轨迹
+# 参数中的路径，多路并发回放时以 root 开头的绝对路径改写到各自的子目录
+PATH_ARGS = {
+    "cwd": (0,),
+    "write_file": (0,),
+    "buffer_write": (0,),
+    "read_file": (0,),
+    "read_range": (0,),
+    "delete": (0,),
+    "rename": (0,),
+    "move": (0, 1),
+    "copy_entry": (0,),
+    "paste_as": (0,),
+    "rename_fcb": (0,),
+    "read_fcb_range": (0,),
+}
+# 界面直接传 FCB 的参数：调用前记录为路径，回放时再按路径找回 FCB
+FCB_ARGS = {"paste_as": (0,), "rename_fcb": (0,), "read_fcb_range": (0,)}
+SKIP_IDLE = {"flush_writes"}  # 写回缓冲为空时不记录（界面定时调用）
+REPLAY_TEXT = b"The quick brown fox jumps over the lazy dog. "  # 回放时写入的数据
+
+
+class TraceRecord:
+    __slots__ = ("op", "start", "duration", "size", "args")
+
+    def __init__(self, op, start, duration, size, args):
+        self.op = op
+        self.start = start
+        self.duration = duration
+        self.size = size
+        self.args = args
+
+
+class TraceRecorder:
+    # 记录引擎调用：attach() 用计时包装替换实例上的方法，detach() 恢复；
+    # 只记录最外层调用，引擎内部互相调用（如 paste_entry 调用 paste_as）不重复记录
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = None
+        self.fs = None
+        self.depth = 0
+        self.cwd = None
+        self.origin = 0.0
+        self.count = 0
+
+    def attach(self, fs):
+        self.fs = fs
+        self.file = open(self.filename, "wb")
+        header = json.dumps(
+            {"size": fs.size, "block_size": fs.block_size, "created": time.time()}
+        ).encode("utf-8")
+        self.file.write(TRACE_MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+        self.origin = time.perf_counter()
+        for name in TRACED_OPS[1:]:
+            setattr(fs, name, self.wrap(name, getattr(fs, name)))
+
+    def detach(self):
+        if self.fs is None:
+            return
+        for name in TRACED_OPS[1:]:
+            self.fs.__dict__.pop(name, None)
+        self.file.close()
+        self.fs = None
+        self.file = None
+
+    def wrap(self, name, method):
+        signature = inspect.signature(method)
+
+        def traced(*args, **kwargs):
+            if self.depth or name in SKIP_IDLE and not len(self.fs.write_buffer):
+                return method(*args, **kwargs)
+            cwd = self.fs.get_path(self.fs.current_directory)
+            # 在调用之前取参数，改名等操作之后 FCB 的路径会变化
+            arguments = list(signature.bind(*args, **kwargs).arguments.values())
+            for index in FCB_ARGS.get(name, ()):
+                arguments[index] = self.fs.get_path(arguments[index])
+            self.depth += 1
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                self.depth -= 1
+            duration = time.perf_counter() - start
+            self.record(name, start, duration, arguments, result, cwd)
+            return result
+
+        return traced
+
+    def record(self, name, start, duration, arguments, result, cwd):
+        if cwd != self.cwd:
+            self.cwd = cwd
+            self.write("cwd", start, 0.0, 0, [cwd])
+        size = 0
+        if name in DATA_ARGS:
+            index = DATA_ARGS[name]
+            size = len(arguments[index])
+            arguments[index] = None
+        elif isinstance(result, (str, bytes)):
+            size = len(result)
+        self.write(name, start, duration, size, arguments)
+
+    def write(self, name, start, duration, size, arguments):
+        args = json.dumps(arguments, separators=(",", ":")).encode("utf-8")
+        self.file.write(
+            RECORD.pack(OP_CODES[name], start - self.origin, duration, size, len(args))
+        )
+        self.file.write(args)
+        self.count += 1
+
+
+def read_trace(filename):
+    # 返回 (文件头, 记录列表)
+    with open(filename, "rb") as f:
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"{filename} is not a trace file")
+        (length,) = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+        header = json.loads(f.read(length))
+        records = []
+        while True:
+            fixed = f.read(RECORD.size)
+            if len(fixed) < RECORD.size:
+                break  # 末尾不完整的记录（录制时中断）直接忽略
+            code, start, duration, size, length = RECORD.unpack(fixed)
+            args = f.read(length)
+            if len(args) < length:
+                break
+            records.append(
+                TraceRecord(TRACED_OPS[code], start, duration, size, json.loads(args))
+            )
+    return header, records
+
+
+class LatencyReport:
+    # 按操作统计延迟（秒），summary() 给出次数、平均值和分位数（毫秒）
+    def __init__(self):
+        self.samples = {}
+        self.failures = 0  # 回放时引擎报告警告或错误的操作数
+        self.elapsed = 0.0
+
+    def add(self, op, seconds):
+        self.samples.setdefault(op, []).append(seconds)
+
+    @property
+    def operations(self):
+        return sum(len(samples) for samples in self.samples.values())
+
+    def summary(self):
+        lines = [
+            f"{'operation':<18} {'count':>7} {'mean':>9} {'p50':>9} "
+            f"{'p95':>9} {'p99':>9} {'max':>9}  (ms)"
+        ]
+        for op, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+
+            def percentile(p):
+                return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+            mean = sum(ordered) / len(ordered) * 1000
+            lines.append(
+                f"{op:<18} {len(ordered):>7} {mean:>9.3f} {percentile(0.5):>9.3f} "
+                f"{percentile(0.95):>9.3f} {percentile(0.99):>9.3f} "
+                f"{ordered[-1] * 1000:>9.3f}"
+            )
+        if self.elapsed:
+            rate = self.operations / self.elapsed
+            lines.append(
+                f"{self.operations} operations in {self.elapsed:.3f}s "
+                f"({rate:.0f} ops/s), {self.failures} failed."
+            )
+        return "\n".join(lines)
+
+
+def recorded_latency(records):
+    # 轨迹中记录的原始延迟，用于与回放结果对比
+    report = LatencyReport()
+    for record in records:
+        if record.op != "cwd":
+            report.add(record.op, record.duration)
+    return report
+
+
+def replay(fs, records, speed=None, concurrency=1, save_path=None):
+    # 在 fs 上回放轨迹。speed 为 None 时全速执行，否则按原始时间间隔除以 speed 等待；
+    # concurrency 大于 1 时每个线程在 /root/replay-N 下各回放一份，引擎调用串行执行，
+    # 延迟包含等待其他线程的时间。save_to_disk 改为保存到 save_path（默认临时目录）
+    report = LatencyReport()
+
+    def count_failure(event):
+        report.failures += 1
+
+    fs.events.subscribe(count_failure, WARNING)
+    temp_dir = None
+    if save_path is None:
+        temp_dir = tempfile.mkdtemp()
+        save_path = os.path.join(temp_dir, "replay.dat")
+    lock = threading.Lock()
+    workers = []
+    for index in range(concurrency):
+        prefix = None
+        if concurrency > 1:
+            prefix = f"replay-{index}"
+            fs.current_directory = fs.root
+            fs.create_directory(prefix)
+        workers.append(
+            threading.Thread(
+                target=replay_worker,
+                args=(fs, records, report, lock, prefix, speed, save_path),
+            )
+        )
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    report.elapsed = time.perf_counter() - started
+    fs.current_directory = fs.root
+    fs.events.unsubscribe(count_failure)
+    if temp_dir is not None:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return report
+
+
+def rewrite_path(path, prefix):
+    parts = path.strip("/").split("/")
+    if prefix is None or parts[0] != "root":
+        return path
+    return "/".join(["/root", prefix] + [part for part in parts[1:] if part])
+
+
+def replay_worker(fs, records, report, lock, prefix, speed, save_path):
+    home = fs.root if prefix is None else fs.root.children[prefix]
+    cwd = home
+    origin = time.perf_counter()
+    for record in records:
+        if speed:
+            delay = origin + record.start / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        args = list(record.args)
+        for index in PATH_ARGS.get(record.op, ()):
+            if isinstance(args[index], str):
+                args[index] = rewrite_path(args[index], prefix)
+        if record.op in DATA_ARGS:
+            repeat = record.size // len(REPLAY_TEXT) + 1
+            args[DATA_ARGS[record.op]] = (REPLAY_TEXT * repeat)[: record.size]
+        elif record.op == "save_to_disk":
+            args = [save_path]
+        start = time.perf_counter()
+        with lock:
+            if record.op == "cwd":
+                cwd = fs.find_fcb_by_path(args[0]) or home
+                continue
+            fs.current_directory = cwd
+            missing = None
+            for index in FCB_ARGS.get(record.op, ()):
+                fcb = fs.find_fcb_by_path(args[index])
+                if fcb is None:
+                    missing = args[index]
+                args[index] = fcb
+            if missing is not None:
+                # 录制时存在的项目在回放中不存在（之前的操作失败），记为失败
+                fs.events.warning("trace.replay", "{path} not found.", path=missing)
+            elif record.op == "change_directory" and args[0] == "..":
+                # 引擎的 ".." 回到根目录，并发回放时回到各自的根
+                fs.current_directory = home
+            else:
+                getattr(fs, record.op)(*args)
+            cwd = fs.current_directory
+        report.add(record.op, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or replay operation traces.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    show = commands.add_parser("show", help="print the latencies recorded in a trace")
+    show.add_argument("trace")
+    run = commands.add_parser("replay", help="replay a trace and report latencies")
+    run.add_argument("trace")
+    run.add_argument("--image", help="replay against a copy of this image")
+    run.add_argument("--speed", type=float, help="replay at SPEED x recorded pace")
+    run.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    header, records = read_trace(args.trace)
+    if args.command == "show":
+        print(recorded_latency(records).summary())
+        return
+    fs = FileSystem(header["size"], header["block_size"])
+    temp_dir = tempfile.mkdtemp()
+    try:
+        if args.image:
+            # 在镜像的副本上回放，原镜像不会被修改
+            copy = os.path.join(temp_dir, "image.dat")
+            shutil.copyfile(args.image, copy)
+            if not fs.load_from_disk(copy):
+                parser.exit(1, f"Cannot load {args.image}.\n")
+        else:
+            fs.format()
+        save_path = os.path.join(temp_dir, "replay.dat")
+        report = replay(fs, records, args.speed, args.concurrency, save_path)
+        fs.image.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+class Usage:
+    # 目录子树的汇总（不含目录自身）：文件数、子目录数、逻辑字节数、占用的块数
+    # 由创建、写入、删除、粘贴和移动沿父目录链增量更新，查询时无需遍历子树
+    __slots__ = ("files", "directories", "bytes", "blocks")
+
+    def __init__(self, files=0, directories=0, bytes=0, blocks=0):
+        self.files = files
+        self.directories = directories
+        self.bytes = bytes
+        self.blocks = blocks
+
+    def __getstate__(self):
+        return (self.files, self.directories, self.bytes, self.blocks)
+
+    def __setstate__(self, state):
+        self.files, self.directories, self.bytes, self.blocks = state
+
+    def __eq__(self, other):
+        return isinstance(other, Usage) and self.__getstate__() == other.__getstate__()
+
+    def __repr__(self):
+        return (
+            f"Usage(files={self.files}, directories={self.directories}, "
+            f"bytes={self.bytes}, blocks={self.blocks})"
+        )
+
+    def copy(self):
+        return Usage(*self.__getstate__())
+
+    def add(self, other, sign=1):
+        self.files += sign * other.files
+        self.directories += sign * other.directories
+        self.bytes += sign * other.bytes
+        self.blocks += sign * other.blocks
+        return self
+
+
+def compute_usage(directory, file_usage, reuse=True):
+    # 非递归地后序遍历，计算并保存子树中各目录的汇总；reuse 为 True 时直接使用已有的汇总
+    stack = [(directory, False)]
+    while stack:
+        fcb, done = stack.pop()
+        if not done:
+            if reuse and fcb.usage is not None:
+                continue
+            stack.append((fcb, True))
+            stack.extend(
+                (child, False) for child in fcb.children.values() if child.is_directory
+            )
+            continue
+        usage = Usage()
+        for child in fcb.children.values():
+            if child.is_directory:
+                usage.add(child.usage)
+                usage.directories += 1
+            else:
+                usage.add(file_usage(child))
+        fcb.usage = usage
+    return directory.usage
+
+
+class VolumeUsage:
+    # 整个卷的空间使用情况（df）：目录树中的文件只占已用块的一部分，其余被快照或回收队列占用
+    def __init__(self, fs, usage):
+        self.block_size = fs.block_size
+        self.total_blocks = fs.num_blocks
+        self.free_blocks = fs.free_count
+        self.used_blocks = fs.num_blocks - fs.free_count
+        self.files = usage.files
+        self.directories = usage.directories
+        self.bytes = usage.bytes
+        self.file_blocks = usage.blocks
+        self.held_blocks = self.used_blocks - usage.blocks
+
+    def summary(self):
+        percent = self.used_blocks * 100 // max(1, self.total_blocks)
+        return (
+            f"{self.total_blocks} blocks of {self.block_size} bytes, "
+            f"{self.used_blocks} used ({percent}%), {self.free_blocks} free.\n"
+            f"{self.files} files and {self.directories} directories, "
+            f"{self.bytes} bytes in {self.file_blocks} blocks; "
+            f"{self.held_blocks} blocks held by snapshots."
+        )